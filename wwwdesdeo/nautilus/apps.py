@@ -1,5 +1,24 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class NautilusConfig(AppConfig):
     name = 'nautilus'
+
+    def ready(self):
+        from . import instrumentation
+        instrumentation.enable(
+            getattr(settings, "NAUTILUS_INSTRUMENTATION", False),
+            getattr(settings, "NAUTILUS_INSTRUMENTATION_BUFFER", None))
+
+        # Compile the objectives listed in the settings ahead of time so that
+        # the first decision maker to use them does not pay for it.
+        warm_expressions = getattr(settings, "NAUTILUS_WARM_EXPRESSIONS", [])
+        if warm_expressions:
+            from .expression_parser import compiled_cache
+            compiled_cache.warm(warm_expressions)
+
+        # Presolve the built-in problems that have not been presolved yet
+        if getattr(settings, "NAUTILUS_PRESOLVE_AT_STARTUP", False):
+            from .presolve import presolve_builtin
+            presolve_builtin()
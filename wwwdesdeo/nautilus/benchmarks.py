@@ -0,0 +1,568 @@
+"""A load-testing benchmark of the full request flow of the NAUTILUS views.
+Simulated decision makers go through the urls in urls.py (index,
+initialization, the visual iterations and the results) using Django's test
+client, and the latency of each request is recorded per endpoint. See the
+benchmark_flow management command.
+
+The hot paths are also timed on their own, see hot_paths and the
+benchmark_hot_paths management command.
+
+"""
+import inspect
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.urls import resolve, reverse
+
+from . import expression_parser
+from . import instrumentation
+from . import parallel
+from . import stateful_view as sf
+from . import visualization
+
+
+# The custom analytical problem solved by the simulated decision makers
+example_objectives = [
+    {'expression': 'x + y', 'lower_bound': 0.0, 'upper_bound': 10.0},
+    {'expression': 'y / z - 1', 'lower_bound': -1.0, 'upper_bound': 1.0},
+    ]
+example_variables = [
+    {'x_lower_bound': 5, 'x_upper_bound': 10, 'x_initial_value': 9},
+    {'y_lower_bound': 8, 'y_upper_bound': 12, 'y_initial_value': 11},
+    {'z_lower_bound': 15, 'z_upper_bound': 20, 'z_initial_value': 17.5},
+    ]
+
+# The problems the benchmark can be run with
+benchmark_problems = ["River Pollution", "Custom"]
+
+
+class Recorder():
+    """Collects the latencies of the requests per endpoint.
+
+    """
+    def __init__(self):
+        self.__latencies = {}  # endpoint: list of seconds
+        self.__errors = {}  # endpoint: count
+        self.__lock = threading.Lock()
+
+    def record(self, endpoint, seconds, ok=True):
+        with self.__lock:
+            self.__latencies.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.__errors[endpoint] = self.__errors.get(endpoint, 0) + 1
+
+    def report(self):
+        """Summarizes the recorded latencies.
+
+        :returns: For each endpoint the number of requests and errors, and the
+        mean, p50, p95 and p99 latency in milliseconds
+        :rtype: Dict[str, Dict]
+
+        """
+        report = {}
+        with self.__lock:
+            for (endpoint, latencies) in sorted(self.__latencies.items()):
+                ms = 1000 * np.array(latencies)
+                p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+                report[endpoint] = {
+                    "count": len(latencies),
+                    "errors": self.__errors.get(endpoint, 0),
+                    "mean_ms": float(np.mean(ms)),
+                    "p50_ms": float(p50),
+                    "p95_ms": float(p95),
+                    "p99_ms": float(p99),
+                    }
+        return report
+
+
+class DecisionMaker():
+    """A simulated decision maker with its own session.
+
+    """
+    def __init__(self, recorder, poll_interval=0.05):
+        """Constr
+
+        :param recorder: The Recorder the requests are recorded in
+        :param poll_interval: Seconds between polls of a running iteration
+
+        """
+        self.__client = Client()
+        self.__recorder = recorder
+        self.__poll_interval = poll_interval
+
+    def request(self, method, url, data=None, **extra):
+        """Issues a request and records its latency under the name of the url.
+
+        """
+        start = time.perf_counter()
+        response = getattr(self.__client, method)(url, data, **extra)
+        elapsed = time.perf_counter() - start
+
+        endpoint = resolve(urlparse(url).path).url_name
+        self.__recorder.record(endpoint, elapsed,
+                               ok=response.status_code < 400)
+        return response
+
+    def wait_for_iteration(self):
+        """Loads the iteration page, polling while the iteration is computed.
+
+        :returns: The response of the iteration page, or of the page it
+        redirects to once the iterations are over
+
+        """
+        url = reverse("method_visual_iteration")
+        while True:
+            response = self.request("get", url)
+            if response.status_code == 302:
+                # The first iteration was submitted, or the iterations are
+                # over
+                url = response.url
+                if urlparse(url).path != reverse("method_visual_iteration"):
+                    return self.request("get", url)
+                continue
+
+            if (response.context is None
+                    or "status_url" not in response.context):
+                return response
+
+            status_url = response.context["status_url"]
+            while self.request("get", status_url).json()["status"] in (
+                    "running", "pending"):
+                time.sleep(self.__poll_interval)
+
+    def define_custom_problem(self):
+        objectives = {
+            "form-TOTAL_FORMS": len(example_objectives),
+            "form-INITIAL_FORMS": 0,
+            "form-MIN_NUM_FORMS": 0,
+            "form-MAX_NUM_FORMS": 1000,
+            }
+        for (ind, objective) in enumerate(example_objectives):
+            for (key, val) in objective.items():
+                objectives["form-{}-{}".format(ind, key)] = val
+
+        variables = {}
+        for variable in example_variables:
+            variables.update(variable)
+
+        self.request("get", reverse("analytical_problem_input_objectives"))
+        self.request("post", reverse("analytical_problem_input_objectives"),
+                     objectives)
+        self.request("get", reverse("analytical_problem_input_variables"))
+        self.request("post", reverse("analytical_problem_input_variables"),
+                     variables)
+        self.request("get", reverse("analytical_problem_confirm"))
+        self.request("get", reverse("analytical_problem_optimize"))
+
+    def run(self, problem, iterations, n_points):
+        """Goes through the whole flow, from the index to the results, picking
+        a random point on each iteration.
+
+        :param problem: The name of the problem to solve
+        :param iterations: The number of iterations
+        :param n_points: The number of points generated on each iteration
+
+        """
+        self.request("get", reverse("index"))
+        self.request("post", reverse("index"), {
+            "interactive_method": "ENAUTILUS",
+            "optimizer": "SciPyDE",
+            "problem": problem,
+            })
+        if problem == "Custom":
+            self.define_custom_problem()
+
+        self.request("get", reverse("method_initialization"))
+        self.request("post", reverse("method_initialization"), {
+            "User iterations": iterations,
+            "Number of generated points": n_points,
+            })
+
+        response = self.wait_for_iteration()
+        while (urlparse(response.wsgi_request.path).path
+               == reverse("method_visual_iteration")):
+            data = self.request("get", reverse("method_visual_iteration_data"))
+            selection = random.randint(1, max(1, len(data.json()["values"])))
+            self.request("post", reverse("method_visual_iteration"),
+                         {"selection": selection})
+            response = self.wait_for_iteration()
+
+        return response
+
+
+def _run_session(recorder, problem, iterations, n_points):
+    try:
+        DecisionMaker(recorder).run(problem, iterations, n_points)
+    finally:
+        # Each thread has its own connection
+        if threading.current_thread() is not threading.main_thread():
+            connection.close()
+
+
+def run_benchmark(problems=None, sessions=4, concurrency=2, iterations=3,
+                  n_points=5):
+    """Runs the benchmark. Requires the test environment to be set up (see
+    django.test.utils.setup_test_environment) and a migrated database.
+
+    :param problems: The names of the problems to benchmark, defaults to
+    benchmark_problems
+    :param sessions: The number of decision makers per problem
+    :param concurrency: The number of decision makers active at once
+    :param iterations: The number of iterations of each decision maker
+    :param n_points: The number of points generated on each iteration
+    :returns: The machine readable results
+    :rtype: Dict
+
+    """
+    if problems is None:
+        problems = benchmark_problems
+
+    results = {
+        "meta": {
+            "commit": _git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "sessions": sessions,
+            "concurrency": concurrency,
+            "iterations": iterations,
+            "n_points": n_points,
+            "iteration_workers": settings.NAUTILUS_ITERATION_WORKERS,
+            },
+        "problems": {},
+        }
+
+    for problem in problems:
+        recorder = Recorder()
+        start = time.perf_counter()
+        if concurrency > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = [executor.submit(_run_session, recorder, problem,
+                                           iterations, n_points)
+                           for _ in range(sessions)]
+                for future in futures:
+                    future.result()
+        else:
+            for _ in range(sessions):
+                _run_session(recorder, problem, iterations, n_points)
+        elapsed = time.perf_counter() - start
+
+        results["problems"][problem] = {
+            "wall_s": elapsed,
+            "sessions_per_s": sessions / elapsed,
+            "endpoints": recorder.report(),
+            }
+
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=settings.BASE_DIR,
+            stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(results, path):
+    """Writes the results as JSON.
+
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def format_results(results):
+    """Formats the results as a table.
+
+    :rtype: str
+
+    """
+    lines = []
+    for (problem, res) in results["problems"].items():
+        lines.append("{} ({:.1f}s, {:.2f} sessions/s)".format(
+            problem, res["wall_s"], res["sessions_per_s"]))
+        lines.append("  {:<36}{:>7}{:>7}{:>10}{:>10}{:>10}".format(
+            "endpoint", "count", "errors", "p50 ms", "p95 ms", "p99 ms"))
+        for (endpoint, stats) in res["endpoints"].items():
+            lines.append(
+                "  {:<36}{:>7}{:>7}{:>10.2f}{:>10.2f}{:>10.2f}".format(
+                    endpoint, stats["count"], stats["errors"],
+                    stats["p50_ms"], stats["p95_ms"], stats["p99_ms"]))
+    return "\n".join(lines)
+
+
+def _best(fun, number, repeat=3):
+    """The best time of a call of fun in seconds, of repeat rounds of number
+    calls.
+
+    """
+    return min(timeit.repeat(fun, number=number, repeat=repeat)) / number
+
+
+def call_overhead(number=20000):
+    """Times the calls of a compiled objective, with a dict of arguments and
+    with the arguments in the order of the symbols, against the old wrapper
+    introspecting the lambdified function on each call.
+
+    :param number: The number of calls timed
+    :returns: The microseconds per call by way of calling
+    :rtype: Dict[str, float]
+
+    """
+    lam, _, _ = expression_parser.exprs_to_lambda("x - y / z")
+    bound = lam.bind(["x", "y", "z"])
+    raw = lam.lam
+
+    def introspecting(kwargs):
+        args = inspect.getfullargspec(raw)[0]
+        if (len(args) > len(kwargs)):
+            raise expression_parser.ExpressionException(
+                "Too few arguments supplied!")
+
+        stripped = {str(k): kwargs[k] for k in set(args)}
+        return raw(**stripped)
+
+    sdict = {"x": 5.0, "y": 7.0, "z": 13.0}
+    values = (5.0, 7.0, 13.0)
+    return {
+        "introspecting_us": 1e6 * _best(lambda: introspecting(sdict), number),
+        "dict_us": 1e6 * _best(lambda: lam(sdict), number),
+        "ordered_us": 1e6 * _best(lambda: bound.call_ordered(values), number),
+        }
+
+
+def chart_rendering(number=20):
+    """Times rendering the bars chart of ten points with plotly on the server
+    against serving its data for the browser to draw, see
+    NAUTILUS_CLIENT_SIDE_CHARTS.
+
+    :param number: The number of renderings timed
+    :returns: The microseconds per rendering and the bytes sent by way of
+    rendering
+    :rtype: Dict[str, float]
+
+    """
+    values = np.random.rand(10, 4).tolist()
+    return {
+        "plotly_us": 1e6 * _best(lambda: visualization.bars_graph(values),
+                                 number),
+        "plotly_bytes": len(visualization.bars_graph(values)[0]),
+        "data_us": 1e6 * _best(
+            lambda: json.dumps(visualization.bars_graph_data(values)),
+            number),
+        "data_bytes": len(json.dumps(visualization.bars_graph_data(values))),
+        }
+
+
+def timed_overhead(number=100000):
+    """Times the overhead of a function timed as a phase, see
+    instrumentation.timed, with the instrumentation disabled and enabled.
+
+    :param number: The number of calls timed
+    :returns: The nanoseconds added per call by way of the instrumentation
+    :rtype: Dict[str, float]
+
+    """
+    def fun():
+        pass
+    timed = instrumentation.timed("benchmark_timed_overhead")(fun)
+
+    was_enabled = instrumentation.enabled
+    try:
+        plain = _best(fun, number)
+        instrumentation.enable(False)
+        disabled = _best(timed, number)
+        instrumentation.enable(True)
+        enabled = _best(timed, number)
+    finally:
+        instrumentation.enable(was_enabled)
+    return {
+        "disabled_ns": 1e9 * (disabled - plain),
+        "enabled_ns": 1e9 * (enabled - plain),
+        }
+
+
+def parallel_evaluation(n_pop=2000000, number=1):
+    """Times evaluating a large population serially and on the pool of
+    NAUTILUS_EVALUATION_WORKERS worker processes, see parallel. The pool is
+    shut down afterwards.
+
+    :param n_pop: The number of vectors of the population
+    :param number: The number of evaluations timed
+    :returns: The milliseconds per evaluation by way of evaluating
+    :rtype: Dict[str, float]
+
+    """
+    objectives = [
+        (expression_parser.exprs_to_lambda(
+            'sin(x) * exp(cos(y)) + log(1 + x**2)')[0], -10.0, 10.0),
+        (expression_parser.exprs_to_lambda('x - y')[0], -5.0, 5.0),
+        ]
+    symbols = ["x", "y"]
+    variables = [
+        {'x_lower_bound': 0, 'x_upper_bound': 5, 'x_initial_value': 1},
+        {'y_lower_bound': 0, 'y_upper_bound': 5, 'y_initial_value': 1},
+        ]
+    serial = sf.AnalyticalProblem(objectives, symbols, variables)
+    par = sf.AnalyticalProblem(objectives, symbols, variables, parallel=True)
+    population = np.random.rand(n_pop, 2) * 5
+    warm_up = population[:settings.NAUTILUS_PARALLEL_MIN_POPULATION]
+    try:
+        # Start the workers
+        par.evaluate_batch(warm_up)
+        return {
+            "serial_ms": 1e3 * _best(
+                lambda: serial.evaluate_batch(population), number),
+            "parallel_ms": 1e3 * _best(
+                lambda: par.evaluate_batch(population), number),
+            }
+    finally:
+        parallel.shutdown()
+
+
+def fused_evaluation(n_pop=100000, number=5):
+    """Times evaluating a population with separate objectives and with the
+    fused kernel of objectives sharing subexpressions, see
+    NAUTILUS_FUSED_KERNELS.
+
+    :param n_pop: The number of vectors of the population
+    :param number: The number of evaluations timed
+    :returns: The milliseconds per evaluation by way of evaluating
+    :rtype: Dict[str, float]
+
+    """
+    # The objectives share sin(x*y) and exp(cos(z))
+    exprs = ['sin(x*y) * exp(cos(z))',
+             'sin(x*y) + exp(cos(z))',
+             'sin(x*y) - x*exp(cos(z))',
+             '2']
+    objectives = [(expression_parser.exprs_to_lambda(e)[0], 0.0, 1.0)
+                  for e in exprs]
+    symbols = ["x", "y", "z"]
+    variables = [
+        {'x_lower_bound': 0, 'x_upper_bound': 1, 'x_initial_value': 1},
+        {'y_lower_bound': 0, 'y_upper_bound': 1, 'y_initial_value': 1},
+        {'z_lower_bound': 0, 'z_upper_bound': 1, 'z_initial_value': 1},
+        ]
+    separate = sf.AnalyticalProblem(objectives, symbols, variables)
+    fused = sf.AnalyticalProblem(objectives, symbols, variables, fused=True)
+    population = np.random.rand(n_pop, 3)
+    return {
+        "separate_ms": 1e3 * _best(
+            lambda: separate.evaluate_batch(population), number),
+        "fused_ms": 1e3 * _best(
+            lambda: fused.evaluate_batch(population), number),
+        }
+
+
+# Renders the index in a fresh interpreter and reports the heavy modules
+# imported on the way
+_index_script = """
+import sys
+import django
+from django.test import Client
+from django.test.utils import setup_test_environment
+
+django.setup()
+setup_test_environment()
+assert Client().get("/nautilus/").status_code == 200
+heavy = ("desdeo", "sympy", "plotly", "numpy")
+print(",".join(name for name in heavy if name in sys.modules))
+"""
+
+
+def parse_importtime(stderr):
+    """Parses the output of python -X importtime.
+
+    :param stderr: The output written to stderr
+    :returns: The cumulative import time of each top level import in
+    microseconds
+    :rtype: Dict[str, int]
+
+    """
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nested imports are indented
+        if not name.startswith("  "):
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def render_index():
+    """Renders the index in a fresh interpreter, as on the first request to a
+    worker.
+
+    :returns: The heavy modules (desdeo, sympy, plotly and numpy) imported
+    on the way and the import times, see parse_importtime
+    :rtype: Tuple[List[str], Dict[str, int]]
+    :raises subprocess.CalledProcessError: If the index cannot be rendered
+
+    """
+    env = dict(os.environ)
+    env.setdefault("DJANGO_SETTINGS_MODULE", "wwwdesdeo.settings")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _index_script],
+        cwd=settings.BASE_DIR, env=env, universal_newlines=True,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    heavy = [name for name in proc.stdout.strip().split(",") if name]
+    return heavy, parse_importtime(proc.stderr)
+
+
+def import_time(slowest=5):
+    """Times the imports of rendering the index in a fresh interpreter.
+
+    :param slowest: The number of slowest top level imports reported
+    :returns: The total and the slowest import times in milliseconds
+    :rtype: Dict[str, float]
+
+    """
+    _, times = render_index()
+    res = {"total_ms": sum(times.values()) / 1000}
+    for (name, us) in sorted(times.items(), key=lambda t: t[1],
+                             reverse=True)[:slowest]:
+        res[name + "_ms"] = us / 1000
+    return res
+
+
+# The benchmarks of the hot paths by name. Each returns its measurements by
+# name, its arguments only scale it down.
+hot_paths = {
+    "call_overhead": call_overhead,
+    "chart_rendering": chart_rendering,
+    "fused_evaluation": fused_evaluation,
+    "import_time": import_time,
+    "parallel_evaluation": parallel_evaluation,
+    "timed_overhead": timed_overhead,
+    }
+
+
+def format_hot_paths(results):
+    """Formats the results of the benchmarks of the hot paths.
+
+    :param results: The measurements by benchmark
+    :rtype: str
+
+    """
+    return "\n".join("{}: {}".format(name, ", ".join(
+        "{} {:.3f}".format(key, value) for (key, value) in res.items()))
+                     for (name, res) in results.items())
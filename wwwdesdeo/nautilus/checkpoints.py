@@ -0,0 +1,179 @@
+"""Checkpoints of the session states on disk. The states are kept in the
+database (see stateful_view.StateStore), and with NAUTILUS_CHECKPOINTS they
+are also written periodically, at most every NAUTILUS_CHECKPOINT_INTERVAL
+seconds per session, into NAUTILUS_CHECKPOINT_DIR. A session whose state is
+missing from the database, for example after the database has been reset by
+a deploy, is resumed from its latest checkpoint instead of being started
+over. When the sessions of Django were reset too, the state is resumed from
+the checkpoints of the session key in the cookie and moved to the new session
+of the decision maker, see stateful_view.load_state.
+
+A checkpoint is the compressed pickle of the state, as stored in the
+database, behind a header with its version and checksum. The state pickles
+its problem by reference when presolved (see presolve), so resuming does not
+optimize anything. The checkpoints are written atomically and the latest
+NAUTILUS_CHECKPOINT_RETAIN of each session are kept. A checkpoint failing
+its checksum is skipped in favor of the previous one.
+
+"""
+import glob
+import hashlib
+import os
+import shutil
+import struct
+import tempfile
+import time
+import zlib
+
+from django.conf import settings
+
+
+# Magic, version of the state, CRC-32 of the payload
+_header = struct.Struct(">4sII")
+_magic = b"NCP1"
+_extension = ".ckpt"
+
+
+def _session_dir(session_key, directory=None):
+    if directory is None:
+        directory = settings.NAUTILUS_CHECKPOINT_DIR
+    # Session keys are not used as file names as such
+    name = hashlib.sha256(session_key.encode()).hexdigest()
+    return os.path.join(directory, name)
+
+
+def _paths(session_key, directory=None):
+    """The checkpoints of a session, latest first."""
+    pattern = os.path.join(_session_dir(session_key, directory),
+                           "*" + _extension)
+    return sorted(glob.glob(pattern), reverse=True)
+
+
+def write(session_key, version, payload, directory=None):
+    """Writes a checkpoint of the state of a session and removes the ones
+    beyond NAUTILUS_CHECKPOINT_RETAIN.
+
+    :param session_key: The key of the session
+    :param version: The version of the state, see StateStore
+    :param payload: The state as dumped by StateStore.dumps
+    :param directory: Where to write the checkpoint, defaults to
+    NAUTILUS_CHECKPOINT_DIR
+    :returns: The path of the checkpoint
+    :rtype: str
+
+    """
+    session_dir = _session_dir(session_key, directory)
+    os.makedirs(session_dir, exist_ok=True)
+    # Named by the time written, as the versions restart with the database
+    path = os.path.join(session_dir, "{:017d}-{:010d}{}".format(
+        int(time.time() * 1e6), version, _extension))
+
+    # Write to a temporary file first so that readers never see a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=session_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_header.pack(_magic, version,
+                                 zlib.crc32(payload) & 0xffffffff))
+            f.write(payload)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    for stale in _paths(session_key, directory)[
+            max(1, settings.NAUTILUS_CHECKPOINT_RETAIN):]:
+        try:
+            os.unlink(stale)
+        except FileNotFoundError:
+            pass
+
+    return path
+
+
+def read(path):
+    """Reads a checkpoint.
+
+    :param path: The path of the checkpoint
+    :returns: The version and payload of the state, or None if the checkpoint
+    is missing or corrupt
+    :rtype: Tuple[int, bytes]
+
+    """
+    try:
+        with open(path, "rb") as f:
+            content = f.read()
+    except OSError:
+        return None
+
+    if len(content) < _header.size:
+        return None
+    magic, version, crc = _header.unpack_from(content)
+    payload = content[_header.size:]
+    if magic != _magic or zlib.crc32(payload) & 0xffffffff != crc:
+        return None
+    return version, payload
+
+
+def latest(session_key, directory=None):
+    """Reads the latest intact checkpoint of a session.
+
+    :param session_key: The key of the session
+    :param directory: Where the checkpoints are, defaults to
+    NAUTILUS_CHECKPOINT_DIR
+    :returns: The version and payload of the state, or None if there is no
+    checkpoint
+    :rtype: Tuple[int, bytes]
+
+    """
+    for path in _paths(session_key, directory):
+        checkpoint = read(path)
+        if checkpoint is not None:
+            return checkpoint
+    return None
+
+
+def remove(session_key, directory=None):
+    """Removes the checkpoints of a session.
+
+    :param session_key: The key of the session
+    :param directory: Where the checkpoints are, defaults to
+    NAUTILUS_CHECKPOINT_DIR
+
+    """
+    shutil.rmtree(_session_dir(session_key, directory), ignore_errors=True)
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except FileNotFoundError:
+        # Replaced by a newer checkpoint meanwhile
+        return time.time()
+
+
+def prune(max_age, directory=None):
+    """Removes the checkpoints of the sessions not checkpointed for a while.
+
+    :param max_age: The age in seconds of the latest checkpoint of a session
+    beyond which the session is removed
+    :param directory: Where the checkpoints are, defaults to
+    NAUTILUS_CHECKPOINT_DIR
+    :returns: The number of sessions removed
+    :rtype: int
+
+    """
+    if directory is None:
+        directory = settings.NAUTILUS_CHECKPOINT_DIR
+    if not os.path.isdir(directory):
+        return 0
+
+    oldest = time.time() - max_age
+    removed = 0
+    for entry in os.scandir(directory):
+        if not entry.is_dir():
+            continue
+        paths = glob.glob(os.path.join(entry.path, "*" + _extension))
+        if all(_mtime(path) < oldest for path in paths):
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    return removed
@@ -1,39 +1,600 @@
 """Utilities to parse expressions inputted by the user.
 """
-import re
-import inspect
-
-from sympy import sympify
+import ast
+import operator
+import threading
+from collections import OrderedDict
+from operator import itemgetter
+
+import numpy as np
+import sympy
+from sympy import Symbol, sympify, srepr
 from sympy.utilities.lambdify import lambdify
 
 
-# Match for basic artihmetic operators
-__match_arithmetics = r'^(([0-9]|[a-z])+ ([\+,\-,\*,/] ([0-9]|[a-z])*)+)*$'
+# The operators allowed in the expressions
+_binary_operators = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Pow: operator.pow,
+    }
+_unary_operators = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+    }
+
+# The functions and constants allowed in the expressions, by name. Any other
+# name is a variable.
+_functions = {
+    "sin": sympy.sin, "cos": sympy.cos, "tan": sympy.tan,
+    "asin": sympy.asin, "acos": sympy.acos, "atan": sympy.atan,
+    "sinh": sympy.sinh, "cosh": sympy.cosh, "tanh": sympy.tanh,
+    "exp": sympy.exp, "log": sympy.log, "ln": sympy.log,
+    "sqrt": sympy.sqrt, "Abs": sympy.Abs, "abs": sympy.Abs,
+    "Min": sympy.Min, "min": sympy.Min, "Max": sympy.Max, "max": sympy.Max,
+    "floor": sympy.floor, "ceiling": sympy.ceiling,
+    }
+_constants = {
+    "pi": sympy.pi,
+    "E": sympy.E,
+    }
+
+# Powers of numbers are computed exactly, so the size of their results is
+# limited, in bits
+_max_power_bits = 10000
 
 
 class ExpressionException(Exception):
     pass
 
 
+class CompiledObjective():
+    """A callable wrapping a lambdified expression. The order of the arguments
+    of the lambdified function is resolved once, when the expression is
+    compiled, so that calling the objective does not require any
+    introspection.
+
+    """
+    def __init__(self, lam, args, source, indices=None):
+        """Constr
+
+        :param lam: A lambdified expression taking args positionally
+        :param args: The names of the arguments of lam in order
+        :param source: The canonical representation of the expression, used
+        to compile it again when unpickled.
+        :param indices: The position of each argument in the ordered values
+        passed to call_ordered. None if the objective is not bound.
+
+        """
+        self.__lam = lam
+        self.__args = tuple(args)
+        self.__source = source
+        self.__indices = indices
+
+        if indices is None:
+            self.__getter = None
+        elif len(indices) == 0:
+            self.__getter = lambda values: ()
+        elif len(indices) == 1:
+            getter = itemgetter(*indices)
+            self.__getter = lambda values: (getter(values),)
+        else:
+            self.__getter = itemgetter(*indices)
+
+    @property
+    def args(self):
+        return self.__args
+
+    @property
+    def lam(self):
+        return self.__lam
+
+    @property
+    def source(self):
+        return self.__source
+
+    def __reduce__(self):
+        # Lambdified functions can not be pickled, compile the expression
+        # again (or fetch it from the cache) instead.
+        return (_restore_objective, (self.__source, self.__indices))
+
+    def __call__(self, kwargs):
+        """Evaluate the objective.
+
+        :param kwargs: A dict with the values of (at least) the free symbols
+        of the objective keyed by their names
+        :returns: The value of the objective
+
+        """
+        try:
+            values = [kwargs[arg] for arg in self.__args]
+        except KeyError:
+            raise ExpressionException("Too few arguments supplied!")
+
+        return self.__lam(*values)
+
+    def bind(self, symbols):
+        """Bind the objective to an ordering of symbols to enable the fast
+        path in call_ordered.
+
+        :param symbols: A list of symbol names containing the arguments of the
+        objective
+        :returns: A new objective sharing the compiled function
+        :rtype: CompiledObjective
+
+        """
+        try:
+            indices = tuple(symbols.index(arg) for arg in self.__args)
+        except ValueError:
+            raise ExpressionException("Too few arguments supplied!")
+
+        return CompiledObjective(self.__lam, self.__args, self.__source,
+                                 indices)
+
+    def call_ordered(self, values):
+        """Evaluate the objective with values ordered like the symbols the
+        objective was bound to. No dict is built.
+
+        :param values: An indexable with one value (or one column of values)
+        per bound symbol
+        :returns: The value of the objective
+
+        """
+        return self.__lam(*self.__getter(values))
+
+
+class FusedKernel():
+    """A single lambdified function computing every objective of a problem at
+    once. The subexpressions shared by the objectives are computed only once
+    (see sympy.cse).
+
+    """
+    def __init__(self, lam, symbols, sources):
+        """Constr
+
+        :param lam: A lambdified list of expressions taking the symbols
+        positionally
+        :param symbols: The names of the arguments of lam in order
+        :param sources: The canonical representations of the expressions, used
+        to compile the kernel again when unpickled.
+
+        """
+        self.__lam = lam
+        self.__symbols = tuple(symbols)
+        self.__sources = tuple(sources)
+
+    @property
+    def symbols(self):
+        return self.__symbols
+
+    @property
+    def sources(self):
+        return self.__sources
+
+    def __reduce__(self):
+        return (_restore_kernel, (self.__sources, self.__symbols))
+
+    def __call__(self, values, out=None):
+        """Evaluate every objective.
+
+        :param values: An indexable with one value (or one column of values)
+        per symbol, ordered like the symbols
+        :param out: An array of shape (n_pop, n_obj) to store the values in
+        :returns: The objective values, one column per objective
+        :rtype: numpy.ndarray
+
+        """
+        columns = self.__lam(*values)
+        if out is None:
+            n_pop = max([np.size(col) for col in columns] + [1])
+            out = np.empty((n_pop, len(columns)))
+        for (ind, col) in enumerate(columns):
+            # Constant objectives return a scalar, which is broadcast here
+            out[:, ind] = col
+        return out
+
+
+class CompiledJacobian():
+    """A single lambdified function computing the Jacobian of the objectives
+    of a problem, derived with SymPy. Every partial derivative is computed at
+    once for a whole population, sharing the common subexpressions.
+
+    """
+    def __init__(self, lam, symbols, sources, nobj):
+        """Constr
+
+        :param lam: A lambdified list of the rows of the Jacobian taking the
+        symbols positionally
+        :param symbols: The names of the arguments of lam in order
+        :param sources: The canonical representations of the objectives, used
+        to compile the Jacobian again when unpickled.
+        :param nobj: The number of objectives
+
+        """
+        self.__lam = lam
+        self.__symbols = tuple(symbols)
+        self.__sources = tuple(sources)
+        self.__nobj = nobj
+
+    @property
+    def symbols(self):
+        return self.__symbols
+
+    @property
+    def sources(self):
+        return self.__sources
+
+    def __reduce__(self):
+        return (_restore_jacobian, (self.__sources, self.__symbols))
+
+    def __call__(self, values):
+        """Evaluate the Jacobian.
+
+        :param values: An indexable with one value (or one column of values)
+        per symbol, ordered like the symbols
+        :returns: The partial derivatives of each objective (rows) with
+        respect to each symbol (columns), for each input vector
+        :rtype: numpy.ndarray of shape (n_pop, n_obj, n_var)
+
+        """
+        values = [np.asarray(val, dtype=float) for val in values]
+        rows = self.__lam(*values)
+        n_pop = max([val.size for val in values] + [1])
+        out = np.empty((n_pop, self.__nobj, len(self.__symbols)))
+        for (i, row) in enumerate(rows):
+            for (j, entry) in enumerate(row):
+                # Constant derivatives are scalars, which are broadcast here
+                out[:, i, j] = entry
+        return out
+
+
+class CompiledCache():
+    """A process-wide, size-bounded LRU cache of lambdified expressions. The
+    entries are keyed by the canonical form of the SymPy expression and its
+    sorted free symbols, so the same objective is compiled only once even if
+    it is inputted again in a later session.
+
+    """
+    def __init__(self, maxsize=512):
+        """Constr
+
+        :param maxsize: The maximum number of compiled expressions kept.
+
+        """
+        self.__maxsize = maxsize
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+
+    @property
+    def maxsize(self):
+        return self.__maxsize
+
+    @property
+    def hits(self):
+        return self.__hits
+
+    @property
+    def misses(self):
+        return self.__misses
+
+    @staticmethod
+    def key(expr):
+        """Forms the cache key of a SymPy expression.
+
+        :param expr: A SymPy expression
+        :returns: The canonical representation of the expression and its sorted
+        free symbols
+        :rtype: Tuple[Str, Tuple[Str]]
+
+        """
+        return srepr(expr), tuple(sorted(map(str, expr.free_symbols)))
+
+    def compile(self, expr):
+        """Returns the compiled form of a SymPy expression, compiling it only
+        if it is not present in the cache.
+
+        :param expr: A SymPy expression
+        :returns: The compiled objective taking the free symbols of expr in
+        sorted order
+        :rtype: CompiledObjective
+
+        """
+        key = self.key(expr)
+        with self.__lock:
+            fun = self.__entries.get(key)
+            if fun is not None:
+                self.__entries.move_to_end(key)
+                self.__hits += 1
+                return fun
+            self.__misses += 1
+
+        # Backed by NumPy so that whole columns of a population can be passed
+        # in place of scalars.
+        lam = lambdify(sorted(expr.free_symbols, key=str), expr,
+                       modules="numpy")
+        fun = CompiledObjective(lam, key[1], key[0])
+
+        with self.__lock:
+            self.__entries[key] = fun
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.__maxsize:
+                self.__entries.popitem(last=False)
+
+        return fun
+
+    def fuse(self, exprs, symbols):
+        """Returns the fused kernel of a list of SymPy expressions, compiling
+        it only if it is not present in the cache.
+
+        :param exprs: A list of SymPy expressions
+        :param symbols: The names of the arguments of the kernel in order,
+        containing the free symbols of the expressions
+        :returns: The kernel computing every expression
+        :rtype: FusedKernel
+
+        """
+        sources = tuple(srepr(expr) for expr in exprs)
+        key = ("fused", sources, tuple(symbols))
+        with self.__lock:
+            kernel = self.__entries.get(key)
+            if kernel is not None:
+                self.__entries.move_to_end(key)
+                self.__hits += 1
+                return kernel
+            self.__misses += 1
+
+        lam = lambdify([Symbol(sym) for sym in symbols], list(exprs),
+                       modules="numpy", cse=True)
+        kernel = FusedKernel(lam, symbols, sources)
+
+        with self.__lock:
+            self.__entries[key] = kernel
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.__maxsize:
+                self.__entries.popitem(last=False)
+
+        return kernel
+
+    def jacobian(self, exprs, symbols):
+        """Returns the compiled Jacobian of a list of SymPy expressions,
+        deriving and compiling it only if it is not present in the cache.
+
+        :param exprs: A list of SymPy expressions
+        :param symbols: The names of the variables in order, containing the
+        free symbols of the expressions
+        :returns: The Jacobian with one row per expression and one column per
+        symbol
+        :rtype: CompiledJacobian
+        :raises ExpressionException: If the derivatives cannot be compiled,
+        like those of floor and ceiling
+
+        """
+        sources = tuple(srepr(expr) for expr in exprs)
+        key = ("jacobian", sources, tuple(symbols))
+        with self.__lock:
+            jac = self.__entries.get(key)
+            if jac is not None:
+                self.__entries.move_to_end(key)
+                self.__hits += 1
+                return jac
+            self.__misses += 1
+
+        # The variables are real, so that Abs differentiates into sign
+        args = [Symbol(sym, real=True) for sym in symbols]
+        real = {Symbol(sym): arg for (sym, arg) in zip(symbols, args)}
+        rows = [[expr.xreplace(real).diff(arg) for arg in args]
+                for expr in exprs]
+        try:
+            lam = lambdify(args, rows, modules="numpy", cse=True)
+        except Exception as e:
+            raise ExpressionException(
+                "The objectives cannot be differentiated: {}".format(e))
+        jac = CompiledJacobian(lam, symbols, sources, len(exprs))
+
+        with self.__lock:
+            self.__entries[key] = jac
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.__maxsize:
+                self.__entries.popitem(last=False)
+
+        return jac
+
+    def warm(self, str_exprs):
+        """Compiles a list of known expressions ahead of time.
+
+        :param str_exprs: A list of str representing expressions
+        :returns: The number of expressions compiled
+        :rtype: int
+
+        """
+        count = 0
+        for str_expr in str_exprs:
+            self.compile(parse_expression(str_expr))
+            count += 1
+
+        return count
+
+    def stats(self):
+        """Reports the usage of the cache.
+
+        :returns: The hits, misses, current size and maximum size of the cache
+        :rtype: Dict
+
+        """
+        with self.__lock:
+            return {
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "size": len(self.__entries),
+                "maxsize": self.__maxsize,
+            }
+
+    def clear(self):
+        """Empties the cache and resets the statistics.
+
+        """
+        with self.__lock:
+            self.__entries.clear()
+            self.__hits = 0
+            self.__misses = 0
+
+
+# The cache shared by every parsed problem in the process
+compiled_cache = CompiledCache()
+
+
+def _restore_objective(source, indices):
+    """Restores a pickled CompiledObjective.
+
+    """
+    fun = compiled_cache.compile(sympify(source))
+    return CompiledObjective(fun.lam, fun.args, fun.source, indices)
+
+
+def _restore_kernel(sources, symbols):
+    """Restores a pickled FusedKernel.
+
+    """
+    return compiled_cache.fuse([sympify(source) for source in sources],
+                               symbols)
+
+
+def _restore_jacobian(sources, symbols):
+    """Restores a pickled CompiledJacobian.
+
+    """
+    return compiled_cache.jacobian([sympify(source) for source in sources],
+                                   symbols)
+
+
+def jacobian(objectives, symbols):
+    """Compiles the Jacobian of compiled objectives.
+
+    :param objectives: A list of CompiledObjective
+    :param symbols: The names of the variables in order
+    :returns: The Jacobian of the objectives
+    :rtype: CompiledJacobian
+    :raises ExpressionException: If the objectives cannot be differentiated
+
+    """
+    return compiled_cache.jacobian(
+        [sympify(obj.source) for obj in objectives], symbols)
+
+
+def fuse(objectives, symbols):
+    """Fuses compiled objectives into a single kernel.
+
+    :param objectives: A list of CompiledObjective
+    :param symbols: The names of the arguments of the kernel in order
+    :returns: The kernel computing every objective
+    :rtype: FusedKernel
+
+    """
+    return compiled_cache.fuse([sympify(obj.source) for obj in objectives],
+                               symbols)
+
+
+def _power_bits(base, exponent):
+    """Estimates the size in bits of the exact power of two numbers, from the
+    largest numerator or denominator in the base. Powers with an inexact
+    exponent are not computed exactly.
+
+    """
+    if not exponent.is_Rational:
+        return 0
+    size = max((max(int(r.p).bit_length(), int(r.q).bit_length())
+                for r in base.atoms(sympy.Rational)), default=1)
+    return abs(exponent) * size
+
+
+def _build(node):
+    """Builds the SymPy expression of a node of the syntax tree of an
+    expression, rejecting anything not whitelisted.
+
+    """
+    if isinstance(node, ast.Expression):
+        return _build(node.body)
+
+    if isinstance(node, ast.BinOp):
+        fun = _binary_operators.get(type(node.op))
+        if fun is None:
+            raise ValueError("unsupported operator")
+        left = _build(node.left)
+        right = _build(node.right)
+        if (fun is operator.pow and left.is_number and right.is_number
+                and _power_bits(left, right) > _max_power_bits):
+            raise ValueError("too large power")
+        return fun(left, right)
+
+    if isinstance(node, ast.UnaryOp):
+        fun = _unary_operators.get(type(node.op))
+        if fun is None:
+            raise ValueError("unsupported operator")
+        return fun(_build(node.operand))
+
+    if isinstance(node, ast.Constant):
+        # bool is a subclass of int
+        if type(node.value) is int:
+            return sympy.Integer(node.value)
+        if type(node.value) is float:
+            return sympy.Float(node.value)
+        raise ValueError("unsupported constant")
+
+    if isinstance(node, ast.Name):
+        if node.id in _functions:
+            raise ValueError("function {} is not called".format(node.id))
+        if node.id in _constants:
+            return _constants[node.id]
+        return Symbol(node.id)
+
+    if isinstance(node, ast.Call):
+        if (not isinstance(node.func, ast.Name)
+                or node.func.id not in _functions):
+            raise ValueError("unsupported function")
+        if node.keywords or not node.args:
+            raise ValueError("unsupported arguments")
+        return _functions[node.func.id](*map(_build, node.args))
+
+    raise ValueError("unsupported syntax")
+
+
+def parse_expression(str_expr):
+    """Validates and parses an expression in a single pass over its Python
+    syntax tree. Only numbers, variables, arithmetic operators and the
+    functions and constants in _functions and _constants are accepted, and
+    the string is never evaluated.
+
+    :param str_expr: Str representing an expression
+    :returns: The expression
+    :rtype: SymPy expression
+    :raises ExpressionException: If the expression is invalid
+
+    """
+    try:
+        # ^ is a power, like in sympify. Strings are not accepted, so the
+        # replacement can not change a literal.
+        tree = ast.parse(str_expr.strip().replace("^", "**"), mode="eval")
+        return _build(tree)
+    except (SyntaxError, ValueError, TypeError, RecursionError) as e:
+        raise ExpressionException(
+            "Invalid expression encountered: {} ({})".format(str_expr, e))
+
+
 def exprs_to_lambda(str_expr):
     """Transforms an expression in a string format to a callable function.
 
     :param str_expr: Str representing an expression
     :returns: A funtion
-    :rtype: function
+    :rtype: CompiledObjective
 
     """
-    expr = sympify(str_expr)
-
-    lam = lambdify(expr.free_symbols, expr)
+    expr = parse_expression(str_expr)
 
-    def lamargs(kwargs):
-        args = inspect.getfullargspec(lam)[0]
-        if (len(args) > len(kwargs)):
-            raise ExpressionException("Too few arguments supplied!")
-
-        stripped = {str(k): kwargs[k] for k in set(args)}
-        return lam(**stripped)
+    lamargs = compiled_cache.compile(expr)
 
     return lamargs, expr.free_symbols, expr
 
@@ -47,7 +608,7 @@ def free_symbols_dict(str_expr):
     :rtype: Set[str]
 
     """
-    expr = sympify(str_expr)
+    expr = parse_expression(str_expr)
 
     args = {str(k): None for k in expr.free_symbols}
 
@@ -60,50 +621,62 @@ def expressions_are_valid(expressions):
     :param expressions: A list of str representing an expressions
     :returns: True, is the list contains valid expressions
     :rtype: Bool
+    :raises ExpressionException: If an expression is invalid
 
     """
     for expr in expressions:
-        if re.match(__match_arithmetics, expr["expression"]):
-            print("Valid expression: ", expr["expression"])
-        else:
-            raise ExpressionException(
-                "Invalid expression encountered: " + expr["expression"])
+        parse_expression(expr["expression"])
 
     return True
 
 
-def parse(expressions):
+def parse(expressions, jacobian=False):
     """Parses a list of strings representing expressions and return relevant
     information.
 
     :param expressions: A list of strings repsesenting expressions
+    :param jacobian: Whether to also compile the Jacobian of the objectives
     :returns:
       objectives: a list with elements like [function, lower bound,
       upper bound]
       unique_symbols: a set of the symbols present in the objevtives
       sympy_exprs: a list of the sympified expressions
-    :rtype: List[Dict], Set[Str], List[SymPy expression]
+      jacobian: the Jacobian with respect to unique_symbols, only if
+      requested. None if the objectives cannot be differentiated.
+    :rtype: List[Dict], Set[Str], List[SymPy expression], CompiledJacobian
 
     """
-    if not expressions_are_valid(expressions):
-        return False
-
     objectives = []  # contains (function, low_b, up_b)
     unique_symbols = set()
     sympy_exprs = []  # the sympy expressions
 
+    funs = []
+    parsed = []
     for expr in expressions:
+        # Validated while parsed
         fun, symbols, sympy_expr = exprs_to_lambda(expr["expression"])
         unique_symbols |= symbols  # unision
+        funs.append(fun)
+        parsed.append(sympy_expr)
+        sympy_exprs.append(expr)
+
+    unique_symbols_str = sorted(map(str, (unique_symbols)))
+
+    # Bind the functions so that they can be called with values ordered
+    # like unique_symbols_str
+    for (fun, expr) in zip(funs, expressions):
         objectives.append((
-            fun,
+            fun.bind(unique_symbols_str),
             expr["lower_bound"],
             expr["upper_bound"],
             ))
-        sympy_exprs.append(expr)
-
-    unique_symbols_str = sorted(map(str, (unique_symbols)))
 
+    if jacobian:
+        try:
+            jac = compiled_cache.jacobian(parsed, unique_symbols_str)
+        except ExpressionException:
+            jac = None
+        return objectives, unique_symbols_str, sympy_exprs, jac
     return objectives, unique_symbols_str, sympy_exprs
 
 
@@ -185,3 +185,11 @@ def VariableFormsFactory(symbols, post=None):
 
 AnalyticalProblemInputFormSet = formset_factory(AnalyticalProblemInputForm,
                                                 extra=1)
+
+
+class ProblemImportForm(forms.Form):
+    """A form to upload a batch of analytical problems, see imports.
+
+    """
+    problems = forms.FileField(
+        label="Problems (.json or .csv)")
@@ -0,0 +1,312 @@
+"""Bulk import of analytical problems. A batch of problems, read from a JSON
+or CSV file, is parsed right away, sharing the compile cache of
+expression_parser, and the parsed problems are presolved in the background
+on a pool of worker processes. The solutions are stored like those of the
+custom problems (see presolve.solve_custom). The views use the stored
+solutions only if NAUTILUS_CACHE_SOLVED_PROBLEMS is set, in which case a
+problem of a batch is not optimized again when it is later entered by a
+decision maker. The parse and solve time of each problem is reported, see
+batch_status.
+
+JSON: a list of problems like
+    {"name": "Variant 1",
+     "objectives": [{"expression": "x + y", "lower_bound": 0,
+                     "upper_bound": 10}, ...],
+     "variables": {"x": {"lower_bound": 5, "upper_bound": 10,
+                         "initial_value": 9}, ...}}
+
+CSV: one row per objective or variable, with the columns
+    problem,kind,name,expression,lower_bound,upper_bound,initial_value
+where kind is 'objective' (the expression is given) or 'variable' (the name
+is given). The initial values are optional and default to the middle of the
+bounds.
+
+"""
+import csv
+import io
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from django.conf import settings
+
+from . import expression_parser
+from . import presolve
+from . import stateful_view as sf
+from .workers import init_worker
+
+
+class ProblemImportException(Exception):
+    pass
+
+
+# The pool is created on the first imported batch
+_executor = None
+_executor_lock = threading.Lock()
+
+# The reports of the latest batches: batch_id: list of problem reports
+_batches = OrderedDict()
+_batches_lock = threading.Lock()
+_max_batches = 64
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.NAUTILUS_IMPORT_WORKERS,
+                initializer=init_worker,
+                initargs=(os.environ["DJANGO_SETTINGS_MODULE"],))
+        return _executor
+
+
+def file_format(filename):
+    """Tells the format of an uploaded file from its name.
+
+    :param filename: The name of the file
+    :returns: 'json' or 'csv'
+    :rtype: str
+
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in (".json", ".csv"):
+        raise ProblemImportException(
+            "Unsupported file, expected .json or .csv: " + filename)
+    return extension[1:]
+
+
+def _variable(row):
+    return {
+        "lower_bound": row["lower_bound"],
+        "upper_bound": row["upper_bound"],
+        "initial_value": row.get("initial_value"),
+        }
+
+
+def _read_csv(content):
+    problems = OrderedDict()  # name: definition
+    for (line, row) in enumerate(csv.DictReader(io.StringIO(content)), 2):
+        name = row.get("problem")
+        if not name:
+            raise ProblemImportException(
+                "Missing problem on line {}".format(line))
+        problem = problems.setdefault(
+            name, {"name": name, "objectives": [], "variables": {}})
+
+        kind = row.get("kind")
+        if kind == "objective":
+            problem["objectives"].append({
+                "expression": row.get("expression"),
+                "lower_bound": row.get("lower_bound"),
+                "upper_bound": row.get("upper_bound"),
+                })
+        elif kind == "variable":
+            problem["variables"][row.get("name")] = _variable(row)
+        else:
+            raise ProblemImportException(
+                "Unknown kind on line {}: {}".format(line, kind))
+
+    return list(problems.values())
+
+
+def read_problems(content, fmt):
+    """Reads the definitions of a batch of problems.
+
+    :param content: The content of the file
+    :param fmt: 'json' or 'csv', see the module documentation
+    :returns: The definitions of the problems, like the JSON format
+    :rtype: List[Dict]
+
+    """
+    if fmt == "json":
+        try:
+            problems = json.loads(content)
+        except ValueError as e:
+            raise ProblemImportException("Invalid JSON: " + str(e))
+        if not isinstance(problems, list):
+            raise ProblemImportException("Expected a list of problems")
+    else:
+        problems = _read_csv(content)
+
+    if len(problems) > settings.NAUTILUS_IMPORT_MAX_PROBLEMS:
+        raise ProblemImportException(
+            "At most {} problems can be imported at once".format(
+                settings.NAUTILUS_IMPORT_MAX_PROBLEMS))
+
+    for (ind, problem) in enumerate(problems):
+        if not isinstance(problem, dict):
+            raise ProblemImportException(
+                "Problem {} is not an object".format(ind + 1))
+        problem.setdefault("name", "Problem {}".format(ind + 1))
+
+    return problems
+
+
+def parse_problem(definition):
+    """Parses the definition of a problem.
+
+    :param definition: A problem, like the JSON format
+    :returns: The objectives and symbols (see expression_parser.parse) and
+    the variables (see AnalyticalProblem)
+    :rtype: Tuple[List, List[str], List[Dict]]
+    :raises ExpressionException: If an expression is invalid
+    :raises ProblemImportException: If a bound is missing or invalid
+
+    """
+    try:
+        expressions = [{
+            "expression": str(objective["expression"]),
+            "lower_bound": float(objective["lower_bound"]),
+            "upper_bound": float(objective["upper_bound"]),
+            } for objective in definition["objectives"]]
+    except (KeyError, TypeError, ValueError) as e:
+        raise ProblemImportException("Invalid objective: " + str(e))
+    if not expressions:
+        raise ProblemImportException("No objectives given")
+
+    objectives, symbols, _ = expression_parser.parse(expressions)
+
+    variables = []
+    given = definition.get("variables") or {}
+    for sym in symbols:
+        try:
+            var = given[sym]
+            low = float(var["lower_bound"])
+            up = float(var["upper_bound"])
+            initial = var.get("initial_value")
+            initial = (low + up) / 2 if initial in (None, "") else float(
+                initial)
+        except KeyError:
+            raise ProblemImportException(
+                "No bounds given for the variable " + sym)
+        except (TypeError, ValueError) as e:
+            raise ProblemImportException(
+                "Invalid bounds of the variable {}: {}".format(sym, e))
+        variables.append({
+            sym + "_lower_bound": low,
+            sym + "_upper_bound": up,
+            sym + "_initial_value": initial,
+            })
+
+    return objectives, symbols, variables
+
+
+def _solve(objectives, symbols, variables, key):
+    """Presolves a problem into the store of the solved problems. Executed in
+    a worker process.
+
+    :returns: The time taken
+    :rtype: float
+
+    """
+    start = time.perf_counter()
+    problem = sf.AnalyticalProblem(objectives, symbols, variables)
+    presolve.solve_custom(problem, key)
+    return time.perf_counter() - start
+
+
+def _finish(reports, future):
+    with _batches_lock:
+        for report in reports:
+            try:
+                report["solve_s"] = future.result()
+                report["status"] = "solved"
+            except Exception as e:
+                report["status"] = "failed"
+                report["error"] = str(e)
+
+
+def submit_import(definitions):
+    """Parses a batch of problems and presolves them in the background. The
+    problems that have been solved before are not solved again. If
+    NAUTILUS_IMPORT_WORKERS is 0, the problems are solved immediately in the
+    calling thread.
+
+    :param definitions: The problems, see read_problems
+    :returns: The id of the batch
+    :rtype: str
+
+    """
+    batch_id = uuid.uuid4().hex
+    reports = []
+    pending = OrderedDict()  # key: (arguments of _solve, reports)
+    for definition in definitions:
+        report = {
+            "name": str(definition["name"]),
+            "status": "solving",
+            "error": None,
+            "key": None,
+            "cached": False,
+            "parse_s": None,
+            "solve_s": None,
+            }
+        reports.append(report)
+
+        start = time.perf_counter()
+        try:
+            objectives, symbols, variables = parse_problem(definition)
+        except (expression_parser.ExpressionException,
+                ProblemImportException) as e:
+            report["status"] = "invalid"
+            report["error"] = str(e)
+            continue
+        report["parse_s"] = time.perf_counter() - start
+
+        key = presolve.problem_key(objectives, symbols, variables)
+        report["key"] = key
+        if presolve.load_solved(key) is not None:
+            report["status"] = "solved"
+            report["cached"] = True
+            report["solve_s"] = 0.0
+            continue
+        # Variants repeated within the batch are solved once
+        pending.setdefault(key, ((objectives, symbols, variables, key), []))
+        pending[key][1].append(report)
+
+    with _batches_lock:
+        _batches[batch_id] = reports
+        while len(_batches) > _max_batches:
+            _batches.popitem(last=False)
+
+    for (args, solved) in pending.values():
+        if settings.NAUTILUS_IMPORT_WORKERS > 0:
+            future = _get_executor().submit(_solve, *args)
+            future.add_done_callback(
+                lambda f, solved=solved: _finish(solved, f))
+        else:
+            future = Future()
+            try:
+                future.set_result(_solve(*args))
+            except Exception as e:
+                future.set_exception(e)
+            _finish(solved, future)
+
+    return batch_id
+
+
+def batch_status(batch_id):
+    """Reports the progress of a batch imported by this process.
+
+    :param batch_id: The id of the batch
+    :returns: The id of the batch, whether every problem has been handled,
+    and the status, key, error and parse and solve time in seconds of each
+    problem. None if the batch is unknown.
+    :rtype: Dict
+
+    """
+    with _batches_lock:
+        reports = _batches.get(batch_id)
+        if reports is None:
+            return None
+        problems = [dict(report) for report in reports]
+
+    return {
+        "batch_id": batch_id,
+        "done": all(p["status"] != "solving" for p in problems),
+        "problems": problems,
+        }
@@ -0,0 +1,361 @@
+"""Timing of the hot paths: the iterations of the methods, the evaluations of
+the analytical problems, the rendering of the charts and the views. Each
+timed phase records its wall time, the CPU time of its thread and the number
+of objective evaluations done during it. The latest samples are kept in a
+ring buffer and the totals are exported in the Prometheus text format (see
+the metrics view). The InstrumentationMiddleware reports the phases of each
+request in the Server-Timing header.
+
+Nothing is recorded unless enabled (NAUTILUS_INSTRUMENTATION), in which case
+the timed functions only check the module level flag.
+
+"""
+import contextlib
+import functools
+import threading
+import time
+from collections import deque, namedtuple
+
+# Whether the phases are timed, see enable
+enabled = False
+
+Sample = namedtuple("Sample", ["phase", "wall", "cpu", "evaluations", "time"])
+
+_samples = deque(maxlen=4096)
+# phase: [calls, wall, cpu, evaluations]
+_totals = {}
+_lock = threading.Lock()
+
+# The evaluation counter and the collectors of the current thread
+_local = threading.local()
+
+
+def enable(flag=True, buffer_size=None):
+    """Enables or disables the instrumentation.
+
+    :param flag: Whether to time the phases
+    :param buffer_size: The number of latest samples kept, unchanged if None
+
+    """
+    global enabled, _samples
+    if buffer_size is not None and buffer_size != _samples.maxlen:
+        with _lock:
+            _samples = deque(_samples, maxlen=buffer_size)
+    enabled = flag
+
+
+def reset():
+    """Forgets the recorded samples and totals.
+
+    """
+    with _lock:
+        _samples.clear()
+        _totals.clear()
+
+
+def count_evaluations(n):
+    """Adds objective evaluations to the phases running in this thread.
+
+    :param n: The number of evaluated vectors
+
+    """
+    _local.evaluations = getattr(_local, "evaluations", 0) + n
+
+
+def record(sample):
+    """Stores a sample in the ring buffer and the totals, and passes it to
+    the collectors of this thread.
+
+    """
+    with _lock:
+        _samples.append(sample)
+        totals = _totals.setdefault(sample.phase, [0, 0.0, 0.0, 0])
+        totals[0] += 1
+        totals[1] += sample.wall
+        totals[2] += sample.cpu
+        totals[3] += sample.evaluations
+
+    for collector in getattr(_local, "collectors", ()):
+        collector.append(sample)
+
+
+class _Phase():
+    __slots__ = ("name", "wall", "cpu", "evaluations")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.evaluations = getattr(_local, "evaluations", 0)
+        self.cpu = time.thread_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu = time.thread_time() - self.cpu
+        evaluations = getattr(_local, "evaluations", 0) - self.evaluations
+        record(Sample(self.name, wall, cpu, evaluations, time.time()))
+        return False
+
+
+class _NullPhase():
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_null_phase = _NullPhase()
+
+
+def phase(name):
+    """Times the body of a with statement as a phase.
+
+    :param name: The name of the phase
+    :returns: A context manager
+
+    """
+    if not enabled:
+        return _null_phase
+    return _Phase(name)
+
+
+def timed(name):
+    """A decorator timing each call of a function as a phase.
+
+    :param name: The name of the phase
+
+    """
+    def decorator(fun):
+        @functools.wraps(fun)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fun(*args, **kwargs)
+            with _Phase(name):
+                return fun(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def collect():
+    """Collects the samples recorded in this thread during the body of a
+    with statement, for example to pass them from a worker process back to
+    the web process.
+
+    :returns: A context manager giving the list the samples are appended to
+
+    """
+    collected = []
+    if not hasattr(_local, "collectors"):
+        _local.collectors = []
+    _local.collectors.append(collected)
+    try:
+        yield collected
+    finally:
+        _local.collectors.pop()
+
+
+def latest_samples():
+    """The latest samples, oldest first.
+
+    :rtype: List[Sample]
+
+    """
+    with _lock:
+        return list(_samples)
+
+
+def prometheus_text():
+    """Formats the totals of each phase in the Prometheus text format.
+
+    :rtype: str
+
+    """
+    with _lock:
+        totals = sorted((name, list(val)) for (name, val) in _totals.items())
+
+    lines = [
+        "# HELP nautilus_phase_calls_total Number of timed calls.",
+        "# TYPE nautilus_phase_calls_total counter",
+        ]
+    lines += ['nautilus_phase_calls_total{{phase="{}"}} {}'.format(name, t[0])
+              for (name, t) in totals]
+    lines += [
+        "# HELP nautilus_phase_seconds_total Time spent in the phase.",
+        "# TYPE nautilus_phase_seconds_total counter",
+        ]
+    for (name, t) in totals:
+        lines.append('nautilus_phase_seconds_total{{phase="{}",clock="wall"}} '
+                     '{!r}'.format(name, t[1]))
+        lines.append('nautilus_phase_seconds_total{{phase="{}",clock="cpu"}} '
+                     '{!r}'.format(name, t[2]))
+    lines += [
+        "# HELP nautilus_objective_evaluations_total Objective evaluations "
+        "done during the phase.",
+        "# TYPE nautilus_objective_evaluations_total counter",
+        ]
+    lines += ['nautilus_objective_evaluations_total{{phase="{}"}} {}'.format(
+        name, t[3]) for (name, t) in totals]
+
+    return "\n".join(lines) + "\n"
+
+
+def server_timing(samples):
+    """Formats samples as the value of a Server-Timing header.
+
+    :param samples: A list of Sample
+    :rtype: str
+
+    """
+    # Phases repeated within a request, such as evaluate, are summed
+    durations = {}
+    for sample in samples:
+        durations[sample.phase] = (durations.get(sample.phase, 0.0)
+                                   + sample.wall)
+    return ", ".join("{};dur={:.3f}".format(name, 1000 * dur)
+                     for (name, dur) in durations.items())
+
+
+class InstrumentationMiddleware():
+    """Times each view and reports the phases of the request in the
+    Server-Timing header of the response.
+
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not enabled:
+            return self.get_response(request)
+
+        with collect() as samples:
+            with _Phase("view") as view_phase:
+                response = self.get_response(request)
+                # Name the phase after the view once the url is resolved
+                match = getattr(request, "resolver_match", None)
+                if match is not None:
+                    view_phase.name = "view." + str(match.url_name)
+
+        response["Server-Timing"] = server_timing(samples)
+        return response
+
+
+class EvaluationProfile():
+    """Profile of the evaluations of a problem: the number of evaluated
+    vectors, the sizes of the evaluated batches and a histogram of the time
+    each objective takes per evaluated vector. Kept by the problem itself (see
+    AnalyticalProblem), so it travels with the problem to the worker
+    processes and back.
+
+    """
+    # The upper edges of the buckets of the time histograms, in seconds
+    buckets = (1e-6, 1e-5, 1e-4, 1e-3, 1e-2, 1e-1, float("inf"))
+
+    # Objectives slower than this per evaluated vector are reported as slow
+    slow_evaluation = 1e-3
+
+    def __init__(self, nobj):
+        """Constr
+
+        :param nobj: The number of objectives of the problem
+
+        """
+        self.__evaluations = 0
+        self.__batch_sizes = {}  # size: count
+        self.__calls = [0] * nobj
+        self.__seconds = [0.0] * nobj
+        self.__evaluated = [0] * nobj
+        self.__histograms = [[0] * len(self.buckets) for _ in range(nobj)]
+
+    @property
+    def evaluations(self):
+        return self.__evaluations
+
+    @property
+    def batch_sizes(self):
+        return self.__batch_sizes
+
+    @property
+    def calls(self):
+        return self.__calls
+
+    @property
+    def seconds(self):
+        return self.__seconds
+
+    @property
+    def histograms(self):
+        return self.__histograms
+
+    def record_batch(self, size):
+        self.__evaluations += size
+        self.__batch_sizes[size] = self.__batch_sizes.get(size, 0) + 1
+
+    def record_call(self, objective, seconds, size=1):
+        """Records the time of one call of an objective. The call evaluates
+        a whole batch, so its time is shared evenly among the vectors of the
+        batch, each of which is counted in the histogram.
+
+        :param objective: The index of the objective
+        :param seconds: The time the call took
+        :param size: The number of vectors evaluated by the call
+
+        """
+        self.__calls[objective] += 1
+        self.__seconds[objective] += seconds
+        self.__evaluated[objective] += size
+        per_evaluation = seconds / size if size else 0.0
+        for (ind, edge) in enumerate(self.buckets):
+            if per_evaluation <= edge:
+                self.__histograms[objective][ind] += size
+                break
+
+    def record_joint_call(self, seconds, size=1):
+        """Records one call evaluating every objective at once, with a fused
+        kernel or on the pool of parallel. The time is shared evenly among
+        the objectives.
+
+        :param seconds: The time the call took
+        :param size: The number of vectors evaluated by the call
+
+        """
+        share = seconds / len(self.__calls) if self.__calls else 0.0
+        for ind in range(len(self.__calls)):
+            self.record_call(ind, share, size)
+
+    def report(self, names=None):
+        """Formats the profile as text.
+
+        :param names: The names of the objectives, such as their expressions
+        :rtype: str
+
+        """
+        if names is None:
+            names = ["Objective {}".format(ind+1)
+                     for ind in range(len(self.__calls))]
+
+        batches = sum(self.__batch_sizes.values())
+        lines = ["{} evaluations in {} batches (sizes {})".format(
+            self.__evaluations, batches,
+            ", ".join("{}x{}".format(size, count) for (size, count)
+                      in sorted(self.__batch_sizes.items())))]
+        labels = ["<={:g}s".format(edge) for edge in self.buckets[:-1]]
+        labels.append(">{:g}s".format(self.buckets[-2]))
+
+        for (ind, name) in enumerate(names):
+            evaluated = self.__evaluated[ind]
+            per_evaluation = (self.__seconds[ind] / evaluated
+                              if evaluated else 0.0)
+            lines.append("{}: {} calls, {:.1f}us per evaluation{}".format(
+                name, self.__calls[ind], 1e6 * per_evaluation,
+                " (slow)" if per_evaluation > self.slow_evaluation else ""))
+            lines.append("  " + ", ".join(
+                "{} {}".format(label, count) for (label, count)
+                in zip(labels, self.__histograms[ind]) if count))
+
+        return "\n".join(lines)
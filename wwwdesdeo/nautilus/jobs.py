@@ -0,0 +1,179 @@
+"""Background jobs used to run the iterations of the methods outside of the
+request/response cycle. The optimizers are CPU-bound, so the jobs are run on
+a bounded pool of worker processes. The views (see stateful_view) are
+pickled to the workers and back, and the result of a job is saved into the
+state of the session that issued it.
+
+"""
+import os
+import pickle
+import threading
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+
+from . import instrumentation
+from . import speculation
+from . import stateful_view as sf
+from . import visualization
+from .workers import init_worker
+
+
+# The pool is created on the first submitted job
+_executor = None
+_executor_lock = threading.Lock()
+
+# Jobs submitted by this process and not yet finished: job_id: Future
+_running = {}
+_running_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.NAUTILUS_ITERATION_WORKERS,
+                initializer=init_worker,
+                initargs=(os.environ["DJANGO_SETTINGS_MODULE"],))
+        return _executor
+
+
+def iterate(payload, preference, instrumented=False):
+    """Runs one iteration of a pickled view. Executed in a worker process.
+
+    :param payload: A pickled NautilusView
+    :param preference: The preference passed to the view's iterate
+    :param instrumented: Whether to time the iteration, see instrumentation
+    :returns: The pickled view after the iteration and the timed samples
+    :rtype: Tuple[bytes, List[instrumentation.Sample]]
+
+    """
+    instrumentation.enabled = instrumented
+    with instrumentation.collect() as samples:
+        view = pickle.loads(payload)
+        view.iterate(preference)
+    return pickle.dumps(view, pickle.HIGHEST_PROTOCOL), samples
+
+
+def _finish(session_key, job_id, view_id, future):
+    """Saves the outcome of a finished job into the state of the session.
+
+    """
+    with _running_lock:
+        _running.pop(job_id, None)
+
+    _, state = sf.store.load(session_key)
+    # The session may have been reset, or another view chosen, while the job
+    # was running
+    if (state.pending_job != job_id
+            or getattr(state, "view_id", None) != view_id):
+        return
+
+    try:
+        payload, samples = future.result()
+        state.current_view = pickle.loads(payload)
+    except Exception as e:
+        state.failed_job = job_id
+        state.job_error = str(e)
+    state.pending_job = None
+    sf.store.save(session_key, state)
+
+    # The charts of the previous iteration are not needed anymore
+    visualization.render_cache.invalidate(session_key)
+
+
+def _record_samples(future):
+    if future.exception() is None:
+        # The samples timed in the worker process
+        for sample in future.result()[1]:
+            instrumentation.record(sample)
+
+
+def _finish_in_pool(session_key, job_id, view_id, future):
+    try:
+        _record_samples(future)
+        _finish(session_key, job_id, view_id, future)
+    finally:
+        # Called from a thread of the pool, not from a request
+        connection.close()
+
+
+def submit_iteration(session_key, state, preference=(None, None)):
+    """Submits an iteration of the current view of a session as a background
+    job. The state is marked as pending and saved before the job is started.
+    If the iteration has been speculated (see speculation), the speculated
+    iteration is used instead, and saved right away if it is done. Otherwise,
+    if NAUTILUS_ITERATION_WORKERS is 0, the iteration is run immediately in
+    the calling thread.
+
+    :param session_key: The key of the session issuing the job
+    :param state: The SessionState of the session
+    :param preference: The preference passed to the view's iterate
+    :returns: The id of the job
+    :rtype: str
+
+    """
+    job_id = uuid.uuid4().hex
+    view_id = getattr(state, "view_id", None)
+    state.pending_job = job_id
+    state.failed_job = None
+    state.job_error = None
+    sf.store.save(session_key, state)
+
+    speculated = speculation.take(session_key, state.current_view,
+                                  preference)
+    if speculated is not None and speculated.done():
+        _record_samples(speculated)
+        _finish(session_key, job_id, view_id, speculated)
+        return job_id
+    if speculated is not None:
+        with _running_lock:
+            _running[job_id] = speculated
+        speculated.add_done_callback(
+            lambda f: _finish_in_pool(session_key, job_id, view_id, f))
+        return job_id
+
+    payload = pickle.dumps(state.current_view, pickle.HIGHEST_PROTOCOL)
+    if settings.NAUTILUS_ITERATION_WORKERS > 0:
+        future = _get_executor().submit(iterate, payload, preference,
+                                        instrumentation.enabled)
+        with _running_lock:
+            _running[job_id] = future
+        future.add_done_callback(
+            lambda f: _finish_in_pool(session_key, job_id, view_id, f))
+    else:
+        future = Future()
+        try:
+            future.set_result(
+                iterate(payload, preference, instrumentation.enabled))
+        except Exception as e:
+            future.set_exception(e)
+        _finish(session_key, job_id, view_id, future)
+
+    return job_id
+
+
+def job_status(state, job_id):
+    """Reports the status of a job issued by a session.
+
+    :param state: The SessionState of the session
+    :param job_id: The id of the job
+    :returns: One of 'running' (the job is running in this process),
+    'pending' (the job is running elsewhere), 'failed' or 'done'
+    :rtype: str
+
+    """
+    if state.pending_job == job_id:
+        with _running_lock:
+            future = _running.get(job_id)
+        if future is not None and future.running():
+            return "running"
+        return "pending"
+
+    if state.failed_job == job_id:
+        return "failed"
+
+    return "done"
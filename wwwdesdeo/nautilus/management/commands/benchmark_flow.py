@@ -0,0 +1,81 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+
+from nautilus import benchmarks
+
+
+class Command(BaseCommand):
+    help = ("Load-tests the full request flow (index, initialization, visual "
+            "iterations and results) with simulated decision makers and "
+            "reports the p50/p95/p99 latency of each endpoint. The results "
+            "are written as JSON to be compared across commits.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "problems", nargs="*",
+            help="Names of the problems to benchmark, defaults to {}.".format(
+                ", ".join(benchmarks.benchmark_problems)))
+        parser.add_argument(
+            "--sessions", type=int, default=8,
+            help="The number of decision makers per problem.")
+        parser.add_argument(
+            "--concurrency", type=int, default=4,
+            help="The number of decision makers active at once.")
+        parser.add_argument(
+            "--iterations", type=int, default=3,
+            help="The number of iterations of each decision maker.")
+        parser.add_argument(
+            "--points", type=int, default=5,
+            help="The number of points generated on each iteration.")
+        parser.add_argument(
+            "--workers", type=int, default=None,
+            help="Overrides NAUTILUS_ITERATION_WORKERS.")
+        parser.add_argument(
+            "--output", default="benchmark_flow.json",
+            help="Where to write the results.")
+        parser.add_argument(
+            "--use-database", action="store_true",
+            help="Use the configured database instead of a test database.")
+
+    def handle(self, *args, **options):
+        problems = options["problems"] or None
+        for name in problems or []:
+            if name not in benchmarks.benchmark_problems:
+                raise CommandError("Unknown problem: " + name)
+
+        workers = options["workers"]
+        if workers is None:
+            workers = settings.NAUTILUS_ITERATION_WORKERS
+
+        setup_test_environment()
+        if not options["use_database"]:
+            old_name = connection.settings_dict["NAME"]
+            if connection.vendor == "sqlite":
+                # The in-memory test database of SQLite locks whole tables,
+                # which fails the concurrent sessions
+                connection.settings_dict["TEST"]["NAME"] = os.path.join(
+                    tempfile.mkdtemp(), "benchmark_flow.sqlite3")
+            connection.creation.create_test_db(
+                verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(NAUTILUS_ITERATION_WORKERS=workers):
+                results = benchmarks.run_benchmark(
+                    problems,
+                    sessions=options["sessions"],
+                    concurrency=options["concurrency"],
+                    iterations=options["iterations"],
+                    n_points=options["points"])
+        finally:
+            if not options["use_database"]:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        benchmarks.write_results(results, options["output"])
+        self.stdout.write(benchmarks.format_results(results))
+        self.stdout.write("Results written to " + options["output"])
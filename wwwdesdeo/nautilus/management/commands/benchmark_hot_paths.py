@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from nautilus import benchmarks
+
+
+class Command(BaseCommand):
+    help = ("Times the hot paths on their own, each the old and the new way "
+            "or with and without an option, and reports the measurements. "
+            "The results are written as JSON to be compared across "
+            "commits.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "benchmarks", nargs="*",
+            help="Names of the benchmarks to run, defaults to all of {}."
+            .format(", ".join(benchmarks.hot_paths)))
+        parser.add_argument(
+            "--output", default="benchmark_hot_paths.json",
+            help="Where to write the results.")
+
+    def handle(self, *args, **options):
+        names = options["benchmarks"] or list(benchmarks.hot_paths)
+        for name in names:
+            if name not in benchmarks.hot_paths:
+                raise CommandError("Unknown benchmark: " + name)
+
+        results = {name: benchmarks.hot_paths[name]() for name in names}
+
+        benchmarks.write_results(results, options["output"])
+        self.stdout.write(benchmarks.format_hot_paths(results))
+        self.stdout.write("Results written to " + options["output"])
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from nautilus import models as m
+from nautilus import presolve
+
+
+class Command(BaseCommand):
+    help = ("Presolves the built-in problems and stores their Pareto front "
+            "samples, ideal and nadir points in NAUTILUS_PRESOLVED_DIR.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "problems", nargs="*",
+            help="Names of the problems to presolve, defaults to all.")
+        parser.add_argument(
+            "--force", action="store_true",
+            help="Presolve also the problems that have been presolved.")
+
+    def handle(self, *args, **options):
+        names = options["problems"] or None
+        for name in names or []:
+            if m.problems_d.paths.get(name) is None:
+                raise CommandError("Unknown built-in problem: " + name)
+
+        solved = presolve.presolve_builtin(names, force=options["force"])
+        for name in solved:
+            self.stdout.write("Presolved " + name)
+        if not solved:
+            self.stdout.write("Nothing to presolve")
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from nautilus import checkpoints
+
+
+class Command(BaseCommand):
+    help = ("Removes the checkpoints of the sessions not checkpointed for a "
+            "given number of days from NAUTILUS_CHECKPOINT_DIR.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=float, default=14,
+            help="The age of the latest checkpoint of a removed session, "
+            "defaults to 14.")
+
+    def handle(self, *args, **options):
+        removed = checkpoints.prune(options["days"] * 24 * 3600)
+        self.stdout.write("Removed the checkpoints of {} sessions".format(
+            removed))
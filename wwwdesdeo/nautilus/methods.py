@@ -0,0 +1,66 @@
+"""The interactive methods offered in models.available_methods_d, where they
+differ from the ones of desdeo.
+
+"""
+import logging
+
+import numpy as np
+from desdeo.method import ENAUTILUS as _ENAUTILUS
+from desdeo.utils import misc, reachable_points
+from sklearn.cluster import KMeans
+from sklearn.metrics import pairwise_distances_argmin_min
+
+logger = logging.getLogger(__name__)
+
+
+class ENAUTILUS(_ENAUTILUS):
+    """ENAUTILUS of desdeo, clustering the reachable points by their
+    objective values when there are more of them than Ns. desdeo clusters
+    copies of a single (variables, objectives) pair instead, which fails. The
+    next iteration point is also computed for any number of objectives,
+    desdeo logs the first three unconditionally.
+
+    """
+    def _next_zh(self, term1, term2):
+        return list((self.current_iter - 1) * np.array(term1)
+                    / self.current_iter
+                    + np.array(term2) / self.current_iter)
+
+    def next_iteration(self, *args, preference=None, **kwargs):
+        if preference and preference[0]:
+            self.zh_prev = list(preference[0])
+        else:
+            self.zh_prev = self.problem.nadir[:]
+        if preference and preference[1]:
+            self.fh_lo = list(preference[1])
+        else:
+            self.fh_lo = self.problem.ideal[:]
+
+        points = misc.new_points(self.fh_factory, self.zh)
+
+        if len(points) <= self.Ns:
+            logger.debug("Only %s points can be reached from the selected "
+                         "iteration point", len(points))
+            self.NsPoints = points
+        else:
+            # k-means cluster Ns solutions
+            solution_points = [point[1] for point in points]
+            k_means = KMeans(n_clusters=self.Ns, n_init=10)
+            k_means.fit(solution_points)
+            closest = sorted(set(pairwise_distances_argmin_min(
+                k_means.cluster_centers_, solution_points)[0]))
+            self.NsPoints = [points[ind] for ind in closest]
+
+        # Find iteration point for each centroid
+        for _, point in self.NsPoints:
+            self.zhs.append(self._update_zh(self.zh_prev, point))
+            self.fh_lo = list(self.lower_bounds_factory.result(self.zh_prev))
+            self.zh_los.append(self.fh_lo)
+
+            if not self.problem.points:
+                self.zh_reach = []
+            else:
+                self.zh_reach.append(len(reachable_points(
+                    self.NsPoints, self.zh_los[-1], self.zhs[-1])))
+        self.current_iter -= 1
+        return list(zip(self.zh_los, self.zhs))
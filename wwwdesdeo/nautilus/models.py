@@ -1,26 +1,46 @@
 """A collection of dicts that represent the available features implemented
-at the moment.
+at the moment, and the models used to persist the state of the decision
+makers. The features are imported from desdeo only when first used, see
+registry.
 """
-from desdeo.method import ENAUTILUS
-from desdeo.optimization import SciPyDE
-from desdeo.problem.toy import RiverPollution
+from django.conf import settings
+from django.db import models
 
+from .registry import LazyRegistry
 
-available_methods_d = {
-    # "NAUTILUSv1": NAUTILUSv1,
-    "ENAUTILUS": ENAUTILUS,
-    # "NAUTILUS-NAVIGATOR": NNAUTILUS,
-    }
+
+available_methods_d = LazyRegistry({
+    # "NAUTILUSv1": "desdeo.method:NAUTILUSv1",
+    "ENAUTILUS": "nautilus.methods:ENAUTILUS",
+    # "NAUTILUS-NAVIGATOR": "desdeo.method:NNAUTILUS",
+    })
 available_methods = list(available_methods_d.keys())
 
-available_optimizers_d = {
-    "SciPyDE": SciPyDE,
-    }
+# More optimizers can be plugged in with NAUTILUS_OPTIMIZERS, see optimizers
+available_optimizers_d = LazyRegistry(dict({
+    "SciPyDE": "nautilus.optimizers:SciPyDE",
+    "SLSQP": "nautilus.optimizers:SLSQP",
+    "SLSQP (multi-start)": "nautilus.optimizers:MultiStartSLSQP",
+    "L-BFGS-B": "nautilus.optimizers:LBFGSB",
+    }, **settings.NAUTILUS_OPTIMIZERS))
 available_optimizers = list(
     available_optimizers_d.keys())
 
-problems_d = {
+# The problems are instantiated when first used
+problems_d = LazyRegistry({
     "Custom": None,
-    "River Pollution": RiverPollution(),
-    }
+    "River Pollution": "desdeo.problem.toy:RiverPollution",
+    }, instantiate=True)
 problems = list(problems_d.keys())
+
+
+class MethodState(models.Model):
+    """The pickled state of a single decision maker. See
+    stateful_view.SessionState.
+
+    """
+    session_key = models.CharField(max_length=40, unique=True)
+    # Incremented on each save, used to validate the in-process cache
+    version = models.PositiveIntegerField(default=0)
+    payload = models.BinaryField()
+    updated = models.DateTimeField(auto_now=True)
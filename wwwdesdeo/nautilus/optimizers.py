@@ -0,0 +1,252 @@
+"""The optimizers solving the single objective subproblems the methods pose,
+offered in models.available_optimizers_d. Besides SciPyDE, a global
+population-based solver, the gradient-based local optimizers of SciPy are
+available. For the analytical problems they use the Jacobian of the
+objectives compiled by expression_parser (see AnalyticalProblem.jacobian),
+and for the other problems finite differences.
+
+Each search records the number of evaluated vectors and the time taken on
+the optimizer (evaluations and seconds) and, when enabled, as the phase
+'optimizer.<name>' in instrumentation.
+
+"""
+import time
+
+import numpy as np
+from desdeo.optimization import SciPyDE as _SciPyDE
+from desdeo.optimization.OptimizationMethod import OptimizationMethod
+from scipy.optimize import minimize
+
+from . import instrumentation
+
+
+class ReportingSearch():
+    """A mixin for optimizers timing their searches and counting their
+    evaluations, see the module documentation.
+
+    """
+    # The name of the optimizer in models.available_optimizers_d
+    name = None
+
+    evaluations = 0
+    seconds = 0.0
+
+    def search(self, *args, **kwargs):
+        self.evaluations = 0
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            return super().search(*args, **kwargs)
+        finally:
+            self.seconds = time.perf_counter() - wall
+            if instrumentation.enabled:
+                instrumentation.record(instrumentation.Sample(
+                    "optimizer." + self.name, self.seconds,
+                    time.thread_time() - cpu, self.evaluations, time.time()))
+
+
+class SciPyDE(ReportingSearch, _SciPyDE):
+    name = "SciPyDE"
+
+    def _objective(self, x):
+        self.evaluations += 1
+        return super()._objective(x)
+
+
+class GradientSearch(ReportingSearch, OptimizationMethod):
+    """A gradient-based local optimizer from scipy.optimize.minimize, started
+    from the starting point of the problem and from starts-1 random points
+    within the bounds. The best found solution is returned.
+
+    The gradient of the scalarized subproblem is the gradient of the
+    scalarizing function with respect to the objective values, computed by
+    finite differences without evaluating the problem, times the Jacobian of
+    the objectives. The constraints of the subproblem (the objective bounds
+    of the epsilon constraint problems) are differentiated likewise.
+
+    """
+    # The method of scipy.optimize.minimize
+    method = "SLSQP"
+    # The number of starting points
+    starts = 1
+    # The seed of the random starting points
+    seed = 0
+    # The step of the finite differences of the scalarizing function
+    step = 1e-7
+
+    def __init__(self, optimization_problem):
+        """Constr
+
+        :param optimization_problem: The scalarized subproblem
+
+        """
+        super().__init__(optimization_problem)
+        self.__jac = None
+        self.__x = None
+        self.__point = None
+
+    def __jacobian(self, bounds):
+        problem = self.optimization_problem.problem
+        if getattr(problem, "compiled_objectives", None) is None:
+            return None
+        try:
+            # Compiled and tried now, so that the objectives which cannot be
+            # differentiated, like floor, use the finite differences
+            problem.jacobian([bounds[:, 0]])
+        except Exception:
+            return None
+        return problem.jacobian
+
+    def __evaluate(self, x):
+        """The objective values of the problem and their Jacobian at x, or
+        None for the Jacobian if it is not known. The latest point is reused,
+        as the subproblem and its constraints are evaluated at the same x.
+
+        """
+        if self.__x is None or not np.array_equal(self.__x, x):
+            values = np.asarray(
+                self.optimization_problem.problem.evaluate([x])[0],
+                dtype=float)
+            self.evaluations += 1
+            jac = None if self.__jac is None else self.__jac([x])[0]
+            self.__x = np.array(x)
+            self.__point = (values, jac)
+        return self.__point
+
+    def __scalarize(self, values):
+        obj, const = self.optimization_problem.evaluate([list(values)])
+        if const is None or not len(const):
+            const = np.empty(0)
+        else:
+            const = np.asarray(const[0], dtype=float)
+        return self._coeff * float(obj[0]), const
+
+    def __scalarize_gradient(self, values):
+        """The scalarized value and constraints and their gradients with
+        respect to the objective values.
+
+        """
+        value, const = self.__scalarize(values)
+        d_value = np.empty(len(values))
+        d_const = np.empty((len(const), len(values)))
+        for ind in range(len(values)):
+            shifted = np.array(values)
+            step = self.step * max(1.0, abs(values[ind]))
+            shifted[ind] += step
+            s_value, s_const = self.__scalarize(shifted)
+            d_value[ind] = (s_value - value) / step
+            d_const[:, ind] = (s_const - const) / step
+        return value, const, d_value, d_const
+
+    def _fun(self, x):
+        values, jac = self.__evaluate(x)
+        if jac is None:
+            return self.__scalarize(values)[0]
+        value, _, d_value, _ = self.__scalarize_gradient(values)
+        return value, d_value @ jac
+
+    def _constraints(self, x):
+        # SciPy expects the inequalities as c(x) >= 0, desdeo as c(x) <= 0
+        values, _ = self.__evaluate(x)
+        return -self.__scalarize(values)[1]
+
+    def _constraints_jac(self, x):
+        values, jac = self.__evaluate(x)
+        return -self.__scalarize_gradient(values)[3] @ jac
+
+    def _minimize(self, x0, bounds, analytic, constrained):
+        """Runs the local optimizer from x0.
+
+        :param x0: The starting point
+        :param bounds: The bounds of the variables, one row per variable
+        :param analytic: Whether the gradients are returned by _fun and
+        _constraints_jac
+        :param constrained: Whether the subproblem has constraints
+        :rtype: scipy.optimize.OptimizeResult
+
+        """
+        options = {}
+        if constrained:
+            constraint = {"type": "ineq", "fun": self._constraints}
+            if analytic:
+                constraint["jac"] = self._constraints_jac
+            options["constraints"] = [constraint]
+        return minimize(self._fun, x0, jac=analytic, method=self.method,
+                        bounds=bounds, **options)
+
+    def __starting_points(self, bounds):
+        lower, upper = bounds.T
+        first = [lo + (up - lo) / 2 if var.starting_point is None
+                 else var.starting_point for (var, lo, up) in zip(
+                     self.optimization_problem.problem.variables,
+                     lower, upper)]
+        points = [np.clip(np.array(first, dtype=float), lower, upper)]
+        rng = np.random.default_rng(self.seed)
+        for _ in range(self.starts - 1):
+            points.append(rng.uniform(lower, upper))
+        return points
+
+    def __violation(self, x):
+        return float(np.sum(np.clip(-self._constraints(x), 0, None)))
+
+    def _search(self, **params):
+        if getattr(self.optimization_problem, "obj_bounds", ()) is None:
+            raise ValueError("The objective bounds of the {} are not "
+                             "set".format(
+                                 type(self.optimization_problem).__name__))
+        bounds = np.array(self.optimization_problem.problem.bounds(),
+                          dtype=float)
+        self.__jac = self.__jacobian(bounds)
+        points = self.__starting_points(bounds)
+        constrained = len(self._constraints(points[0])) > 0
+        best = None
+        for x0 in points:
+            res = self._minimize(x0, bounds, self.__jac is not None,
+                                 constrained)
+            x = np.clip(res.x, bounds[:, 0], bounds[:, 1])
+            # Feasible solutions first, then by the scalarized value
+            rank = (self.__violation(x),
+                    self.__scalarize(self.__evaluate(x)[0])[0])
+            if best is None or rank < best[0]:
+                best = (rank, x)
+
+        x = best[1]
+        values = self.__evaluate(x)[0]
+        # Drop the references to the problem, the optimizer is pickled
+        self.__x = self.__point = self.__jac = None
+        return x, list(values)
+
+
+class SLSQP(GradientSearch):
+    name = "SLSQP"
+
+
+class MultiStartSLSQP(GradientSearch):
+    name = "SLSQP (multi-start)"
+    starts = 8
+
+
+class LBFGSB(GradientSearch):
+    """L-BFGS-B handles only the bounds of the variables. The constraints of
+    the subproblem are added to the scalarized value as a quadratic penalty.
+
+    """
+    name = "L-BFGS-B"
+    method = "L-BFGS-B"
+    penalty = 1e4
+
+    def _fun(self, x):
+        res = super()._fun(x)
+        violation = np.clip(-self._constraints(x), 0, None)
+        if not violation.any():
+            return res
+        if isinstance(res, tuple):
+            value, grad = res
+            grad = grad - 2 * self.penalty * violation @ self._constraints_jac(
+                x)
+            return value + self.penalty * violation @ violation, grad
+        return res + self.penalty * violation @ violation
+
+    def _minimize(self, x0, bounds, analytic, constrained):
+        return minimize(self._fun, x0, jac=analytic, method=self.method,
+                        bounds=bounds)
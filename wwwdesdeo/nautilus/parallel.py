@@ -0,0 +1,246 @@
+"""Parallel evaluation of large populations of the analytical problems. A
+single pool of NAUTILUS_EVALUATION_WORKERS worker processes is shared by all
+the problems. The objectives of a problem are sent along with each chunk of a
+population, pickled as their sources (see CompiledObjective), and each worker
+keeps the compiled objectives of the latest problems, so that they are
+compiled only once per worker. A population is split into chunks evaluated by
+the workers, and both the population and the objective values are passed
+through shared memory instead of being pickled.
+
+The pool is not started within the worker processes of the background pools
+(see workers), which would nest a pool in each of them. These evaluate the
+populations themselves.
+
+"""
+import atexit
+import hashlib
+import pickle
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+from django.conf import settings
+
+from . import workers
+
+
+# The compiled objectives of the latest problems, kept in each worker:
+# problem_key: bound CompiledObjectives
+_objectives = OrderedDict()
+_max_objectives = 8
+
+
+def _objectives_of(key, payload):
+    objectives = _objectives.get(key)
+    if objectives is None:
+        # Unpickling compiles the objectives, see CompiledObjective
+        objectives = pickle.loads(payload)
+        _objectives[key] = objectives
+        while len(_objectives) > _max_objectives:
+            _objectives.popitem(last=False)
+    _objectives.move_to_end(key)
+    return objectives
+
+
+def _evaluate_chunk(key, payload, in_name, out_name, shape, start, stop):
+    """Evaluates the rows start:stop of the population in the shared memory
+    block in_name, writing the objective values into the block out_name.
+    Executed in a worker process.
+
+    """
+    objectives = _objectives_of(key, payload)
+    shm_in = shared_memory.SharedMemory(name=in_name)
+    shm_out = shared_memory.SharedMemory(name=out_name)
+    try:
+        population = np.ndarray(shape, dtype=float, buffer=shm_in.buf)
+        res = np.ndarray((shape[0], len(objectives)), dtype=float,
+                         buffer=shm_out.buf)
+        columns = population[start:stop].T
+        for (ind, obj) in enumerate(objectives):
+            res[start:stop, ind] = obj.call_ordered(columns)
+        # The views must be released before the blocks are closed
+        del population, res, columns
+    finally:
+        shm_in.close()
+        shm_out.close()
+
+
+def problem_key(objectives):
+    """Identifies the problem the bound objectives belong to.
+
+    :param objectives: The bound CompiledObjectives of the problem
+    :rtype: str
+
+    """
+    digest = hashlib.sha1()
+    for obj in objectives:
+        # The pickled form of an objective is its source and binding
+        digest.update(repr(obj.__reduce__()[1]).encode())
+    return digest.hexdigest()
+
+
+class EvaluationPool():
+    """A pool of worker processes evaluating the populations of any problem,
+    with shared memory blocks for the populations and their objective values.
+    Each evaluation takes a pair of blocks of its own, so that the
+    populations of concurrent sessions are evaluated at the same time, each
+    split among all the workers. The pairs are reused by the later
+    evaluations and grow with the largest population seen.
+
+    """
+    def __init__(self, workers):
+        """Constr
+
+        :param workers: The number of worker processes
+
+        """
+        self.__workers = workers
+        self.__executor = ProcessPoolExecutor(max_workers=workers)
+        # Start the workers right away: forked later, during the evaluations
+        # of other threads, they could inherit a lock held by one of them
+        self.__executor.submit(int).result()
+        self.__free = []  # (shm_in, shm_out) not used by an evaluation
+        self.__closed = False
+        self.__lock = threading.Lock()
+
+    @property
+    def workers(self):
+        return self.__workers
+
+    def __reserve(self, n_pop, n_var, n_obj):
+        """Takes a free pair of blocks, or new ones, large enough for the
+        population and its objective values. Only taking the pair holds the
+        lock.
+
+        """
+        size_in = max(1, n_pop * n_var * 8)
+        size_out = max(1, n_pop * n_obj * 8)
+        with self.__lock:
+            blocks = self.__free.pop() if self.__free else (None, None)
+        (shm_in, shm_out) = blocks
+        if shm_in is None or shm_in.size < size_in:
+            self.__release(shm_in)
+            shm_in = shared_memory.SharedMemory(create=True, size=size_in)
+        if shm_out is None or shm_out.size < size_out:
+            self.__release(shm_out)
+            shm_out = shared_memory.SharedMemory(create=True, size=size_out)
+        return (shm_in, shm_out)
+
+    def __put_back(self, blocks):
+        with self.__lock:
+            if not self.__closed:
+                self.__free.append(blocks)
+                return
+        for shm in blocks:
+            self.__release(shm)
+
+    @staticmethod
+    def __release(shm):
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+    def evaluate(self, objectives, population):
+        """Evaluates a population of a problem in chunks, one per worker.
+
+        :param objectives: The bound CompiledObjectives of the problem
+        :param population: A 2-D array with one input vector per row
+        :returns: The objective values with one row per input vector
+        :rtype: numpy.ndarray of shape (n_pop, n_obj)
+
+        """
+        key = problem_key(objectives)
+        payload = pickle.dumps(list(objectives), pickle.HIGHEST_PROTOCOL)
+        shape = population.shape
+        nobj = len(objectives)
+        blocks = self.__reserve(shape[0], shape[1], nobj)
+        (shm_in, shm_out) = blocks
+        try:
+            np.ndarray(shape, dtype=float, buffer=shm_in.buf)[:] = population
+
+            bounds = np.linspace(0, shape[0], self.__workers + 1).astype(int)
+            futures = [self.__executor.submit(
+                _evaluate_chunk, key, payload, shm_in.name, shm_out.name,
+                shape, start, stop)
+                       for (start, stop) in zip(bounds[:-1], bounds[1:])
+                       if start < stop]
+            for future in futures:
+                future.result()
+
+            return np.ndarray((shape[0], nobj), dtype=float,
+                              buffer=shm_out.buf).copy()
+        finally:
+            self.__put_back(blocks)
+
+    def shutdown(self):
+        """Stops the workers and frees the shared memory. The blocks still
+        used by an evaluation are freed when it ends.
+
+        """
+        self.__executor.shutdown()
+        with self.__lock:
+            self.__closed = True
+            free = self.__free
+            self.__free = []
+        for blocks in free:
+            for shm in blocks:
+                self.__release(shm)
+
+
+# The pool is created on the first parallel evaluation
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def available():
+    """Tells whether the populations can be evaluated in parallel by this
+    process, that is, whether it is not a worker process itself.
+
+    :rtype: bool
+
+    """
+    return not workers.in_worker and settings.NAUTILUS_EVALUATION_WORKERS > 0
+
+
+def get_pool():
+    """Returns the pool, starting it if needed.
+
+    :rtype: EvaluationPool
+    :raises RuntimeError: If called within a worker process, see available
+
+    """
+    global _pool
+    if not available():
+        raise RuntimeError("The populations are not evaluated in parallel "
+                           "within the worker processes")
+    with _pool_lock:
+        if _pool is None:
+            _pool = EvaluationPool(settings.NAUTILUS_EVALUATION_WORKERS)
+        return _pool
+
+
+def evaluate(objectives, population):
+    """Evaluates a population of a problem on the pool.
+
+    :param objectives: The bound CompiledObjectives of the problem
+    :param population: A 2-D array with one input vector per row
+    :rtype: numpy.ndarray of shape (n_pop, n_obj)
+
+    """
+    return get_pool().evaluate(objectives, population)
+
+
+@atexit.register
+def shutdown():
+    """Shuts down the pool.
+
+    """
+    global _pool
+    with _pool_lock:
+        pool = _pool
+        _pool = None
+
+    if pool is not None:
+        pool.shutdown()
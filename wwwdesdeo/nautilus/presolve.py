@@ -0,0 +1,312 @@
+"""Presolving of the built-in problems. The problems in models.problems_d
+never change, so their Pareto front is sampled only once and stored on disk
+as NumPy arrays. The stored arrays are memory-mapped read-only and used by
+the views instead of optimizing the problems again for every session.
+
+The custom analytical problems are stored likewise once solved, keyed by a
+hash of their definition (see problem_key and solve_custom), so that the
+problems submitted again are not optimized again.
+
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+from django.conf import settings
+from desdeo.core.ResultFactory import IterationPointFactory
+from desdeo.optimization import SciPyDE
+from desdeo.optimization.OptimizationProblem import NautilusAchievementProblem
+from desdeo.problem import MOProblem
+from desdeo.utils import new_points
+
+from . import models as m
+
+
+class PresolvedProblem(MOProblem):
+    """A problem represented by a presolved sample of its Pareto front. To be
+    used with the PointSearch optimizer, which picks the best point of the
+    sample.
+
+    """
+    def __init__(self, name, pareto, ideal, nadir, meta):
+        """Constr
+
+        :param name: The name of the problem in models.problems_d
+        :param pareto: The Pareto front sample, one objective vector per row
+        :param ideal: The ideal point
+        :param nadir: The nadir point
+        :param meta: A dict with the names of the objectives and which of them
+        are maximized
+
+        """
+        super().__init__(
+            nobj=pareto.shape[1],
+            ideal=[float(v) for v in ideal],
+            nadir=[float(v) for v in nadir],
+            maximized=meta["maximized"],
+            objectives=meta["objectives"],
+            name=name,
+            )
+        # The points are not stored in 'points', which is used by the methods
+        # only to report how many points are reachable.
+        self.__pareto = pareto
+
+    @property
+    def pareto(self):
+        return self.__pareto
+
+    def evaluate(self, population=None):
+        """Returns the whole Pareto front sample. The population is ignored.
+
+        """
+        return self.__pareto
+
+    def __reduce__(self):
+        # Map the arrays again instead of pickling them
+        return (load, (self.name,))
+
+
+def _problem_dir(name, directory=None):
+    if directory is None:
+        directory = settings.NAUTILUS_PRESOLVED_DIR
+    return os.path.join(directory, name.replace(" ", "_"))
+
+
+def _write(path, write):
+    """Writes a file atomically. The content is written by write, given the
+    file object, to a temporary file first so that readers never see a
+    partial file. The temporary file is unique, so that concurrent writers
+    do not collide.
+
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _save_array(path, array):
+    _write(path, lambda f: np.save(f, np.asarray(array, dtype=float)))
+
+
+def presolve(problem, optimizer=SciPyDE, samples=None):
+    """Samples the Pareto front of a problem by solving achievement
+    scalarizing problems with random weights, projected from the nadir point.
+    One subproblem is solved per sampled point.
+
+    The weights are drawn here: new_points would cluster its random weights
+    down to a single weight vector per objective.
+
+    :param problem: An instance of MOProblem
+    :param optimizer: The optimizer class used to solve the subproblems
+    :param samples: The number of points sampled per objective, defaults to
+    NAUTILUS_PRESOLVE_SAMPLES
+    :returns: The Pareto front sample, the ideal and the nadir point of the
+    problem
+    :rtype: Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]
+
+    """
+    if samples is None:
+        samples = settings.NAUTILUS_PRESOLVE_SAMPLES
+    nobj = problem.nof_objectives()
+    weights = np.random.rand(samples * nobj, nobj).tolist()
+
+    factory = IterationPointFactory(
+        optimizer(NautilusAchievementProblem(problem)))
+    points = new_points(factory, problem.nadir, weights)
+    pareto = np.array([objectives for (_, objectives) in points], dtype=float)
+
+    # The extremes of the sample are not the ideal and nadir of the problem
+    return (pareto, np.asarray(problem.ideal, dtype=float),
+            np.asarray(problem.nadir, dtype=float))
+
+
+def save(name, problem, pareto, ideal, nadir, directory=None):
+    """Stores a presolved problem on disk.
+
+    :param name: The name of the problem in models.problems_d
+    :param problem: The instance of MOProblem that was presolved
+    :param pareto: The Pareto front sample
+    :param ideal: The ideal point
+    :param nadir: The nadir point
+    :param directory: Where to store the problem, defaults to
+    NAUTILUS_PRESOLVED_DIR
+
+    """
+    path = _problem_dir(name, directory)
+    os.makedirs(path, exist_ok=True)
+
+    _save_array(os.path.join(path, "pareto.npy"), pareto)
+    _save_array(os.path.join(path, "ideal.npy"), ideal)
+    _save_array(os.path.join(path, "nadir.npy"), nadir)
+
+    meta = {
+        "objectives": list(problem.objectives),
+        "maximized": list(problem.maximized),
+        }
+    _write(os.path.join(path, "meta.json"),
+           lambda f: f.write(json.dumps(meta).encode()))
+
+
+def load(name, directory=None):
+    """Loads a presolved problem, memory-mapping its arrays read-only.
+
+    :param name: The name of the problem in models.problems_d
+    :param directory: Where the problem is stored, defaults to
+    NAUTILUS_PRESOLVED_DIR
+    :returns: The presolved problem or None if it has not been presolved
+    :rtype: PresolvedProblem
+
+    """
+    path = _problem_dir(name, directory)
+    try:
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        pareto = np.load(os.path.join(path, "pareto.npy"), mmap_mode="r")
+        ideal = np.load(os.path.join(path, "ideal.npy"), mmap_mode="r")
+        nadir = np.load(os.path.join(path, "nadir.npy"), mmap_mode="r")
+    except FileNotFoundError:
+        return None
+
+    return PresolvedProblem(name, pareto, ideal, nadir, meta)
+
+
+def presolve_builtin(names=None, force=False, directory=None):
+    """Presolves and stores the built-in problems.
+
+    :param names: The names of the problems to presolve, defaults to every
+    built-in problem
+    :param force: Presolve also the problems that have been presolved before
+    :param directory: Where to store the problems, defaults to
+    NAUTILUS_PRESOLVED_DIR
+    :returns: The names of the presolved problems
+    :rtype: List[str]
+
+    """
+    if names is None:
+        names = [name for (name, path) in m.problems_d.paths.items()
+                 if path is not None]
+
+    solved = []
+    for name in names:
+        if not force and load(name, directory) is not None:
+            continue
+        problem = m.problems_d[name]
+        pareto, ideal, nadir = presolve(problem)
+        save(name, problem, pareto, ideal, nadir, directory)
+        solved.append(name)
+
+    return solved
+
+
+class SolvedProblem(PresolvedProblem):
+    """A solved custom analytical problem, named after the key of its
+    definition (see problem_key).
+
+    """
+    def __reduce__(self):
+        return (load_solved, (self.name,))
+
+
+def problem_key(objectives, symbols, variables):
+    """Computes the key of the definition of a custom analytical problem. The
+    definition is normalized first: the expressions are in their canonical
+    form and the initial values of the variables, which do not change the
+    Pareto front, are left out.
+
+    :param objectives: The objectives as returned by expression_parser.parse
+    :param symbols: The symbols of the objectives
+    :param variables: The bounds of the variables, see AnalyticalProblem
+    :returns: A hex digest
+    :rtype: str
+
+    """
+    definition = {
+        "objectives": [[obj.source, float(low), float(up)]
+                       for (obj, low, up) in objectives],
+        "variables": [[sym,
+                       float(var[sym + "_lower_bound"]),
+                       float(var[sym + "_upper_bound"])]
+                      for (sym, var) in zip(symbols, variables)],
+        }
+    return hashlib.sha256(
+        json.dumps(definition, sort_keys=True).encode()).hexdigest()
+
+
+def _solved_path(key, directory=None):
+    if directory is None:
+        directory = settings.NAUTILUS_SOLVED_DIR
+    return os.path.join(directory, key + ".npz")
+
+
+def save_solved(key, problem, pareto, ideal, nadir, directory=None):
+    """Stores a solved custom problem on disk, as a single compressed .npz
+    file.
+
+    :param key: The key of the problem, see problem_key
+    :param problem: The instance of MOProblem that was solved
+    :param pareto: The Pareto front sample
+    :param ideal: The ideal point
+    :param nadir: The nadir point
+    :param directory: Where to store the problem, defaults to
+    NAUTILUS_SOLVED_DIR
+
+    """
+    path = _solved_path(key, directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    _write(path, lambda f: np.savez_compressed(
+        f,
+        pareto=np.asarray(pareto, dtype=float),
+        ideal=np.asarray(ideal, dtype=float),
+        nadir=np.asarray(nadir, dtype=float),
+        objectives=np.array([str(obj) for obj in problem.objectives]),
+        maximized=np.array(problem.maximized, dtype=bool),
+        ))
+
+
+def load_solved(key, directory=None):
+    """Loads a solved custom problem.
+
+    :param key: The key of the problem, see problem_key
+    :param directory: Where the problem is stored, defaults to
+    NAUTILUS_SOLVED_DIR
+    :returns: The solved problem or None if it has not been solved
+    :rtype: SolvedProblem
+
+    """
+    try:
+        with np.load(_solved_path(key, directory)) as data:
+            meta = {
+                "objectives": data["objectives"].tolist(),
+                "maximized": data["maximized"].tolist(),
+                }
+            return SolvedProblem(key, data["pareto"], data["ideal"],
+                                 data["nadir"], meta)
+    except FileNotFoundError:
+        return None
+
+
+def solve_custom(problem, key, directory=None):
+    """Returns the solved custom problem stored under the key, solving and
+    storing it first if it has not been solved.
+
+    :param problem: An instance of AnalyticalProblem
+    :param key: The key of the problem, see problem_key
+    :param directory: Where the problem is stored, defaults to
+    NAUTILUS_SOLVED_DIR
+    :rtype: SolvedProblem
+
+    """
+    solved = load_solved(key, directory)
+    if solved is None:
+        pareto, ideal, nadir = presolve(problem)
+        save_solved(key, problem, pareto, ideal, nadir, directory)
+        solved = load_solved(key, directory)
+    return solved
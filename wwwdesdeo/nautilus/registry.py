@@ -0,0 +1,99 @@
+"""Registries and modules which are imported only when first used. This keeps
+the heavy dependencies (desdeo, sympy, plotly) from being imported by the
+pages that do not need them, such as the index.
+"""
+import importlib
+import threading
+
+
+def resolve(path):
+    """Imports an object given its path.
+
+    :param path: Str like 'package.module:attribute'
+    :returns: The attribute of the imported module
+
+    """
+    module_name, attr = path.split(":")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+class LazyRegistry():
+    """A read-only dict-like collection of objects given by their import
+    paths. An object is imported (and optionally instantiated) when it is
+    first accessed.
+
+    """
+    def __init__(self, paths, instantiate=False):
+        """Constr
+
+        :param paths: A dict with the names of the entries as keys and the
+        import paths of the entries as values. An entry with the path None is
+        None.
+        :param instantiate: Whether to call the imported objects (once) to
+        get the entries.
+
+        """
+        self.__paths = dict(paths)
+        self.__instantiate = instantiate
+        self.__resolved = {}
+        self.__lock = threading.Lock()
+
+    @property
+    def paths(self):
+        return self.__paths
+
+    def keys(self):
+        return self.__paths.keys()
+
+    def __iter__(self):
+        return iter(self.__paths)
+
+    def __len__(self):
+        return len(self.__paths)
+
+    def __contains__(self, name):
+        return name in self.__paths
+
+    def __getitem__(self, name):
+        path = self.__paths[name]
+        if path is None:
+            return None
+
+        with self.__lock:
+            if name not in self.__resolved:
+                entry = resolve(path)
+                if self.__instantiate:
+                    entry = entry()
+                self.__resolved[name] = entry
+
+            return self.__resolved[name]
+
+    def get(self, name, default=None):
+        if name not in self.__paths:
+            return default
+        return self[name]
+
+    def items(self):
+        return [(name, self[name]) for name in self.__paths]
+
+
+class LazyModule():
+    """A proxy of a module, which is imported on the first attribute access.
+
+    """
+    def __init__(self, name):
+        """Constr
+
+        :param name: The absolute name of the module
+
+        """
+        self.__name = name
+        self.__module = None
+
+    def __getattr__(self, attr):
+        if attr.startswith("_LazyModule__"):
+            # Not yet initialized, e.g. when copied
+            raise AttributeError(attr)
+        if self.__module is None:
+            self.__module = importlib.import_module(self.__name)
+        return getattr(self.__module, attr)
@@ -0,0 +1,181 @@
+"""Speculative iterations. While the decision maker looks at the points of an
+iteration, the next iteration is run in the background for each of the
+points they may select, so that the iteration of the selected point is
+ready when it is submitted (see jobs.submit_iteration).
+
+The CPU spent on the speculations is bounded: they are run on their own pool
+of NAUTILUS_SPECULATION_WORKERS worker processes with a lowered priority, and
+at most NAUTILUS_SPECULATION_SESSIONS sessions are speculated for at once,
+the speculations of the session shown least recently being cancelled first.
+The speculations of a session are also cancelled when one of them is taken
+or when the session leaves the iteration they were made for. A cancelled
+speculation is not run if it has not started yet, otherwise its result is
+discarded.
+
+"""
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+from . import instrumentation
+from .workers import init_worker
+
+
+# The pool is created on the first speculation
+_executor = None
+_executor_lock = threading.Lock()
+
+# The speculations of the latest sessions: session_key: (fingerprint of the
+# view, {preference key: Future of the iteration})
+_sessions = OrderedDict()
+_sessions_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.NAUTILUS_SPECULATION_WORKERS,
+                initializer=init_worker,
+                initargs=(os.environ["DJANGO_SETTINGS_MODULE"],
+                          settings.NAUTILUS_SPECULATION_NICENESS))
+        return _executor
+
+
+def fingerprint(view):
+    """Identifies the iteration a view is at. A speculation is only used for
+    the iteration it was made for.
+
+    :param view: A NautilusView
+    :returns: The fingerprint, or None if the view has no iterations to
+    speculate from
+    :rtype: Tuple
+
+    """
+    history = getattr(view, "history", None)
+    if not history or view.current_iter == 0:
+        return None
+    record = history.record(-1)
+    return (view.current_iter, record.index, record.time)
+
+
+def _preference_key(preference):
+    return tuple(tuple(float(val) for val in part) for part in preference)
+
+
+def _cancel(futures):
+    for future in futures.values():
+        future.cancel()
+
+
+def speculate(session_key, view, iterate):
+    """Starts the next iteration of a view for each of its latest points in
+    the background, unless already started.
+
+    :param session_key: The key of the session of the view
+    :param view: The current view of the session
+    :param iterate: The function running an iteration in a worker process,
+    see jobs.iterate
+    :returns: The number of speculations started
+    :rtype: int
+
+    """
+    if (not settings.NAUTILUS_SPECULATIVE_ITERATIONS
+            or settings.NAUTILUS_SPECULATION_WORKERS <= 0):
+        return 0
+    key = fingerprint(view)
+    if key is None:
+        return 0
+
+    with _sessions_lock:
+        known = _sessions.get(session_key)
+        if known is not None and known[0] == key:
+            _sessions.move_to_end(session_key)
+            return 0
+
+    # Like the selections of method_visual_iteration
+    preferences = list(zip(*view.last_iteration.values()))
+    payload = pickle.dumps(view, pickle.HIGHEST_PROTOCOL)
+    executor = _get_executor()
+    futures = OrderedDict()
+    for preference in preferences:
+        futures.setdefault(_preference_key(preference), executor.submit(
+            iterate, payload, preference, instrumentation.enabled))
+
+    with _sessions_lock:
+        previous = _sessions.pop(session_key, None)
+        _sessions[session_key] = (key, futures)
+        evicted = []
+        while len(_sessions) > settings.NAUTILUS_SPECULATION_SESSIONS:
+            evicted.append(_sessions.popitem(last=False)[1])
+    if previous is not None:
+        _cancel(previous[1])
+    for (_, stale) in evicted:
+        _cancel(stale)
+
+    return len(futures)
+
+
+def take(session_key, view, preference):
+    """Takes the speculated iteration of a view for a preference. The other
+    speculations of the session are cancelled.
+
+    :param session_key: The key of the session of the view
+    :param view: The current view of the session
+    :param preference: The preference passed to the view's iterate
+    :returns: The Future of the iteration, with the result of jobs.iterate,
+    or None if it was not speculated
+    :rtype: concurrent.futures.Future
+
+    """
+    with _sessions_lock:
+        known = _sessions.pop(session_key, None)
+    if known is None:
+        return None
+
+    key, futures = known
+    future = None
+    if key == fingerprint(view):
+        try:
+            future = futures.pop(_preference_key(preference), None)
+        except (TypeError, ValueError):
+            # Not a preference given as points
+            pass
+    _cancel(futures)
+
+    if future is None or future.cancelled():
+        return None
+    return future
+
+
+def cancel(session_key):
+    """Cancels the speculations of a session.
+
+    :param session_key: The key of the session
+
+    """
+    with _sessions_lock:
+        known = _sessions.pop(session_key, None)
+    if known is not None:
+        _cancel(known[1])
+
+
+def shutdown():
+    """Cancels every speculation and stops the workers.
+
+    """
+    global _executor
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for (_, futures) in sessions:
+        _cancel(futures)
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
@@ -1,51 +1,343 @@
 """The purpose of these classes and file is to wrap the DESDEO methods in such
 a way that they can be easily and abstractly be used with the views. State is
-maintained in a silly manner at the moment using global variables. This
-probably does not work with multiple users.
-
-TODO: This should probably be done using models instead of the global variables
-after the imports.
+maintained per session: each decision maker has a SessionState which is
+pickled into the database (see models.MethodState), so that any worker
+process can resume an iteration. An in-process LRU cache is kept in front of
+the database.
 
 """
-import models as m
+import copy
+import pickle
+import queue
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from desdeo.core.ResultFactory import BoundsFactory, IterationPointFactory
+from desdeo.optimization import PointSearch
+from desdeo.optimization.OptimizationProblem import (
+    EpsilonConstraintProblem,
+    MaxEpsilonConstraintProblem,
+    NautilusAchievementProblem,
+)
 from desdeo.problem import MOProblem, Variable
-from expression_parser import parse
 
+from . import checkpoints
+from . import expression_parser
+from . import instrumentation
+from . import models as m
+from . import parallel
+from . import presolve
 
-# These variables are used to maintain state between views.
-# TODO: Use models?
 
-# The currently active view
-current_view = None
+class SessionState():
+    """The state maintained between views for a single decision maker.
 
-# Expressions inputted by the user
-current_expressions = None
-# Example:
-# __example_valid = [
-#     {'expression': 'x + y + z', 'lower_bound': -50.0, 'upper_bound': 50.0},
-#     {'expression': 'x - z', 'lower_bound': -33.0, 'upper_bound': 40.0},
-#     ]
+    """
+    def __init__(self):
+        # The currently active view
+        self.current_view = None
+
+        # Expressions inputted by the user, parsed
+        # Example:
+        # __example_valid = [
+        #     {'expression': 'x + y + z', 'lower_bound': -50.0,
+        #      'upper_bound': 50.0},
+        #     {'expression': 'x - z', 'lower_bound': -33.0,
+        #      'upper_bound': 40.0},
+        #     ]
+        self.current_expressions = None
+
+        # The expressions as sympy object
+        self.current_sympy_exprs = None
+
+        # The current variables present in the expressions as symbols
+        self.current_symbols = None
+
+        # Info on the variables (upper, lower, curr) for analytical problems
+        # Example:
+        # __example_variables = [
+        #     {'x_lower_bound': 0, 'x_upper_bound': 10, 'x_initial_value': 5},
+        #     {'y_lower_bound': -5, 'y_upper_bound': 5,
+        #      'y_initial_value': 0.1},
+        #     ]
+        self.current_variables = None
+
+        # The selected optimizer (relevant when an analytical problem in
+        # inputted)
+        self.optimizer = None
+
+        # The selected method (relevant when an analytical problem is
+        # inputted)
+        self.method = None
+
+        # Identifies the current view, renewed when another view is chosen
+        self.view_id = None
+
+        # The id of the background job iterating the current view, see jobs
+        self.pending_job = None
+
+        # The id and error message of the last failed job
+        self.failed_job = None
+        self.job_error = None
+
+        # The one-time token allowing the browser to stream the next
+        # iteration, see views.method_visual_iteration_stream
+        self.stream_token = None
+
+    def replace_view(self, view):
+        """Makes another view current. The jobs of the previous view are
+        abandoned: the session does not wait for them and their outcome is
+        not saved.
+
+        :param view: The new current view
 
-# The expressions as sympy object
-current_sympy_exprs = None
+        """
+        self.current_view = view
+        self.view_id = uuid.uuid4().hex
+        self.pending_job = None
+        self.failed_job = None
+        self.job_error = None
+        self.stream_token = None
+
+
+class StateStore():
+    """Stores the SessionStates in the database, keyed by the session. The most
+    recently used states are also kept in-process. A cached state is used only
+    if its version matches the version stored in the session of the request,
+    otherwise it is loaded from the database. With NAUTILUS_CHECKPOINTS, the
+    states are also checkpointed on disk and resumed from there when missing
+    from the database, see checkpoints.
 
-# The current variables present in the expressions as symbols
-current_symbols = None
+    """
+    def __init__(self, maxsize=128):
+        """Constr
+
+        :param maxsize: The maximum number of states kept in-process.
+
+        """
+        self.__maxsize = maxsize
+        self.__entries = OrderedDict()  # session_key: (version, state)
+        # session_key: when the state was last checkpointed
+        self.__checkpointed = OrderedDict()
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def dumps(state):
+        return zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL))
+
+    @staticmethod
+    def loads(payload):
+        return pickle.loads(zlib.decompress(payload))
+
+    def __remember(self, session_key, version, state):
+        with self.__lock:
+            self.__entries[session_key] = (version, state)
+            self.__entries.move_to_end(session_key)
+            while len(self.__entries) > self.__maxsize:
+                self.__entries.popitem(last=False)
+
+    def load(self, session_key, version=None):
+        """Loads the state of a session.
+
+        :param session_key: The key of the session
+        :param version: The version of the state known to be the latest. If
+        the in-process copy has a different version, the database is queried.
+        :returns: The version and state of the session. A fresh state with
+        version 0 if nothing has been stored yet.
+        :rtype: Tuple[int, SessionState]
+
+        """
+        with self.__lock:
+            entry = self.__entries.get(session_key)
+            if entry is not None and entry[0] == version:
+                self.__entries.move_to_end(session_key)
+                return entry
+
+        row = m.MethodState.objects.filter(session_key=session_key).first()
+        if row is None:
+            return self.__resume(session_key)
+
+        state = self.loads(bytes(row.payload))
+        self.__remember(session_key, row.version, state)
+        return row.version, state
+
+    def __resume(self, session_key):
+        """Resumes a state missing from the database from its latest
+        checkpoint, if any.
+
+        """
+        state = self.restore(session_key)
+        if state is None:
+            return 0, SessionState()
+        return self.save(session_key, state), state
+
+    def restore(self, session_key):
+        """Reads the state of a session from its latest checkpoint, without
+        storing it.
+
+        :param session_key: The key of the session
+        :returns: The state, or None if there is no checkpoint of the session
+        or NAUTILUS_CHECKPOINTS is off
+        :rtype: SessionState
+
+        """
+        checkpoint = None
+        if settings.NAUTILUS_CHECKPOINTS:
+            checkpoint = checkpoints.latest(session_key)
+        if checkpoint is None:
+            return None
+
+        state = self.loads(checkpoint[1])
+        # The jobs running when the checkpoint was written are lost
+        state.pending_job = None
+        return state
+
+    def __checkpoint(self, session_key, version, payload):
+        now = time.monotonic()
+        with self.__lock:
+            last = self.__checkpointed.get(session_key)
+            if (last is not None and
+                    now - last < settings.NAUTILUS_CHECKPOINT_INTERVAL):
+                return
+            self.__checkpointed[session_key] = now
+            self.__checkpointed.move_to_end(session_key)
+            while len(self.__checkpointed) > self.__maxsize:
+                self.__checkpointed.popitem(last=False)
+
+        checkpoints.write(session_key, version, payload)
+
+    def save(self, session_key, state):
+        """Saves the state of a session.
+
+        :param session_key: The key of the session
+        :param state: The SessionState to be saved
+        :returns: The new version of the state
+        :rtype: int
+
+        """
+        payload = self.dumps(state)
+        rows = m.MethodState.objects.filter(session_key=session_key)
+        with transaction.atomic():
+            # Write before reading: SQLite cannot upgrade the lock of a
+            # transaction that has read, and fails it when sessions collide
+            if not rows.update(version=F("version") + 1, payload=payload):
+                try:
+                    with transaction.atomic():
+                        m.MethodState.objects.create(
+                            session_key=session_key, version=1,
+                            payload=payload)
+                except IntegrityError:
+                    # Created by a concurrent request
+                    rows.update(version=F("version") + 1, payload=payload)
+            version = rows.values_list("version", flat=True).get()
+
+        self.__remember(session_key, version, state)
+        if settings.NAUTILUS_CHECKPOINTS:
+            self.__checkpoint(session_key, version, payload)
+        return version
+
+    def replace(self, session_key, version, state):
+        """Saves the state of a session unless it has been saved since it was
+        loaded. Of the concurrent requests changing the same version of a
+        state, only one succeeds.
+
+        :param session_key: The key of the session
+        :param version: The version of the state as loaded
+        :param state: The SessionState to be saved
+        :returns: The new version of the state, or None if the stored state
+        is not at the given version anymore
+        :rtype: int
+
+        """
+        payload = self.dumps(state)
+        rows = m.MethodState.objects.filter(session_key=session_key,
+                                            version=version)
+        if not rows.update(version=F("version") + 1, payload=payload):
+            return None
+        version += 1
+
+        self.__remember(session_key, version, state)
+        if settings.NAUTILUS_CHECKPOINTS:
+            self.__checkpoint(session_key, version, payload)
+        return version
+
+    def discard(self, session_key):
+        """Removes the state of a session.
+
+        """
+        with self.__lock:
+            self.__entries.pop(session_key, None)
+            self.__checkpointed.pop(session_key, None)
+        m.MethodState.objects.filter(session_key=session_key).delete()
+        if settings.NAUTILUS_CHECKPOINTS:
+            checkpoints.remove(session_key)
+
+
+# The store shared by the views in this process
+store = StateStore()
+
+# The key of the state version in the session
+_version_key = "nautilus_state_version"
 
-# Info on the variables
-# Example:
-# __example_variables = [
-#     {'x_lower_bound': 0, 'x_upper_bound': 10, 'x_initial_value': 5},
-#     {'y_lower_bound': -5, 'y_upper_bound': 5, 'y_initial_value': 0.1},
-#     {'z_lower_bound': 15, 'z_upper_bound': 20, 'z_initial_value': 17.5},
-#     ]
-current_variables = None  # For analytical problems (upper, lower, curr)
 
-# The selected optimizer (relevant when an analytical problem in inputted)
-optimizer = None
+def load_state(request):
+    """Loads the state of the decision maker issuing the request.
 
-# The selected method (relevant when an analytical problem is inputted)
-method = None
+    :param request: A request with a session
+    :returns: The state of the session
+    :rtype: SessionState
+
+    """
+    # The session is loaded first: its key is None if the session is missing
+    # from the database
+    version = request.session.get(_version_key)
+    session_key = request.session.session_key
+    if session_key is None:
+        return _resume_state(request)
+
+    version, state = store.load(session_key, version)
+    request.session[_version_key] = version
+    return state
+
+
+def _resume_state(request):
+    """Resumes the state of a session lost with the database, for example
+    after a deploy, from the checkpoints of the key in its cookie. Django
+    does not reuse the lost key, so the state is moved to a new session.
+
+    """
+    lost_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    state = None if lost_key is None else store.restore(lost_key)
+    if state is None:
+        return SessionState()
+
+    request.session.save()
+    request.session[_version_key] = store.save(request.session.session_key,
+                                               state)
+    store.discard(lost_key)
+    return state
+
+
+def save_state(request, state):
+    """Saves the state of the decision maker issuing the request.
+
+    :param request: A request with a session
+    :param state: The SessionState to be saved
+
+    """
+    if request.session.session_key is None:
+        # Make sure that the session exists
+        request.session.save()
+
+    request.session[_version_key] = store.save(request.session.session_key,
+                                               state)
 
 
 class AnalyticalProblem(MOProblem):
@@ -53,7 +345,8 @@ class AnalyticalProblem(MOProblem):
     problems.
 
     """
-    def __init__(self, objectives, symbols, variables):
+    def __init__(self, objectives, symbols, variables, profile=False,
+                 parallel=False, fused=False, jacobian=None):
         """Constr
 
         :param objectives: like [callable objective function, min value,
@@ -61,17 +354,38 @@ class AnalyticalProblem(MOProblem):
         :param symbols: list containing the symbols present in the objectives
         :param variables: [{'symbol'_min_value, 'symbol'_max_value,
         'symbol'_initial_value}]
+        :param profile: Whether to profile the evaluations, see the
+        property profile
+        :param parallel: Whether to evaluate populations of at least
+        NAUTILUS_PARALLEL_MIN_POPULATION vectors on a pool of worker
+        processes, see parallel. The workers evaluate the objectives one by
+        one, also if fused.
+        :param fused: Whether to evaluate every objective at once with a
+        single kernel sharing the common subexpressions, see
+        expression_parser.fuse. With parallel, only the populations not
+        evaluated on the pool.
+        :param jacobian: The Jacobian of the objectives if compiled already
+        (see expression_parser.parse), otherwise it is compiled when first
+        needed
 
         """
         __nobj = len(objectives)
         # TODO: Handle no bounds
         # TODO: objective funcions names
         # TODO: maximize or minimize?
-        self.__objectives = [e[0] for e in objectives]
+        self.__objectives = [e[0].bind(symbols) for e in objectives]
         # The ideal and nadir are the objective bounds
         __ideal = [e[1] for e in objectives]
         __nadir = [e[2] for e in objectives]
         self.__symbols = symbols
+        self.__profile = (instrumentation.EvaluationProfile(__nobj)
+                          if profile else None)
+        self.__parallel = parallel
+        self.__kernel = (expression_parser.fuse(self.__objectives, symbols)
+                         if fused else None)
+        self.__jacobian = jacobian
+        # Why the objectives could not be differentiated, see jacobian
+        self.__jacobian_error = None
         super().__init__(
             nobj=__nobj,
             ideal=__ideal,
@@ -92,6 +406,53 @@ class AnalyticalProblem(MOProblem):
                                         starting_point=start))
         self.add_variables(vars_to_add)
 
+    @property
+    def compiled_objectives(self):
+        """The CompiledObjectives of the problem, bound to the symbols.
+
+        """
+        return self.__objectives
+
+    @property
+    def symbols(self):
+        return self.__symbols
+
+    def jacobian(self, population):
+        """Evaluate the Jacobian of the objectives for a whole population at
+        once.
+
+        :param population: A 2-D array-like with one input vector per row.
+        The columns must be in the same order as the symbols.
+        :returns: The partial derivatives of each objective (rows) with
+        respect to each variable (columns), for each input vector
+        :rtype: numpy.ndarray of shape (n_pop, n_obj, n_var)
+        :raises ExpressionException: If the objectives cannot be
+        differentiated
+
+        """
+        if self.__jacobian_error is not None:
+            # Not derived again on each call
+            raise expression_parser.ExpressionException(
+                self.__jacobian_error)
+        if self.__jacobian is None:
+            try:
+                self.__jacobian = expression_parser.jacobian(
+                    self.__objectives, self.__symbols)
+            except expression_parser.ExpressionException as e:
+                self.__jacobian_error = str(e)
+                raise
+        population = np.atleast_2d(np.asarray(population, dtype=float))
+        return self.__jacobian(population.T)
+
+    @property
+    def profile(self):
+        """The instrumentation.EvaluationProfile of the problem, or None if the
+        evaluations are not profiled.
+
+        """
+        return self.__profile
+
+    @instrumentation.timed("evaluate")
     def evaluate(self, population):
         """Evaluate the problem with given variable values.
 
@@ -102,11 +463,71 @@ class AnalyticalProblem(MOProblem):
         :rtype: List[List[Float]]
 
         """
-        res = []
-        for values in population:
-            sdict = dict(zip((key for key in self.__symbols), values))
-            res.append(list(map(lambda obj: obj(sdict), self.__objectives)))
+        return self.evaluate_batch(population).tolist()
+
+    def evaluate_batch(self, population):
+        """Evaluate the whole population at once. Each objective is called
+        only once with the columns of the population as its arguments.
+
+        :param population: A 2-D array-like with one input vector per row.
+        The columns must be in the same order as the symbols.
+        :returns: The objective values with one row per input vector and one
+        column per objective.
+        :rtype: numpy.ndarray of shape (n_pop, n_obj)
 
+        """
+        population = np.atleast_2d(np.asarray(population, dtype=float))
+        n_pop = population.shape[0]
+        if instrumentation.enabled:
+            instrumentation.count_evaluations(n_pop)
+        # One row per symbol, in the order the objectives are bound to
+        columns = population.T
+
+        if (self.__parallel
+                and n_pop >= settings.NAUTILUS_PARALLEL_MIN_POPULATION
+                and parallel.available()):
+            if self.__profile is not None:
+                return self.__evaluate_profiled_jointly(
+                    parallel.evaluate, self.__objectives, population)
+            return parallel.evaluate(self.__objectives, population)
+
+        res = np.empty((n_pop, len(self.__objectives)))
+        if self.__kernel is not None:
+            if self.__profile is not None:
+                return self.__evaluate_profiled_jointly(
+                    self.__kernel, columns, res)
+            return self.__kernel(columns, res)
+
+        if self.__profile is not None:
+            return self.__evaluate_profiled(columns, res)
+
+        for (ind, obj) in enumerate(self.__objectives):
+            # Constant objectives return a scalar, which is broadcast here
+            res[:, ind] = obj.call_ordered(columns)
+
+        return res
+
+    def __evaluate_profiled(self, columns, res):
+        self.__profile.record_batch(res.shape[0])
+        for (ind, obj) in enumerate(self.__objectives):
+            start = time.perf_counter()
+            res[:, ind] = obj.call_ordered(columns)
+            self.__profile.record_call(
+                ind, time.perf_counter() - start, res.shape[0])
+
+        return res
+
+    def __evaluate_profiled_jointly(self, evaluate, *args):
+        """Profiles an evaluation of every objective at once, see
+        EvaluationProfile.record_joint_call. The result of evaluate(*args)
+        has one row per evaluated vector.
+
+        """
+        start = time.perf_counter()
+        res = evaluate(*args)
+        self.__profile.record_batch(res.shape[0])
+        self.__profile.record_joint_call(
+            time.perf_counter() - start, res.shape[0])
         return res
 
 
@@ -127,15 +548,24 @@ class NautilusView():
         :param optimizer: Optimizer routine. Must be defined in
         available_optimizers_d
         :param problem: Pre-set or custom problem. Pre-sets must be defined in
-        problems_d.
+        problems_d. Pre-sets that have been presolved (see presolve), and
+        presolved problems, are iterated over their Pareto front sample using
+        PointSearch instead of the given optimizer.
 
         """
         _method = m.available_methods_d[method]
         _optimizer = m.available_optimizers_d[optimizer]
         if isinstance(problem, str):
-            _problem = m.problems_d[problem]
+            # Use the presolved Pareto front of the problem if available
+            _problem = presolve.load(problem)
+            if _problem is not None:
+                _optimizer = PointSearch
+            else:
+                _problem = m.problems_d[problem]
         else:
             _problem = problem
+            if isinstance(_problem, presolve.PresolvedProblem):
+                _optimizer = PointSearch
 
         self.__problem = _problem
         self.__method = _method(_problem, _optimizer)
@@ -150,6 +580,36 @@ class NautilusView():
         self.__last_iteration = None
         self.__help = None
 
+    # The result factories of the desdeo methods. Their optimization problems
+    # hold lambdas, which cannot be pickled, so the factories are not pickled
+    # with the view but built again when it is unpickled.
+    _factories = ("fh_factory", "upper_bounds_factory", "lower_bounds_factory")
+
+    def _build_factories(self):
+        """Builds the result factories of the method like desdeo's NAUTILUS
+        does. The factories hold no state between the iterations.
+
+        """
+        method = self.__method
+        method.fh_factory = IterationPointFactory(method.method_class(
+            NautilusAchievementProblem(method.problem)))
+        method.upper_bounds_factory = BoundsFactory(method.method_class(
+            MaxEpsilonConstraintProblem(method.problem)))
+        method.lower_bounds_factory = BoundsFactory(method.method_class(
+            EpsilonConstraintProblem(method.problem)))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        method = copy.copy(self.__method)
+        for name in self._factories:
+            method.__dict__.pop(name, None)
+        state["_NautilusView__method"] = method
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build_factories()
+
     @property
     def method(self):
         return self.__method
@@ -243,6 +703,140 @@ class NautilusView():
         self.__help = val
 
 
+class IterationRecord():
+    """The metadata of one iteration kept in an IterationHistory.
+
+    """
+    __slots__ = ("index", "n_points", "preference", "time")
+
+    def __init__(self, index, n_points, preference, time):
+        """Constr
+
+        :param index: The index of the iteration, starting from 0
+        :param n_points: The number of points generated on the iteration
+        :param preference: The preference the iteration was made with
+        :param time: When the iteration was made, in seconds since the epoch
+
+        """
+        self.index = index
+        self.n_points = n_points
+        self.preference = preference
+        self.time = time
+
+
+class IterationHistory():
+    """The points generated on each iteration of a session, kept in arrays of
+    shape (iterations, Ns, nobj) for the preferred points and the lower
+    bounds. The arrays are preallocated for the iterations of the session and
+    grow if more are made. Rows of iterations with fewer than Ns points are
+    padded with NaN.
+
+    """
+    def __init__(self, iterations, n_points, nobj):
+        """Constr
+
+        :param iterations: The number of iterations to allocate for
+        :param n_points: The number of points generated on each iteration
+        :param nobj: The number of objectives
+
+        """
+        shape = (max(1, iterations), max(1, n_points), nobj)
+        self.__preferred = np.full(shape, np.nan)
+        self.__lower_bounds = np.full(shape, np.nan)
+        self.__records = []
+
+    def __len__(self):
+        return len(self.__records)
+
+    def __grow(self, iterations, n_points):
+        old = self.__preferred.shape
+        shape = (max(iterations, old[0]), max(n_points, old[1]), old[2])
+        for name in ("_IterationHistory__preferred",
+                     "_IterationHistory__lower_bounds"):
+            grown = np.full(shape, np.nan)
+            grown[:old[0], :old[1]] = getattr(self, name)
+            setattr(self, name, grown)
+
+    def append(self, preferred_points, lower_bounds, preference=None):
+        """Adds the points of a new iteration.
+
+        :param preferred_points: The preferred points, one per row
+        :param lower_bounds: The lower bounds of the preferred points
+        :param preference: The preference the iteration was made with
+        :returns: The record of the iteration
+        :rtype: IterationRecord
+
+        """
+        index = len(self.__records)
+        n_points = len(preferred_points)
+        if (index >= self.__preferred.shape[0]
+                or n_points > self.__preferred.shape[1]):
+            self.__grow(2 * self.__preferred.shape[0], n_points)
+
+        self.__preferred[index] = np.nan
+        self.__lower_bounds[index] = np.nan
+        if n_points:
+            self.__preferred[index, :n_points] = preferred_points
+            self.__lower_bounds[index, :n_points] = lower_bounds
+
+        record = IterationRecord(index, n_points, preference, time.time())
+        self.__records.append(record)
+        return record
+
+    def pop(self):
+        """Removes the latest iteration.
+
+        :returns: The record of the removed iteration
+        :rtype: IterationRecord
+
+        """
+        return self.__records.pop()
+
+    def record(self, index):
+        """The record of an iteration. Negative indices count from the latest
+        iteration.
+
+        :rtype: IterationRecord
+
+        """
+        return self.__records[index]
+
+    def preferred_points(self, index):
+        """The preferred points of an iteration, as a read-only view.
+
+        :rtype: numpy.ndarray of shape (n_points, nobj)
+
+        """
+        record = self.__records[index]
+        points = self.__preferred[record.index, :record.n_points]
+        points.flags.writeable = False
+        return points
+
+    def lower_bounds(self, index):
+        """The lower bounds of the preferred points of an iteration, as a
+        read-only view.
+
+        :rtype: numpy.ndarray of shape (n_points, nobj)
+
+        """
+        record = self.__records[index]
+        bounds = self.__lower_bounds[record.index, :record.n_points]
+        bounds.flags.writeable = False
+        return bounds
+
+    def results(self, index):
+        """The points of an iteration in the format returned by
+        ENautilusView.iterate.
+
+        :rtype: Dict[str, List[List[float]]]
+
+        """
+        return {
+            "preferred_point": self.preferred_points(index).tolist(),
+            "lower_bounds": self.lower_bounds(index).tolist(),
+            }
+
+
 class ENautilusView(NautilusView):
     """Specialization of the NautilusView class for the Enhanced NAUTILUS method.
 
@@ -270,7 +864,9 @@ class ENautilusView(NautilusView):
             "lower_bounds",
             ]
         self.last_iteration = None
-        self.__total_points_returned = 0
+        self.__history = IterationHistory(
+            self.user_iters, self.n_generated_points, len(self.nadir))
+        self.__wrap_bounds()
         self.help = {
             "name": "NAUTILUS Enhanced",
             "description": "NAUTILUS enhanced iterates a presolved problem "
@@ -282,6 +878,20 @@ class ENautilusView(NautilusView):
             "unstil a solution on the pareto optimal front in reached."
         }
 
+    def __wrap_bounds(self):
+        # The lower bounds of the generated points are solved as a batch
+        self.__bounds = _BatchedBoundsFactory(self.method.lower_bounds_factory)
+        self.method.lower_bounds_factory = self.__bounds
+
+    def _build_factories(self):
+        super()._build_factories()
+        self.__wrap_bounds()
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state.pop("_ENautilusView__bounds", None)
+        return state
+
     @property
     def user_iters(self):
         return self.__user_iters
@@ -304,6 +914,13 @@ class ENautilusView(NautilusView):
     def n_generated_points(self):
         return self.__n_generated_points
 
+    @property
+    def history(self):
+        """The IterationHistory of the iterations made so far.
+
+        """
+        return self.__history
+
     @n_generated_points.setter
     def n_generated_points(self, val):
         self.__validate_is_positive(val)
@@ -322,9 +939,12 @@ class ENautilusView(NautilusView):
         self.method.user_iters = self.user_iters
         self.method.current_iter = self.user_iters
         self.method.Ns = self.n_generated_points
+        self.__history = IterationHistory(
+            self.user_iters, self.n_generated_points, len(self.nadir))
 
         self.initialized = True
 
+    @instrumentation.timed("iterate")
     def iterate(self, preference=(None, None)):
         """Iterate and return the results in a format that can be shown to the
         DM."""
@@ -333,24 +953,141 @@ class ENautilusView(NautilusView):
         if self.is_first_iteration:
             self.is_first_iteration = False
 
-        results = self.method.next_iteration(
-            preference=preference)
+        self.__bounds.clear()
+        with instrumentation.phase("next_iteration"):
+            results = self.method.next_iteration(
+                preference=preference)
+
+        # The method accumulates the points of every iteration. They are
+        # kept in the history instead, so only the latest points are held by
+        # the method.
+        self.method.zhs = []
+        self.method.zh_los = []
 
         # The dictionary entry labeled by the preference requirements are posed
-        # to the DM as choices. Alwats return the latest points.
-        start = self.__total_points_returned
-        results_d = {
-            "preferred_point": [entry[1] for entry in results[start:]],
-            "lower_bounds": [entry[0] for entry in results[start:]],
-            }
+        # to the DM as choices.
+        self.__history.append([entry[1] for entry in results],
+                              [entry[0] for entry in results],
+                              preference)
+        results_d = self.__history.results(-1)
         self.last_iteration = results_d
-        self.__total_points_returned = len(results)
 
         # Update the underlying method
         self.current_iter = self.method.current_iter
 
         return results_d
 
+    @property
+    def can_step_back(self):
+        return len(self.__history) > 1
+
+    def step_back(self):
+        """Discards the latest iteration and shows the points of the previous
+        one again. Nothing is optimized again, the next iteration is made
+        from the point selected among the points of the previous iteration.
+
+        :returns: The points of the previous iteration, like iterate
+        :raises ValueError: If there is no previous iteration
+
+        """
+        if not self.can_step_back:
+            raise ValueError("There is no previous iteration")
+
+        self.__history.pop()
+        self.last_iteration = self.__history.results(-1)
+        self.method.current_iter += 1
+        self.current_iter = self.method.current_iter
+
+        return self.last_iteration
+
+    def iterate_stream(self, preference=(None, None)):
+        """Iterate like iterate, but yield each generated point as soon as it
+        is available. The iteration is run in a separate thread. If the
+        generator is closed early, the iteration is still finished.
+
+        :param preference: The preference passed to iterate
+        :returns: A generator of dicts with the preferred point and the lower
+        bounds of one generated point
+
+        """
+        points = queue.Queue()
+        done = object()
+        failure = []
+        factory = self.method.lower_bounds_factory
+
+        def run():
+            try:
+                self.iterate(preference)
+            except Exception as e:
+                failure.append(e)
+            finally:
+                points.put(done)
+
+        self.method.lower_bounds_factory = _NotifyingFactory(
+            factory, self.method, points)
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        try:
+            while True:
+                point = points.get()
+                if point is done:
+                    break
+                yield {"preferred_point": point[1], "lower_bounds": point[0]}
+        finally:
+            thread.join()
+            self.method.lower_bounds_factory = factory
+
+        if failure:
+            raise failure[0]
+
+
+class _BatchedBoundsFactory():
+    """Wraps the lower bounds factory of ENAUTILUS to solve the lower bounds
+    of the Ns generated points of an iteration as a batch. The method asks
+    for the bound of each point separately, but every bound is computed from
+    the same previous iteration point, so the nobj epsilon constraint
+    subproblems are solved once per distinct point and the bound is shared.
+    The solved bounds are kept until cleared, which is done on each
+    iteration.
+
+    """
+    def __init__(self, factory):
+        self.__factory = factory
+        self.__bounds = {}  # previous point: lower bound
+
+    @property
+    def optimization_method(self):
+        return self.__factory.optimization_method
+
+    def clear(self):
+        self.__bounds.clear()
+
+    def result(self, prev_point, *args):
+        key = (tuple(prev_point),) + args
+        bound = self.__bounds.get(key)
+        if bound is None:
+            with instrumentation.phase("lower_bounds"):
+                bound = list(self.__factory.result(prev_point, *args))
+            self.__bounds[key] = bound
+        return list(bound)
+
+
+class _NotifyingFactory():
+    """Wraps the lower bounds factory of ENAUTILUS to report each generated
+    point as soon as its lower bound has been computed. The method appends
+    the point to zhs just before computing the bound.
+
+    """
+    def __init__(self, factory, method, points):
+        self.__factory = factory
+        self.__method = method
+        self.__points = points
+
+    def result(self, *args, **kwargs):
+        bound = self.__factory.result(*args, **kwargs)
+        self.__points.put((list(bound), list(self.__method.zhs[-1])))
+        return bound
+
 
 # Collect and export the available methods.
 available_method_views_d = {
@@ -0,0 +1,21 @@
+/* The interval between two status queries in milliseconds */
+const pollInterval = 500;
+
+$(document).ready(() => {
+    /* Poll the status of the iteration running in the background and move
+       on once it has finished.
+     */
+    if (typeof statusUrl !== 'undefined') {
+	poll();
+    }
+});
+
+function poll() {
+    $.getJSON(statusUrl, data => {
+	if (data.status === 'done' || data.status === 'failed') {
+	    window.location.href = data.redirect;
+	} else {
+	    setTimeout(poll, pollInterval);
+	}
+    });
+}
@@ -1,7 +1,50 @@
 $(document).ready(() => {
-    /* Create a click handler that works with bar graphs. On click, send the 
-       solution corresponding to he graph(s) as a post request back to the backend.
+    /* Draw the chart from the data served by the backend, if the chart was
+       not rendered by the backend already. Without data, the first iteration
+       is streamed into an empty chart.
      */
+    if (typeof visualizationDataUrl !== 'undefined') {
+	$.getJSON(visualizationDataUrl, chartData => {
+	    Plotly.newPlot(chartData.div_id, ...barsGraph(chartData))
+		.then(addClickHandler);
+	});
+    } else if (typeof visualizationStreamUrl !== 'undefined') {
+	Plotly.newPlot(visualizationDivId, ...barsGraph({values: [], barmode: 'relative'}))
+	    .then(addClickHandler)
+	    .then(() => streamIteration(null));
+    } else {
+	addClickHandler();
+    }
+});
+
+/* Forms the traces and layout of a bar chart from compact chart data, see
+   visualization.bars_graph_data. Mirrors visualization.bars_graph.
+*/
+function barsGraph(chartData) {
+    const solutionNums = chartData.values.map((_, ind) => ind + 1);
+    const nObjectives = chartData.values.length ? chartData.values[0].length : 0;
+    const data = [];
+    for (let obj = 0; obj < nObjectives; obj++) {
+	data.push({
+	    x: solutionNums,
+	    y: chartData.values.map(row => row[obj]),
+	    name: 'Objective ' + (obj + 1),
+	    type: 'bar',
+	});
+    }
+    const layout = {
+	xaxis: {title: 'Solutions', tick0: 1, dtick: 1},
+	yaxis: {title: 'Objective values'},
+	barmode: chartData.barmode,
+	title: 'Relative Barmode',
+    };
+    return [data, layout];
+}
+
+/* Create a click handler that works with bar graphs. On click, send the
+   solution corresponding to he graph(s) as a post request back to the backend.
+*/
+function addClickHandler() {
     if (visualizationDivId) {
 	var myPlot = document.getElementById(visualizationDivId);
 	if (myPlot) {
@@ -12,11 +55,50 @@ $(document).ready(() => {
 		// for (var i=0; i < data.points.length; i++) {
 		//     preference.push(data.points[i].y);
 		// }
-		post({selection: index});
+		if (typeof visualizationStreamUrl !== 'undefined') {
+		    streamIteration(index);
+		} else {
+		    post({selection: index});
+		}
 	    });
 	}
     }
-});
+}
+
+/* Runs the next iteration from the selected solution, growing the chart as
+   each generated point is streamed by the backend. The URL holds a one-time
+   token, the URL of the next iteration is given by the last event. See
+   views.method_visual_iteration_stream.
+*/
+function streamIteration(selection) {
+    const url = new URL(visualizationStreamUrl, window.location.href);
+    if (selection !== null) {
+	url.searchParams.set('selection', selection);
+    }
+    const values = [];
+    const source = new EventSource(url);
+    source.addEventListener('point', event => {
+	values.push(JSON.parse(event.data).preferred_point);
+	Plotly.react(visualizationDivId,
+		     ...barsGraph({values: values, barmode: 'relative'}));
+    });
+    source.addEventListener('done', event => {
+	source.close();
+	const done = JSON.parse(event.data);
+	if (done.redirect) {
+	    window.location = done.redirect;
+	} else {
+	    visualizationStreamUrl = done.stream_url;
+	    $('#current-iteration').text(done.current_iteration);
+	    $('#total-iterations').text(done.total_iterations);
+	}
+    });
+    source.onerror = () => {
+	// Do not reconnect, which would run another iteration
+	source.close();
+	window.location.reload();
+    };
+}
 
 /* Accesses the rendered 'iteration-response-form' and creates field in it with 
    the contents of params. 
@@ -37,5 +119,3 @@ function post(params, method='post') {
     document.body.appendChild(form);
     form.submit();
 }		  
-
-
@@ -1,14 +1,52 @@
+import io
+import json
+import os
+import pickle
+import subprocess
+import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor
 from functools import reduce
+from unittest import mock
 
-from django.test import TestCase, tag
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings, tag
+from django.urls import reverse
+import numpy as np
+from desdeo.optimization.OptimizationProblem import (
+    EpsilonConstraintProblem, MaxEpsilonConstraintProblem)
+from desdeo.problem import MOProblem, Variable
+from sympy import srepr, sympify
 from .stateful_view import (ENautilusView,
                             NautilusView,
                             AnalyticalProblem,
+                            SessionState,
+                            StateStore,
                             )
+from . import benchmarks
+from . import checkpoints
+from . import instrumentation
+from . import jobs
+from . import optimizers
+from . import parallel
+from . import presolve
+from . import speculation
+from . import workers
+from .visualization import (bars_div_id,
+                            bars_graph_data,
+                            RenderCache,
+                            values_key,
+                            )
+from . import stateful_view as sf
+from .models import MethodState
 from .expression_parser import (exprs_to_lambda,
+                                fuse,
                                 free_symbols_dict,
                                 parse,
+                                parse_expression,
                                 ExpressionException,
+                                CompiledCache,
                                 )
 
 
@@ -130,6 +168,97 @@ class ENautilusView_test(TestCase):
         self.assertEqual(c.current_iter, 9)
         self.assertFalse(c.is_first_iteration)
 
+    def test_batched_bounds(self):
+        """ Test that the lower bounds of the points generated on an iteration
+        are solved once and shared
+        """
+        c = ENautilusView()
+        c.initialize(**{"User iterations": 3,
+                        "Number of generated points": 5})
+        first = c.iterate()
+        # River Pollution may reach fewer points than asked for
+        self.assertEqual(len(first["lower_bounds"]),
+                         len(first["preferred_point"]))
+        for bound in first["lower_bounds"]:
+            self.assertEqual(bound, first["lower_bounds"][0])
+
+        # The bounds are solved again on the next iteration
+        preference = (first["preferred_point"][1], first["lower_bounds"][1])
+        second = c.iterate(preference)
+        for bound in second["lower_bounds"]:
+            self.assertEqual(bound, second["lower_bounds"][0])
+        self.assertNotEqual(second["lower_bounds"][0],
+                            first["lower_bounds"][0])
+
+        calls = []
+
+        class Factory():
+            def result(self, prev_point):
+                calls.append(prev_point)
+                return [sum(prev_point)] * len(prev_point)
+
+        factory = sf._BatchedBoundsFactory(Factory())
+        self.assertEqual(factory.result([1.0, 2.0]), [3.0, 3.0])
+        self.assertEqual(factory.result([1.0, 2.0]), [3.0, 3.0])
+        self.assertEqual(factory.result([2.0, 2.0]), [4.0, 4.0])
+        self.assertEqual(len(calls), 2)
+        factory.clear()
+        factory.result([1.0, 2.0])
+        self.assertEqual(len(calls), 3)
+
+    def test_history(self):
+        """ Test that the iterations are kept in the history and that the view
+        can step back to a previous iteration
+        """
+        c = ENautilusView()
+        c.initialize(**{"User iterations": 3,
+                        "Number of generated points": 4})
+        self.assertFalse(c.can_step_back)
+        first = c.iterate()
+        preference = (first["preferred_point"][1], first["lower_bounds"][1])
+        second = c.iterate(preference)
+        # The points are held by the history only
+        self.assertEqual(c.method.zhs, [])
+        self.assertEqual(c.method.zh_los, [])
+
+        self.assertEqual(len(c.history), 2)
+        self.assertEqual(c.history.preferred_points(0).shape,
+                         (4, len(c.nadir)))
+        self.assertEqual(c.history.preferred_points(0).tolist(),
+                         first["preferred_point"])
+        self.assertEqual(c.history.lower_bounds(-1).tolist(),
+                         second["lower_bounds"])
+        self.assertEqual(c.history.record(1).preference, preference)
+        self.assertEqual(c.current_iter, 1)
+
+        self.assertTrue(c.can_step_back)
+        self.assertEqual(c.step_back(), first)
+        self.assertEqual(c.last_iteration, first)
+        self.assertEqual(len(c.history), 1)
+        self.assertEqual(c.current_iter, 2)
+        self.assertEqual(c.method.current_iter, 2)
+        with self.assertRaises(ValueError):
+            c.step_back()
+
+        for _ in range(2):
+            c.iterate(preference)
+        self.assertEqual(len(c.history), 3)
+        self.assertEqual(c.current_iter, 0)
+        restored = pickle.loads(pickle.dumps(c))
+        self.assertEqual(restored.history.results(0), first)
+
+        # More iterations or points than allocated grow the history
+        history = sf.IterationHistory(1, 2, 2)
+        history.append([[1.0, 2.0]], [[0.0, 0.0]])
+        history.append([[3.0, 4.0]] * 3, [[1.0, 1.0]] * 3)
+        self.assertEqual(history.record(1).n_points, 3)
+        self.assertEqual(history.results(0), {
+            "preferred_point": [[1.0, 2.0]],
+            "lower_bounds": [[0.0, 0.0]],
+            })
+        self.assertEqual(history.preferred_points(1).tolist(),
+                         [[3.0, 4.0]] * 3)
+
     def test_last_iteration(self):
         c = ENautilusView()
         c.initialize()
@@ -199,6 +328,18 @@ class expression_parser_test(TestCase):
         lam, _, _ = exprs_to_lambda(str_input)
         self.assertEqual(lam({"x": 4, "y": 5, "z": 10}), 9)
 
+    def test_call_ordered(self):
+        """ Test the fast path with values ordered like the bound symbols.
+        """
+        lam, _, _ = exprs_to_lambda("x - z")
+        bound = lam.bind(["x", "y", "z"])
+        self.assertAlmostEqual(bound.call_ordered((5, 100, 3)), 2)
+        self.assertAlmostEqual(bound.call_ordered((5, 100, 3)),
+                               bound({"x": 5, "y": 100, "z": 3}))
+
+        with self.assertRaises(ExpressionException):
+            lam.bind(["x", "y"])
+
     def test_too_few_arguments(self):
         """ Test if the expression can handle too few arguments.
         """
@@ -225,6 +366,142 @@ class expression_parser_test(TestCase):
         with self.assertRaises(ExpressionException):
             _ = parse([example[2]])
 
+    def test_parse_jacobian(self):
+        """ Test the Jacobian compiled along the parsed objectives
+        """
+        example = expression_parser_test.__example
+        _, symbols, _, jac = parse(example[0:2], jacobian=True)
+        self.assertEqual(jac.symbols, tuple(symbols))
+        values = {"x": [1.0, 2.0], "y": [3.0, 4.0], "z": [2.0, 4.0]}
+        res = jac([values[sym] for sym in symbols])
+        self.assertEqual(res.shape, (2, 2, 3))
+        col = {sym: ind for (ind, sym) in enumerate(symbols)}
+        # d(y / z - 1)/dz = -y / z**2 and d(x + y)/dx = 1
+        self.assertEqual(res[:, 1, col["z"]].tolist(), [-0.75, -0.25])
+        self.assertEqual(res[:, 0, col["x"]].tolist(), [1.0, 1.0])
+
+        restored = pickle.loads(pickle.dumps(jac))
+        self.assertEqual(restored.sources, jac.sources)
+        self.assertEqual(
+            restored([values[sym] for sym in symbols]).tolist(), res.tolist())
+
+    def test_parse_expression(self):
+        """ Test that the whitelisted syntax gives the same expressions as
+        sympify and that anything else is rejected
+        """
+        for str_input in ["x + y", "y / z - 1", "cos(x*pi) + x**2 - y / "
+                          "sqrt(z) + a*y", "-exp(x) * 2.5 + abs(y)",
+                          "1/2 + x^3"]:
+            self.assertEqual(srepr(parse_expression(str_input)),
+                             srepr(sympify(str_input)))
+
+        for str_input in ["FROM TABLE DROP *", "__import__('os').system('ls')",
+                          "x.real", "x[0]", "lambda: 1", "'x'", "x < y",
+                          "sin", "sin(x, y)", "eval(x)", "2**10**10",
+                          "True + x", ""]:
+            with self.assertRaises(ExpressionException):
+                parse_expression(str_input)
+
+    def test_large_powers(self):
+        """ Test that the powers of numbers are limited by the size of their
+        exact result, also when chained
+        """
+        self.assertEqual(parse_expression("2**1000 * x"),
+                         sympify("2**1000 * x"))
+        self.assertEqual(parse_expression("x**100000"),
+                         sympify("x**100000"))
+        for str_input in ["((2**1000)**1000)**1000",
+                          "((2**1000)**1000)**1000**1000",
+                          "(3*sqrt(2)**1000)**1000", "(1/3**1000)**1000",
+                          "1000000**1000"]:
+            with self.assertRaises(ExpressionException):
+                parse_expression(str_input)
+
+
+@tag("parser")
+class compiled_cache_test(TestCase):
+    def test_hits_and_misses(self):
+        """ Test that equivalent expressions share a compiled entry
+        """
+        cache = CompiledCache(maxsize=2)
+        self.assertEqual(cache.warm(["x + y"]), 1)
+        lam = cache.compile(sympify("y + x"))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+        self.assertAlmostEqual(lam({"x": 1, "y": 2}), 3)
+
+    def test_eviction(self):
+        """ Test that the least recently used entry is evicted
+        """
+        cache = CompiledCache(maxsize=2)
+        cache.warm(["x + 1", "x + 2", "x + 3"])
+        self.assertEqual(cache.stats()["size"], 2)
+        cache.compile(sympify("x + 1"))
+        self.assertEqual(cache.stats()["misses"], 4)
+        cache.clear()
+        self.assertEqual(cache.stats(), {"hits": 0, "misses": 0, "size": 0,
+                                         "maxsize": 2})
+
+
+@tag("benchmark")
+class hot_paths_benchmark(TestCase):
+    """ The benchmarks of the hot paths report their measurements through
+    the benchmark_hot_paths command, they are only run briefly here
+    """
+    def test_call_overhead(self):
+        """ Test that the calls of a compiled objective are timed
+        """
+        res = benchmarks.call_overhead(number=10)
+        self.assertEqual(set(res), {"introspecting_us", "dict_us",
+                                    "ordered_us"})
+        for value in res.values():
+            self.assertGreater(value, 0)
+
+    def test_chart_rendering(self):
+        """ Test that the chart rendering is timed, and that the data of the
+        chart has one row per point
+        """
+        res = benchmarks.chart_rendering(number=1)
+        self.assertEqual(set(res), {"plotly_us", "plotly_bytes",
+                                    "data_us", "data_bytes"})
+        values = np.random.rand(10, 4).tolist()
+        self.assertEqual(len(bars_graph_data(values)["values"]), 10)
+
+    def test_timed_overhead(self):
+        """ Test that the overhead of a timed function is measured without
+        changing whether the instrumentation is enabled
+        """
+        was_enabled = instrumentation.enabled
+        res = benchmarks.timed_overhead(number=10)
+        self.assertEqual(set(res), {"disabled_ns", "enabled_ns"})
+        self.assertEqual(instrumentation.enabled, was_enabled)
+
+    def test_parallel_evaluation(self):
+        """ Test that the evaluation of a population is timed, and that the
+        pool is shut down afterwards
+        """
+        res = benchmarks.parallel_evaluation(n_pop=2000)
+        self.assertEqual(set(res), {"serial_ms", "parallel_ms"})
+        self.assertIsNone(parallel._pool)
+
+    def test_fused_evaluation(self):
+        """ Test that the evaluation with the fused kernel is timed
+        """
+        res = benchmarks.fused_evaluation(n_pop=10, number=1)
+        self.assertEqual(set(res), {"separate_ms", "fused_ms"})
+
+    def test_command(self):
+        """ Test that the command writes the measurements
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.json")
+            out = io.StringIO()
+            call_command("benchmark_hot_paths", "call_overhead",
+                         output=path, stdout=out)
+            with open(path) as f:
+                self.assertIn("ordered_us", json.load(f)["call_overhead"])
+        self.assertIn("call_overhead: introspecting_us", out.getvalue())
+
 
 @tag("analytical")
 class analytical_problem_test(TestCase):
@@ -258,4 +535,1129 @@ class analytical_problem_test(TestCase):
         res = sf_view.iterate()
         self.assertAlmostEqual(res["Most preferred point"][0][0], 13, places=6)
 
+    def test_evaluate_batch(self):
+        """ Test that the batched evaluation agrees with the list output
+        """
+        example = analytical_problem_test.__example
+        variables = analytical_problem_test.__example_variables
+        objectives, symbols, _ = parse(example)
+        problem = AnalyticalProblem(objectives, symbols, variables)
+        population = [[5.0, 8.0, 15.0], [7.5, 10.0, 17.5], [10.0, 12.0, 20.0]]
+
+        res = problem.evaluate_batch(population)
+        self.assertEqual(res.shape, (3, 3))
+        for (row, values) in zip(problem.evaluate(population), population):
+            x, y, z = values
+            self.assertAlmostEqual(row[0], x + y)
+            self.assertAlmostEqual(row[1], y / z - 1)
+            self.assertAlmostEqual(row[2], x * x * x - y)
+        self.assertEqual(res.tolist(), problem.evaluate(population))
+
         self.assertTrue(True)
+
+
+@tag("state")
+class state_store_test(TestCase):
+    __example = [
+        {'expression': 'x + y', 'lower_bound': 0.0, 'upper_bound': 10.0},
+        {'expression': 'y / z - 1', 'lower_bound': 33,
+         'upper_bound': 40.0},
+    ]
+    __example_variables = [
+        {'x_lower_bound': 5, 'x_upper_bound': 10, 'x_initial_value': 9},
+        {'y_lower_bound': 8, 'y_upper_bound': 12, 'y_initial_value': 11},
+        {'z_lower_bound': 15, 'z_upper_bound': 20, 'z_initial_value': 17.5},
+    ]
+
+    def test_new_session(self):
+        """ Test that an unknown session gets a fresh state
+        """
+        version, state = StateStore().load("unknown")
+        self.assertEqual(version, 0)
+        self.assertIsNone(state.current_view)
+
+    def test_save_and_resume(self):
+        """ Test that a state saved by one store can be resumed by another,
+        as if it was another worker process
+        """
+        objectives, symbols, _ = parse(state_store_test.__example)
+        variables = state_store_test.__example_variables
+        problem = AnalyticalProblem(objectives, symbols, variables)
+        state = SessionState()
+        state.current_expressions = objectives
+        state.current_symbols = symbols
+        state.current_variables = variables
+        state.current_view = ENautilusView(problem=problem)
+        state.current_view.initialize(**{"User iterations": 7,
+                                         "Number of generated points": 3})
+
+        store = StateStore()
+        version = store.save("session", state)
+        self.assertEqual(version, 1)
+        self.assertIs(store.load("session", version)[1], state)
+
+        other_version, other = StateStore().load("session", None)
+        self.assertEqual(other_version, version)
+        self.assertEqual(other.current_view.user_iters, 7)
+        self.assertEqual(
+            other.current_view.problem.evaluate([[5.0, 8.0, 16.0]]),
+            problem.evaluate([[5.0, 8.0, 16.0]]))
+
+        # A stale version is reloaded from the database
+        self.assertEqual(store.save("session", other), 2)
+        self.assertEqual(StateStore().load("session", 1)[0], 2)
+
+    @override_settings(NAUTILUS_ITERATION_WORKERS=0)
+    def test_client_flow(self):
+        """ Test that the states saved by the views of a real flow can be
+        resumed and iterated by another worker process
+        """
+        response = self.client.post("/nautilus/", {
+            "interactive_method": "ENAUTILUS",
+            "optimizer": "SciPyDE",
+            "problem": "River Pollution",
+            })
+        self.assertRedirects(response, "/nautilus/init.html")
+        response = self.client.post("/nautilus/init.html", {
+            "User iterations": 3,
+            "Number of generated points": 3,
+            })
+        self.assertRedirects(response, "/nautilus/visual_iteration.html",
+                             target_status_code=302)
+        self.client.get("/nautilus/visual_iteration.html")
+        response = self.client.get("/nautilus/visual_iteration.html")
+        self.assertEqual(response.status_code, 200)
+
+        _, state = StateStore().load(self.client.session.session_key)
+        view = state.current_view
+        self.assertEqual(view.current_iter, 2)
+        preference = list(zip(*view.last_iteration.values()))[0]
+        view.iterate(preference)
+        self.assertEqual(view.current_iter, 1)
+        self.assertEqual(len(view.history), 2)
+
+    def test_checkpoints(self):
+        """ Test that a session missing from the database is resumed from its
+        latest intact checkpoint
+        """
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+                NAUTILUS_CHECKPOINTS=True, NAUTILUS_CHECKPOINT_DIR=directory,
+                NAUTILUS_CHECKPOINT_INTERVAL=0, NAUTILUS_CHECKPOINT_RETAIN=2):
+            state = SessionState()
+            state.current_view = ENautilusView()
+            state.current_view.initialize(**{
+                "User iterations": 3, "Number of generated points": 4})
+            store = StateStore()
+            store.save("session", state)
+            state.current_view.iterate()
+            state.pending_job = "lost"
+            store.save("session", state)
+            store.save("session", state)
+            self.assertEqual(len(checkpoints._paths("session")), 2)
+
+            # As after a deploy resetting the database
+            MethodState.objects.all().delete()
+            version, resumed = StateStore().load("session")
+            self.assertEqual(version, 1)
+            self.assertIsNone(resumed.pending_job)
+            self.assertEqual(resumed.current_view.current_iter, 2)
+            self.assertEqual(resumed.current_view.last_iteration,
+                             state.current_view.last_iteration)
+
+            # A corrupt checkpoint is skipped
+            path = checkpoints._paths("session")[0]
+            with open(path, "r+b") as f:
+                f.seek(-1, os.SEEK_END)
+                f.write(b"?")
+            self.assertIsNotNone(checkpoints.latest("session"))
+            self.assertIsNone(checkpoints.read(path))
+
+            store.discard("session")
+            self.assertIsNone(checkpoints.latest("session"))
+            self.assertEqual(StateStore().load("session")[0], 0)
+
+            checkpoints.write("old", 1, b"state")
+            self.assertEqual(checkpoints.prune(3600), 0)
+            self.assertEqual(checkpoints.prune(-1), 1)
+            self.assertIsNone(checkpoints.latest("old"))
+
+    @override_settings(NAUTILUS_ITERATION_WORKERS=0,
+                       NAUTILUS_CHECKPOINT_INTERVAL=0)
+    def test_checkpointed_client_flow(self):
+        """ Test that a decision maker resumes from the checkpoints when the
+        database has been reset, sessions included
+        """
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+                NAUTILUS_CHECKPOINTS=True, NAUTILUS_CHECKPOINT_DIR=directory):
+            self.client.post("/nautilus/", {
+                "interactive_method": "ENAUTILUS",
+                "optimizer": "SciPyDE",
+                "problem": "River Pollution",
+                })
+            self.client.post("/nautilus/init.html", {
+                "User iterations": 3,
+                "Number of generated points": 3,
+                })
+            self.client.get("/nautilus/visual_iteration.html")
+            lost_key = self.client.session.session_key
+
+            # As after a deploy resetting the database
+            Session.objects.all().delete()
+            MethodState.objects.all().delete()
+            for _ in range(2):
+                response = self.client.get("/nautilus/visual_iteration.html")
+                self.assertEqual(response.status_code, 200)
+
+            session_key = self.client.session.session_key
+            self.assertNotEqual(session_key, lost_key)
+            _, state = StateStore().load(session_key)
+            self.assertEqual(state.current_view.current_iter, 2)
+            self.assertIsNone(checkpoints.latest(lost_key))
+
+
+@tag("jobs")
+@override_settings(NAUTILUS_ITERATION_WORKERS=0)
+class iteration_jobs_test(TestCase):
+    def test_inline_iteration(self):
+        """ Test that the result of a job is saved into the session's state
+        """
+        store = sf.store
+        state = SessionState()
+        state.current_view = ENautilusView()
+        state.current_view.initialize(**{"User iterations": 3,
+                                         "Number of generated points": 4})
+        store.save("session", state)
+
+        job_id = jobs.submit_iteration("session", state)
+        _, state = store.load("session")
+        self.assertIsNone(state.pending_job)
+        self.assertEqual(jobs.job_status(state, job_id), "done")
+        self.assertFalse(state.current_view.is_first_iteration)
+        self.assertEqual(state.current_view.current_iter, 2)
+
+    def test_abandoned_job(self):
+        """ Test that a job of a replaced view is not waited for and its
+        outcome is not saved
+        """
+        store = sf.store
+        problem = {
+            "interactive_method": "ENAUTILUS",
+            "optimizer": "SciPyDE",
+            "problem": "River Pollution",
+            }
+        self.client.post("/nautilus/", problem)
+        key = self.client.session.session_key
+        _, state = store.load(key)
+        old_view_id = state.view_id
+        payload = pickle.dumps(state.current_view)
+        state.pending_job = "job"
+        store.save(key, state)
+
+        # Another problem is chosen while the job is running
+        self.client.post("/nautilus/", problem)
+        _, state = store.load(key)
+        self.assertIsNone(state.pending_job)
+        self.assertNotEqual(state.view_id, old_view_id)
+
+        # Even if the job id matches, the job of the old view is dropped
+        state.pending_job = "job"
+        store.save(key, state)
+        future = Future()
+        future.set_result((payload, []))
+        jobs._finish(key, "job", old_view_id, future)
+        self.assertEqual(store.load(key)[1].pending_job, "job")
+
+    def test_visual_iteration_flow(self):
+        """ Test that the iteration page waits for the job and then shows the
+        results
+        """
+        response = self.client.post("/nautilus/", {
+            "interactive_method": "ENAUTILUS",
+            "optimizer": "SciPyDE",
+            "problem": "River Pollution",
+            })
+        self.assertRedirects(response, "/nautilus/init.html")
+        self.client.post("/nautilus/init.html", {
+            "User iterations": 2,
+            "Number of generated points": 3,
+            })
+
+        # The first iteration is submitted and, being run inline, done
+        response = self.client.get("/nautilus/visual_iteration.html")
+        self.assertRedirects(response, "/nautilus/visual_iteration.html")
+        response = self.client.get("/nautilus/visual_iteration.html")
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get("/nautilus/visual_iteration_data.json")
+        self.assertEqual(response.json()["div_id"], bars_div_id)
+        self.assertEqual(len(response.json()["values"]), 3)
+
+        # Unchanged results are not sent again
+        for url in ("/nautilus/visual_iteration.html",
+                    "/nautilus/visual_iteration_data.json"):
+            etag = self.client.get(url)["ETag"]
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+        # Unless the page is shown differently
+        etag = self.client.get("/nautilus/visual_iteration.html")["ETag"]
+        for changed in ({"NAUTILUS_CLIENT_SIDE_CHARTS": False},
+                        {"NAUTILUS_STREAM_ITERATIONS": True}):
+            with override_settings(**changed):
+                response = self.client.get("/nautilus/visual_iteration.html",
+                                           HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+
+        response = self.client.post("/nautilus/visual_iteration.html",
+                                    {"selection": 1})
+        self.assertRedirects(response, "/nautilus/visual_iteration.html",
+                             target_status_code=302)
+        response = self.client.get("/nautilus/visual_iteration.html")
+        self.assertRedirects(response, "/nautilus/results.html")
+
+
+@tag("jobs")
+@override_settings(NAUTILUS_ITERATION_WORKERS=0,
+                   NAUTILUS_SPECULATIVE_ITERATIONS=True,
+                   NAUTILUS_SPECULATION_WORKERS=1,
+                   NAUTILUS_SPECULATION_NICENESS=0)
+class speculation_test(TestCase):
+    def setUp(self):
+        self.state = SessionState()
+        self.state.current_view = ENautilusView()
+        self.state.current_view.initialize(**{
+            "User iterations": 3, "Number of generated points": 4})
+        sf.store.save("session", self.state)
+        jobs.submit_iteration("session", self.state)
+        _, self.state = sf.store.load("session")
+
+    def tearDown(self):
+        speculation.shutdown()
+
+    def test_take(self):
+        """ Test that the speculated iteration of the selected point is served
+        and the others are dropped
+        """
+        view = self.state.current_view
+        self.assertEqual(
+            speculation.speculate("session", view, jobs.iterate), 4)
+        # Already started for this iteration
+        self.assertEqual(
+            speculation.speculate("session", view, jobs.iterate), 0)
+        futures = speculation._sessions["session"][1]
+        for future in futures.values():
+            future.result()
+
+        preference = list(zip(*view.last_iteration.values()))[1]
+        speculated = pickle.loads(
+            futures[speculation._preference_key(preference)].result()[0])
+        job_id = jobs.submit_iteration("session", self.state, preference)
+        _, state = sf.store.load("session")
+        self.assertEqual(jobs.job_status(state, job_id), "done")
+        self.assertEqual(state.current_view.current_iter, 1)
+        self.assertEqual(state.current_view.last_iteration,
+                         speculated.last_iteration)
+        self.assertNotIn("session", speculation._sessions)
+
+    def test_stale(self):
+        """ Test that speculations are not used for another iteration
+        """
+        view = self.state.current_view
+        speculation.speculate("session", view, jobs.iterate)
+        preference = list(zip(*view.last_iteration.values()))[0]
+        view.iterate(preference)
+        self.assertIsNone(speculation.take("session", view, preference))
+        self.assertNotIn("session", speculation._sessions)
+
+        speculation.speculate("session", view, jobs.iterate)
+        speculation.cancel("session")
+        self.assertIsNone(speculation.take("session", view, preference))
+
+    @override_settings(NAUTILUS_SPECULATION_SESSIONS=1)
+    def test_budget(self):
+        """ Test that only the latest sessions are speculated for
+        """
+        view = self.state.current_view
+        speculation.speculate("session", view, jobs.iterate)
+        speculation.speculate("other", view, jobs.iterate)
+        self.assertEqual(list(speculation._sessions), ["other"])
+        preference = list(zip(*view.last_iteration.values()))[0]
+        self.assertIsNone(speculation.take("session", view, preference))
+        self.assertIsNotNone(speculation.take("other", view, preference))
+
+    def test_failed_speculation(self):
+        """ Test that the iteration page is shown when speculating fails
+        """
+        self.client.post("/nautilus/", {
+            "interactive_method": "ENAUTILUS",
+            "optimizer": "SciPyDE",
+            "problem": "River Pollution",
+            })
+        self.client.post("/nautilus/init.html", {
+            "User iterations": 2,
+            "Number of generated points": 3,
+            })
+        self.client.get("/nautilus/visual_iteration.html")
+
+        error = pickle.PicklingError("Cannot pickle the view")
+        with mock.patch.object(speculation, "speculate", side_effect=error):
+            with self.assertLogs("nautilus.views", "ERROR"):
+                response = self.client.get("/nautilus/visual_iteration.html")
+        self.assertEqual(response.status_code, 200)
+
+
+@tag("presolve")
+class presolve_test(TestCase):
+    def test_save_and_load(self):
+        """ Test that a stored problem is memory-mapped read-only and used by
+        the views
+        """
+        pareto = np.array([[0.0, 1.0], [0.5, 0.5], [1.0, 0.0]])
+        meta_problem = NautilusView().problem
+
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertIsNone(presolve.load("River Pollution", directory))
+
+            with override_settings(NAUTILUS_PRESOLVED_DIR=directory):
+                presolve.save("River Pollution", meta_problem, pareto,
+                              pareto.min(axis=0), pareto.max(axis=0))
+                problem = presolve.load("River Pollution")
+                self.assertFalse(problem.pareto.flags.writeable)
+                # No temporary files are left behind
+                self.assertEqual(sorted(os.listdir(os.path.join(
+                    directory, "River_Pollution"))), [
+                        "ideal.npy", "meta.json", "nadir.npy", "pareto.npy"])
+                self.assertEqual(problem.ideal, [0.0, 0.0])
+                self.assertEqual(problem.nadir, [1.0, 1.0])
+                self.assertEqual(problem.evaluate().tolist(), pareto.tolist())
+
+                view = ENautilusView(problem="River Pollution")
+                self.assertIsInstance(view.problem, presolve.PresolvedProblem)
+                restored = pickle.loads(pickle.dumps(view.problem))
+                self.assertEqual(restored.evaluate().tolist(),
+                                 pareto.tolist())
+
+    def test_presolve(self):
+        """ Test that the sample has the given number of points per objective
+        and that the ideal and nadir of the problem are kept
+        """
+        objectives, symbols, _ = parse(benchmarks.example_objectives)
+        problem = AnalyticalProblem(objectives, symbols,
+                                    benchmarks.example_variables)
+
+        pareto, ideal, nadir = presolve.presolve(problem, samples=2)
+        self.assertEqual(pareto.shape, (4, 2))
+        self.assertEqual(ideal.tolist(), [0.0, -1.0])
+        self.assertEqual(nadir.tolist(), [10.0, 1.0])
+
+    def test_solved_custom_problem(self):
+        """ Test that a custom problem is solved only once per definition and
+        iterated over the stored solutions
+        """
+        objectives, symbols, _ = parse(benchmarks.example_objectives)
+        variables = [dict(var) for var in benchmarks.example_variables]
+        problem = AnalyticalProblem(objectives, symbols, variables)
+        key = presolve.problem_key(objectives, symbols, variables)
+
+        # The initial values do not change the key, the bounds do
+        variables[0]["x_initial_value"] = 6
+        self.assertEqual(
+            presolve.problem_key(objectives, symbols, variables), key)
+        variables[0]["x_upper_bound"] = 11
+        self.assertNotEqual(
+            presolve.problem_key(objectives, symbols, variables), key)
+
+        pareto = np.array([[5.0, 0.5], [8.0, -0.2]])
+        calls = []
+
+        def fake_presolve(problem):
+            calls.append(problem)
+            return pareto, problem.ideal, problem.nadir
+
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertIsNone(presolve.load_solved(key, directory))
+
+            original = presolve.presolve
+            presolve.presolve = fake_presolve
+            try:
+                with override_settings(NAUTILUS_SOLVED_DIR=directory):
+                    first = presolve.solve_custom(problem, key)
+                    second = presolve.solve_custom(problem, key)
+                    restored = pickle.loads(pickle.dumps(second))
+            finally:
+                presolve.presolve = original
+
+            self.assertEqual(len(calls), 1)
+            self.assertTrue(os.path.exists(
+                os.path.join(directory, key + ".npz")))
+            for solved in (first, second, restored):
+                self.assertIsInstance(solved, presolve.SolvedProblem)
+                self.assertEqual(solved.evaluate().tolist(), pareto.tolist())
+                self.assertEqual(solved.ideal, [0.0, -1.0])
+                self.assertEqual(solved.nadir, [10.0, 1.0])
+
+            view = ENautilusView(problem=first)
+            self.assertIs(view.problem, first)
+
+
+@tag("benchmark")
+class import_time_benchmark(TestCase):
+    def test_index_without_heavy_imports(self):
+        """ Test that the index is rendered without importing desdeo, sympy,
+        plotly or numpy
+        """
+        try:
+            heavy, times = benchmarks.render_index()
+        except subprocess.CalledProcessError as e:
+            self.fail(e.stderr[-2000:])
+        self.assertEqual(heavy, [])
+        self.assertIn("django", times)
+
+        res = benchmarks.import_time(slowest=1)
+        self.assertEqual(len(res), 2)
+        self.assertGreater(res["total_ms"], 0)
+
+
+@tag("visualization")
+class render_cache_test(TestCase):
+    def test_cache_and_invalidate(self):
+        """ Test that rendered charts are reused until the session moves on
+        """
+        values = [[1.0, 2.0], [3.0, 4.0]]
+        cache = RenderCache(maxsize=2)
+        html_div, div_id, key = cache.bars_graph(values, session_key="a")
+        self.assertEqual(key, values_key([[1.0, 2.0], [3.0, 4.0000000001]]))
+        self.assertIs(cache.bars_graph(values, session_key="a")[0], html_div)
+        self.assertNotEqual(key, values_key(values, mode="group"))
+
+        cache.invalidate("a")
+        self.assertEqual(len(cache), 0)
+
+        # A chart also shown to another session is kept for it
+        html_div, _, _ = cache.bars_graph(values, session_key="a")
+        self.assertIs(cache.bars_graph(values, session_key="b")[0], html_div)
+        cache.invalidate("a")
+        self.assertIs(cache.bars_graph(values, session_key="b")[0], html_div)
+        cache.invalidate("b")
+        self.assertEqual(len(cache), 0)
+
+
+@tag("benchmark")
+@override_settings(NAUTILUS_ITERATION_WORKERS=0)
+class flow_benchmark(TestCase):
+    def test_run_benchmark(self):
+        """ Test that the simulated decision makers reach the results and
+        that every endpoint of the flow is reported.
+        """
+        results = benchmarks.run_benchmark(
+            sessions=2, concurrency=1, iterations=2, n_points=3)
+
+        self.assertEqual(set(results["problems"]),
+                         set(benchmarks.benchmark_problems))
+        custom = results["problems"]["Custom"]["endpoints"]
+        self.assertIn("analytical_problem_optimize", custom)
+        for endpoints in (r["endpoints"]
+                          for r in results["problems"].values()):
+            self.assertEqual(endpoints["method_results"]["count"], 2)
+            for stats in endpoints.values():
+                self.assertEqual(stats["errors"], 0)
+                self.assertLessEqual(stats["p50_ms"], stats["p99_ms"])
+        self.assertIn("method_results", benchmarks.format_results(results))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.json")
+            benchmarks.write_results(results, path)
+            with open(path) as f:
+                self.assertEqual(json.load(f)["meta"]["sessions"], 2)
+
+
+@tag("instrumentation")
+@override_settings(NAUTILUS_ITERATION_WORKERS=0)
+class instrumentation_test(TestCase):
+    def setUp(self):
+        instrumentation.reset()
+        instrumentation.enable()
+
+    def tearDown(self):
+        instrumentation.enable(False)
+        instrumentation.reset()
+
+    def test_phases_and_metrics(self):
+        """ Test that the phases of the flow are timed and exported
+        """
+        objectives, symbols, _ = parse([
+            {'expression': 'x + y', 'lower_bound': 0.0, 'upper_bound': 10.0},
+            ])
+        problem = AnalyticalProblem(objectives, symbols, [
+            {'x_lower_bound': 0, 'x_upper_bound': 5, 'x_initial_value': 1},
+            {'y_lower_bound': 0, 'y_upper_bound': 5, 'y_initial_value': 1},
+            ])
+        with instrumentation.collect() as samples:
+            problem.evaluate([[1, 2], [3, 4], [5, 6]])
+        self.assertEqual([(s.phase, s.evaluations) for s in samples],
+                         [("evaluate", 3)])
+
+        dm = benchmarks.DecisionMaker(benchmarks.Recorder())
+        response = dm.run("River Pollution", 2, 3)
+        self.assertIn("view.method_results", response["Server-Timing"])
+
+        phases = {sample.phase for sample in instrumentation.latest_samples()}
+        for phase in ("iterate", "next_iteration", "bars_graph_data",
+                      "view.index", "view.method_visual_iteration"):
+            self.assertIn(phase, phases)
+
+        text = self.client.get(reverse("metrics")).content.decode()
+        self.assertIn('nautilus_phase_calls_total{phase="iterate"} 2', text)
+        self.assertIn('nautilus_objective_evaluations_total{phase="evaluate"}'
+                      ' 3', text)
+
+    def test_disabled(self):
+        """ Test that nothing is recorded when disabled
+        """
+        instrumentation.enable(False)
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 404)
+
+        instrumentation.timed("fun")(lambda: None)()
+        self.assertEqual(instrumentation.latest_samples(), [])
+
+
+@tag("analytical")
+class evaluation_profile_test(TestCase):
+    def setUp(self):
+        self.objectives, self.symbols, _ = parse([
+            {'expression': 'x + y', 'lower_bound': 0.0, 'upper_bound': 10.0},
+            {'expression': 'x * y', 'lower_bound': 0.0, 'upper_bound': 25.0},
+            ])
+        self.variables = [
+            {'x_lower_bound': 0, 'x_upper_bound': 5, 'x_initial_value': 1},
+            {'y_lower_bound': 0, 'y_upper_bound': 5, 'y_initial_value': 1},
+            ]
+
+    def test_profile(self):
+        """ Test that the evaluations of a profiled problem are counted and
+        timed per objective, also in a pickled copy of the problem
+        """
+        self.assertIsNone(AnalyticalProblem(
+            self.objectives, self.symbols, self.variables).profile)
+
+        problem = AnalyticalProblem(self.objectives, self.symbols,
+                                    self.variables, profile=True)
+        problem.evaluate([[1, 2], [3, 4]])
+        problem = pickle.loads(pickle.dumps(problem))
+        problem.evaluate([[1, 2]])
+
+        profile = problem.profile
+        self.assertEqual(profile.evaluations, 3)
+        self.assertEqual(profile.batch_sizes, {2: 1, 1: 1})
+        self.assertEqual(profile.calls, [2, 2])
+        self.assertEqual([sum(h) for h in profile.histograms], [3, 3])
+
+        report = profile.report(["x + y", "x * y"])
+        self.assertIn("3 evaluations in 2 batches (sizes 1x1, 2x1)", report)
+        self.assertIn("x * y: 2 calls", report)
+
+    def test_large_batch(self):
+        """ Test that the time of a call is reported per evaluated vector,
+        so that a trivial objective evaluated in a large batch is not
+        reported as slow
+        """
+        profile = instrumentation.EvaluationProfile(1)
+        profile.record_batch(100000)
+        profile.record_call(0, 0.01, 100000)
+
+        self.assertEqual(profile.histograms[0][0], 100000)
+        report = profile.report(["x"])
+        self.assertIn("x: 1 calls, 0.1us per evaluation", report)
+        self.assertNotIn("(slow)", report)
+
+        profile = instrumentation.EvaluationProfile(1)
+        profile.record_batch(1)
+        profile.record_call(0, 0.01, 1)
+        self.assertIn("(slow)", profile.report(["x"]))
+
+    @override_settings(NAUTILUS_PARALLEL_MIN_POPULATION=100,
+                       NAUTILUS_EVALUATION_WORKERS=2)
+    def test_joint_evaluations(self):
+        """ Test that the objectives evaluated at once, by a fused kernel or
+        in parallel, are also counted per objective
+        """
+        population = np.random.rand(200, 2) * 5
+        try:
+            for options in ({"fused": True}, {"parallel": True},
+                            {"fused": True, "parallel": True}):
+                problem = AnalyticalProblem(
+                    self.objectives, self.symbols, self.variables,
+                    profile=True, **options)
+                problem.evaluate_batch(population)
+                problem.evaluate_batch(population[:10])
+                profile = problem.profile
+                self.assertEqual(profile.evaluations, 210)
+                self.assertEqual(profile.calls, [2, 2])
+                self.assertEqual([sum(h) for h in profile.histograms],
+                                 [210, 210])
+        finally:
+            parallel.shutdown()
+
+    @override_settings(NAUTILUS_ITERATION_WORKERS=0,
+                       NAUTILUS_PROFILE_PROBLEMS=True)
+    def test_report_at_results(self):
+        """ Test that the profile is logged when the results are shown
+        """
+        dm = benchmarks.DecisionMaker(benchmarks.Recorder())
+        with self.assertLogs("nautilus.views", level="INFO") as logs:
+            dm.run("Custom", 2, 3)
+        self.assertIn("y / z - 1:", logs.output[-1])
+
+
+@tag("parallel")
+@override_settings(NAUTILUS_PARALLEL_MIN_POPULATION=100,
+                   NAUTILUS_EVALUATION_WORKERS=2)
+class parallel_evaluation_test(TestCase):
+    def setUp(self):
+        objectives, symbols, _ = parse([
+            {'expression': 'sin(x) * exp(cos(y)) + log(1 + x**2)',
+             'lower_bound': -10.0, 'upper_bound': 10.0},
+            {'expression': 'x - y', 'lower_bound': -5.0, 'upper_bound': 5.0},
+            ])
+        self.variables = [
+            {'x_lower_bound': 0, 'x_upper_bound': 5, 'x_initial_value': 1},
+            {'y_lower_bound': 0, 'y_upper_bound': 5, 'y_initial_value': 1},
+            ]
+        self.serial = AnalyticalProblem(objectives, symbols, self.variables)
+        self.parallel = AnalyticalProblem(objectives, symbols,
+                                          self.variables, parallel=True)
+
+    def tearDown(self):
+        parallel.shutdown()
+
+    def test_same_values(self):
+        """ Test that the parallel evaluation matches the serial one, also
+        when the population grows
+        """
+        for n_pop in (10, 1000, 5000):
+            population = np.random.rand(n_pop, 2) * 5
+            np.testing.assert_allclose(
+                self.parallel.evaluate_batch(population),
+                self.serial.evaluate_batch(population))
+
+        # The pool is shared by the problems
+        pool = parallel.get_pool()
+        other = AnalyticalProblem(
+            [(exprs_to_lambda('x * y')[0], 0.0, 25.0)], ["x", "y"],
+            self.variables, parallel=True)
+        np.testing.assert_allclose(other.evaluate_batch(population),
+                                   np.prod(population, axis=1)[:, None])
+        self.assertIs(parallel.get_pool(), pool)
+
+    def test_concurrent_evaluations(self):
+        """ Test that the populations evaluated at the same time, such as
+        those of concurrent sessions, have blocks of their own
+        """
+        populations = [np.random.rand(1000 * (ind + 1), 2) * 5
+                       for ind in range(4)]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(self.parallel.evaluate_batch,
+                                        populations))
+        for (population, res) in zip(populations, results):
+            np.testing.assert_allclose(
+                res, self.serial.evaluate_batch(population))
+
+    def test_not_nested(self):
+        """ Test that the worker processes evaluate the populations
+        themselves
+        """
+        population = np.random.rand(1000, 2) * 5
+        workers.in_worker = True
+        try:
+            np.testing.assert_allclose(
+                self.parallel.evaluate_batch(population),
+                self.serial.evaluate_batch(population))
+            with self.assertRaises(RuntimeError):
+                parallel.get_pool()
+        finally:
+            workers.in_worker = False
+        self.assertIsNone(parallel._pool)
+
+
+@tag("analytical")
+class fused_kernel_test(TestCase):
+    def setUp(self):
+        # The objectives share sin(x*y) and exp(cos(z))
+        exprs = ['sin(x*y) * exp(cos(z))',
+                 'sin(x*y) + exp(cos(z))',
+                 'sin(x*y) - x*exp(cos(z))',
+                 '2']
+        self.symbols = ["x", "y", "z"]
+        self.objectives = [(exprs_to_lambda(e)[0], 0.0, 1.0) for e in exprs]
+        variables = [
+            {'x_lower_bound': 0, 'x_upper_bound': 1, 'x_initial_value': 1},
+            {'y_lower_bound': 0, 'y_upper_bound': 1, 'y_initial_value': 1},
+            {'z_lower_bound': 0, 'z_upper_bound': 1, 'z_initial_value': 1},
+            ]
+        self.separate = AnalyticalProblem(self.objectives, self.symbols,
+                                          variables)
+        self.fused = AnalyticalProblem(self.objectives, self.symbols,
+                                       variables, fused=True)
+
+    def test_same_values(self):
+        """ Test that the fused kernel matches the separate objectives, also
+        when pickled
+        """
+        population = np.random.rand(50, 3)
+        expected = self.separate.evaluate_batch(population)
+        np.testing.assert_allclose(self.fused.evaluate_batch(population),
+                                   expected)
+        np.testing.assert_allclose(
+            pickle.loads(pickle.dumps(self.fused)).evaluate_batch(population),
+            expected)
+        self.assertEqual(self.fused.evaluate([[0.5, 0.5, 0.5]]),
+                         self.separate.evaluate([[0.5, 0.5, 0.5]]))
+
+    def test_cached(self):
+        """ Test that the kernel of the same objectives is compiled once
+        """
+        objectives = [obj for (obj, _, _) in self.objectives]
+        self.assertIs(fuse(objectives, self.symbols),
+                      fuse(objectives, self.symbols))
+
+
+def parse_events(response):
+    """Parses the server-sent events of a streaming response.
+
+    :returns: A list of (event, data) pairs
+    """
+    content = b"".join(response.streaming_content).decode()
+    events = []
+    for block in content.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@tag("stream")
+@override_settings(NAUTILUS_STREAM_ITERATIONS=True)
+class iteration_stream_test(TestCase):
+    def test_iterate_stream(self):
+        """ Test that the streamed points are the results of the iteration
+        """
+        view = ENautilusView()
+        view.initialize(**{"User iterations": 3,
+                           "Number of generated points": 4})
+        points = list(view.iterate_stream())
+        self.assertEqual(len(points), 4)
+        self.assertEqual([p["preferred_point"] for p in points],
+                         view.last_iteration["preferred_point"])
+        self.assertEqual([p["lower_bounds"] for p in points],
+                         view.last_iteration["lower_bounds"])
+        self.assertEqual(view.current_iter, 2)
+        # The view can still be pickled
+        pickle.dumps(view)
+
+    def test_stream_flow(self):
+        """ Test that the iterations are streamed from the iteration page to
+        the results
+        """
+        self.client.post("/nautilus/", {
+            "interactive_method": "ENAUTILUS",
+            "optimizer": "SciPyDE",
+            "problem": "River Pollution",
+            })
+        self.client.post("/nautilus/init.html", {
+            "User iterations": 2,
+            "Number of generated points": 3,
+            })
+
+        # The page of the first iteration streams it into an empty chart
+        response = self.client.get("/nautilus/visual_iteration.html")
+        self.assertEqual(response.status_code, 200)
+        stream_url = response.context["chart_stream_url"]
+        response = self.client.get(stream_url)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        events = parse_events(response)
+        self.assertEqual([e for (e, _) in events], ["point"] * 3 + ["done"])
+        self.assertEqual(events[-1][1]["current_iteration"], 1)
+        self.assertIsNone(events[-1][1]["redirect"])
+
+        response = self.client.get("/nautilus/visual_iteration_data.json")
+        self.assertEqual(len(response.json()["values"]), 3)
+
+        # The token is used once
+        self.assertEqual(self.client.get(stream_url).status_code, 403)
+        next_url = events[-1][1]["stream_url"]
+        self.assertEqual(self.client.get(next_url).status_code, 400)
+        # The page gives the same token until it is used, so the browser can
+        # reuse its copy
+        response = self.client.get("/nautilus/visual_iteration.html")
+        self.assertEqual(response.context["chart_stream_url"], next_url)
+        etag = response["ETag"]
+        version = MethodState.objects.get(
+            session_key=self.client.session.session_key).version
+        response = self.client.get("/nautilus/visual_iteration.html",
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(MethodState.objects.get(
+            session_key=self.client.session.session_key).version, version)
+
+        events = parse_events(self.client.get(next_url + "&selection=2"))
+        self.assertEqual(events[-1][1]["redirect"], "/nautilus/results.html")
+        self.assertIsNone(events[-1][1]["stream_url"])
+        self.assertEqual(self.client.get(next_url).status_code, 404)
+
+    def test_one_stream_at_a_time(self):
+        """ Test that a second stream is rejected while one is running and
+        that the stream of a replaced view is not saved
+        """
+        problem = {
+            "interactive_method": "ENAUTILUS",
+            "optimizer": "SciPyDE",
+            "problem": "River Pollution",
+            }
+        self.client.post("/nautilus/", problem)
+        self.client.post("/nautilus/init.html", {
+            "User iterations": 2,
+            "Number of generated points": 3,
+            })
+        response = self.client.get("/nautilus/visual_iteration.html")
+        stream_url = response.context["chart_stream_url"]
+
+        # Claimed before the first event is sent
+        response = self.client.get(stream_url)
+        self.assertEqual(self.client.get(stream_url).status_code, 409)
+
+        # Another problem is chosen while streaming
+        self.client.post("/nautilus/", problem)
+        events = parse_events(response)
+        self.assertEqual(events[-1][1]["redirect"],
+                         "/nautilus/visual_iteration.html")
+        _, state = StateStore().load(self.client.session.session_key)
+        self.assertIsNone(state.pending_job)
+        self.assertFalse(state.current_view.initialized)
+
+
+@tag("imports")
+@override_settings(NAUTILUS_IMPORT_WORKERS=0)
+class problem_import_test(TestCase):
+    __problems = [
+        {"name": "Example",
+         "objectives": benchmarks.example_objectives,
+         "variables": {
+             "x": {"lower_bound": 5, "upper_bound": 10},
+             "y": {"lower_bound": 8, "upper_bound": 12, "initial_value": 11},
+             "z": {"lower_bound": 15, "upper_bound": 20},
+             }},
+        {"name": "Invalid",
+         "objectives": [{"expression": "__import__('os')",
+                         "lower_bound": 0, "upper_bound": 1}],
+         "variables": {}},
+        {"name": "Unbounded",
+         "objectives": [{"expression": "x * w", "lower_bound": 0,
+                         "upper_bound": 1}],
+         "variables": {"x": {"lower_bound": 0, "upper_bound": 1}}},
+        ]
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.solved = []
+        self.original = presolve.presolve
+
+        def fake_presolve(problem):
+            self.solved.append(problem)
+            pareto = np.array([[5.0, 0.5], [8.0, -0.2]])
+            return pareto, problem.ideal, problem.nadir
+
+        presolve.presolve = fake_presolve
+
+    def tearDown(self):
+        presolve.presolve = self.original
+        self.directory.cleanup()
+
+    def upload(self, name, content):
+        with override_settings(NAUTILUS_SOLVED_DIR=self.directory.name):
+            upload = SimpleUploadedFile(name, content.encode())
+            return self.client.post(reverse("analytical_problem_import"),
+                                    {"problems": upload})
+
+    def test_import_json(self):
+        """ Test that the valid problems of a batch are presolved once and the
+        invalid ones are reported
+        """
+        response = self.upload("problems.json", json.dumps(
+            self.__problems + self.__problems[:1]))
+        self.assertEqual(response.status_code, 202)
+        report = response.json()
+        self.assertTrue(report["done"])
+        problems = report["problems"]
+        self.assertEqual([p["status"] for p in problems],
+                         ["solved", "invalid", "invalid", "solved"])
+        self.assertIn("__import__", problems[1]["error"])
+        self.assertIn("variable w", problems[2]["error"])
+        self.assertGreater(problems[0]["parse_s"], 0)
+        self.assertGreaterEqual(problems[0]["solve_s"], 0)
+        # The repeated variant is solved only once
+        self.assertEqual(problems[0]["key"], problems[3]["key"])
+        self.assertEqual(len(self.solved), 1)
+        # The initial values default to the middle of the bounds
+        self.assertEqual(self.solved[0].variables[0].starting_point, 7.5)
+
+        status = self.client.get(report["status_url"]).json()
+        self.assertEqual(status["problems"], problems)
+
+        # Solved problems are not solved again
+        response = self.upload("again.json", json.dumps(self.__problems[:1]))
+        self.assertTrue(response.json()["problems"][0]["cached"])
+        self.assertEqual(len(self.solved), 1)
+
+    def test_import_csv(self):
+        """ Test that a batch is read from CSV
+        """
+        content = "\n".join([
+            "problem,kind,name,expression,lower_bound,upper_bound,"
+            "initial_value",
+            "A,objective,,x + y,0,10,",
+            "A,objective,,x - y,-5,5,",
+            "A,variable,x,,0,5,1",
+            "A,variable,y,,0,5,",
+            "B,objective,,x**2,0,1,",
+            "B,variable,x,,0,1,",
+            ])
+        problems = self.upload("problems.csv", content).json()["problems"]
+        self.assertEqual([p["name"] for p in problems], ["A", "B"])
+        self.assertEqual([p["status"] for p in problems],
+                         ["solved", "solved"])
+
+    def test_invalid_file(self):
+        """ Test that unreadable files are rejected
+        """
+        self.assertEqual(self.upload("problems.txt", "[]").status_code, 400)
+        self.assertEqual(self.upload("problems.json", "{").status_code, 400)
+        response = self.upload("problems.csv", "problem,kind\nA,constraint")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(reverse(
+            "analytical_problem_import_status", args=["unknown"])).status_code,
+                         404)
+
+
+class _Paraboloids(MOProblem):
+    """ A problem without analytical expressions
+    """
+    def __init__(self):
+        super().__init__(nobj=2, ideal=[0.0, 0.0], nadir=[2.0, 2.0])
+        self.add_variables([Variable([-1.0, 2.0], 0.5, "x"),
+                            Variable([-1.0, 2.0], 0.5, "y")])
+
+    def evaluate(self, population):
+        return [[x**2 + y**2, (x - 1)**2 + (y - 1)**2]
+                for (x, y) in population]
+
+
+@tag("optimizers")
+class optimizers_test(TestCase):
+    def setUp(self):
+        objectives, symbols, _ = parse(benchmarks.example_objectives)
+        self.problem = AnalyticalProblem(
+            objectives, symbols,
+            [dict(var) for var in benchmarks.example_variables])
+
+    def test_jacobian(self):
+        """ Test the Jacobian derived from the objectives
+        """
+        jac = self.problem.jacobian([[5.0, 8.0, 16.0], [1.0, 2.0, 4.0]])
+        self.assertEqual(jac.shape, (2, 2, 3))
+        self.assertEqual(jac[0].tolist(),
+                         [[1.0, 1.0, 0.0], [0.0, 1 / 16, -8 / 256]])
+        self.assertEqual(jac[1].tolist(),
+                         [[1.0, 1.0, 0.0], [0.0, 1 / 4, -2 / 16]])
+
+    def test_gradient_search(self):
+        """ Test that the gradient-based optimizers solve the epsilon
+        constraint problems, with an active constraint when maximizing
+        """
+        for optimizer in (optimizers.SLSQP, optimizers.MultiStartSLSQP,
+                          optimizers.LBFGSB):
+            opt = optimizer(EpsilonConstraintProblem(self.problem,
+                                                     [None, 0.5]))
+            x, values = opt.search()
+            self.assertAlmostEqual(values[0], 13.0, places=3)
+            self.assertGreater(opt.evaluations, 0)
+            self.assertGreater(opt.seconds, 0)
+
+            # The bounds are set like desdeo's BoundsFactory does, they are
+            # not taken by the constructor
+            problem = MaxEpsilonConstraintProblem(self.problem)
+            problem.obj_bounds = [None, -0.5]
+            opt = optimizer(problem)
+            x, values = opt.search()
+            self.assertAlmostEqual(values[0], 20.0, places=1)
+            self.assertLess(values[1], -0.5 + 1e-2)
+
+        opt = optimizers.SLSQP(MaxEpsilonConstraintProblem(self.problem))
+        with self.assertRaises(ValueError):
+            opt.search()
+
+        # The views using the optimizers can be pickled
+        view = ENautilusView(optimizer="SLSQP", problem=self.problem)
+        view = pickle.loads(pickle.dumps(view))
+        self.assertIsInstance(view.method.fh_factory.optimization_method,
+                              optimizers.SLSQP)
+
+    def test_finite_differences(self):
+        """ Test the optimizers with a problem without expressions
+        """
+        opt = optimizers.SLSQP(EpsilonConstraintProblem(_Paraboloids(),
+                                                        [None, 0.5]))
+        x, values = opt.search()
+        # The closest point to the origin within the distance sqrt(0.5)
+        # from (1, 1) is (0.5, 0.5)
+        self.assertAlmostEqual(values[0], 0.5, places=3)
+        self.assertAlmostEqual(values[1], 0.5, places=3)
+
+    def test_non_smooth(self):
+        """ Test the objectives with absolute values and rounding
+        """
+        objectives, symbols, _, jac = parse([
+            {'expression': 'abs(x - 7) + y', 'lower_bound': 8.0,
+             'upper_bound': 15.0},
+            {'expression': 'floor(y) + z', 'lower_bound': 23.0,
+             'upper_bound': 32.0}], jacobian=True)
+        # floor cannot be differentiated
+        self.assertIsNone(jac)
+        variables = [dict(var) for var in benchmarks.example_variables]
+        problem = AnalyticalProblem(objectives, symbols, variables)
+        with self.assertRaises(ExpressionException):
+            problem.jacobian([[5.0, 8.0, 16.0]])
+        # The failure is remembered
+        with mock.patch.object(sf.expression_parser, "jacobian") as derive:
+            with self.assertRaises(ExpressionException):
+                problem.jacobian([[5.0, 8.0, 16.0]])
+        derive.assert_not_called()
+
+        # Solved with the finite differences instead
+        opt = optimizers.SLSQP(EpsilonConstraintProblem(problem,
+                                                        [None, 32.0]))
+        x, values = opt.search()
+        self.assertLessEqual(values[1], 32.0 + 1e-6)
+        self.assertGreater(opt.evaluations, 0)
+
+        # The absolute value is differentiated to its sign
+        objectives, symbols, _ = parse([
+            {'expression': 'abs(x - 7) + y / z', 'lower_bound': 0.0,
+             'upper_bound': 4.0}])
+        problem = AnalyticalProblem(objectives, symbols, variables)
+        col = {sym: ind for (ind, sym) in enumerate(symbols)}
+        jac = problem.jacobian([[5.0, 8.0, 16.0], [9.0, 8.0, 16.0]])
+        self.assertEqual(jac[:, 0, col["x"]].tolist(), [-1.0, 1.0])
+
+    def test_instrumentation(self):
+        """ Test that the searches are reported as phases
+        """
+        instrumentation.reset()
+        instrumentation.enable()
+        try:
+            opt = optimizers.SLSQP(EpsilonConstraintProblem(self.problem,
+                                                            [None, 0.5]))
+            opt.search()
+        finally:
+            instrumentation.enable(False)
+        samples = [s for s in instrumentation.latest_samples()
+                   if s.phase == "optimizer.SLSQP"]
+        self.assertEqual(len(samples), 1)
+        self.assertEqual(samples[0].evaluations, opt.evaluations)
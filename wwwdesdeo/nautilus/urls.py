@@ -14,6 +14,15 @@ urlpatterns = [
          name="method_iteration"),
     path("visual_iteration.html", views.method_visual_iteration,
          name="method_visual_iteration"),
+    path("visual_iteration_data.json", views.method_visual_iteration_data,
+         name="method_visual_iteration_data"),
+    path("visual_iteration_back", views.method_visual_iteration_back,
+         name="method_visual_iteration_back"),
+    path("visual_iteration_stream", views.method_visual_iteration_stream,
+         name="method_visual_iteration_stream"),
+    path("iteration_status/<str:job_id>", views.method_iteration_status,
+         name="method_iteration_status"),
+    path("metrics", views.metrics, name="metrics"),
     path("results.html", views.method_results,
          name="method_results"),
     path("analytical_problem_input_objectives.html",
@@ -25,6 +34,12 @@ urlpatterns = [
     path("analytical_problem_confirm.html",
          views.analytical_problem_confirm,
          name="analytical_problem_confirm"),
+    path("analytical_problem_import.html",
+         views.analytical_problem_import,
+         name="analytical_problem_import"),
+    path("analytical_problem_import_status/<str:batch_id>",
+         views.analytical_problem_import_status,
+         name="analytical_problem_import_status"),
     path("analytical_problem_optimize.html",
          views.analytical_problem_optimize,
          name="analytical_problem_optimize"),
@@ -1,15 +1,46 @@
+import json
+import logging
+import uuid
+
+from django.conf import settings
+from django.http import (Http404, HttpResponse, HttpResponseNotModified,
+                         JsonResponse, StreamingHttpResponse)
 from django.shortcuts import render, redirect, reverse
+from django.utils.http import parse_etags, quote_etag, urlencode
 
-import stateful_view as sf
-import models as m
+from . import instrumentation
+from . import models as m
 from .forms import (InitializationForm,
                     MethodInitializationForm,
                     IterationForm,
                     AnalyticalProblemInputFormSet,
+                    ProblemImportForm,
                     VariableFormsFactory,)
-from .expression_parser import parse, ExpressionException
-from .misc import analytical_problem_to_latex
-from .visualization import bars_graph
+from .registry import LazyModule
+
+# These depend on desdeo, sympy or plotly and are imported when first used
+jobs = LazyModule(__package__ + ".jobs")
+sf = LazyModule(__package__ + ".stateful_view")
+expression_parser = LazyModule(__package__ + ".expression_parser")
+imports = LazyModule(__package__ + ".imports")
+misc = LazyModule(__package__ + ".misc")
+presolve = LazyModule(__package__ + ".presolve")
+speculation = LazyModule(__package__ + ".speculation")
+visualization = LazyModule(__package__ + ".visualization")
+
+logger = logging.getLogger(__name__)
+
+
+def etag_matches(request, etag):
+    """Checks whether the client already has the version of the page
+    identified by etag.
+
+    :param request: Contains GET and POST requests encoded in a dict
+    :param etag: A quoted ETag
+    :rtype: Bool
+
+    """
+    return etag in parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))
 
 
 def index(request):
@@ -43,8 +74,10 @@ def index(request):
                     optimizer = data["optimizer"]
 
                     # Save the options for later use
-                    sf.method = method
-                    sf.optimizer = optimizer
+                    state = sf.load_state(request)
+                    state.method = method
+                    state.optimizer = optimizer
+                    sf.save_state(request, state)
                     return redirect(
                         reverse("analytical_problem_input_objectives"))
                 else:
@@ -56,7 +89,9 @@ def index(request):
                         method,
                         optimizer,
                         problem)
-                    sf.current_view = sf_view
+                    state = sf.load_state(request)
+                    state.replace_view(sf_view)
+                    sf.save_state(request, state)
                     # Initialize the chosen method
                     return redirect(reverse("method_initialization"))
             except KeyError as e:
@@ -88,16 +123,21 @@ def method_initialization(request):
     :rtype: HttpResponse
 
     """
+    state = sf.load_state(request)
+    if state.current_view is None:
+        # No method has been chosen in this session
+        return redirect(reverse("index"))
+
     # Every method should have their own template
-    template_dir = "nautilus/" + sf.current_view.template_dir
+    template_dir = "nautilus/" + state.current_view.template_dir
     template = template_dir + "/init.html"
     # Every method has its' own requirements for initialization
-    requirements = sf.current_view.initialization_requirements
+    requirements = state.current_view.initialization_requirements
 
     context = {
         "requirements": requirements,
-        "description": sf.current_view.help["description"],
-        "title": sf.current_view.help["name"],
+        "description": state.current_view.help["description"],
+        "title": state.current_view.help["name"],
         }
     print(request)
     if request.method == "POST":
@@ -106,7 +146,8 @@ def method_initialization(request):
             request.POST)
         if form.is_valid():
             data = form.cleaned_data
-            sf.current_view.initialize(**data)
+            state.current_view.initialize(**data)
+            sf.save_state(request, state)
             # Start iterating
             # return redirect(reverse("method_iteration"))
             return redirect(reverse("method_visual_iteration"))
@@ -131,25 +172,31 @@ def method_iteration(request):
     :rtype: HttpResponse
 
     """
+    state = sf.load_state(request)
+    if state.current_view is None:
+        # No method has been chosen in this session
+        return redirect(reverse("index"))
+
     # Every method should have their own templates
-    template_dir = "nautilus/" + sf.current_view.template_dir
+    template_dir = "nautilus/" + state.current_view.template_dir
     template = template_dir + "/iterate.html"
     # Every method has its' own preference requirements for iterating
-    preferences = sf.current_view.preference_requirements
+    preferences = state.current_view.preference_requirements
     context = {}
     context["title"] = "Iterating"
 
     # Iterate for the first time
-    if sf.current_view.is_first_iteration:
+    if state.current_view.is_first_iteration:
         # iterate with no preferences
-        sf.current_view.iterate()
+        state.current_view.iterate()
+        sf.save_state(request, state)
 
     context["forms"] = {}
-    last_results = sf.current_view.last_iteration
+    last_results = state.current_view.last_iteration
     context["results"] = last_results
-    total_iterations = sf.current_view.user_iters
-    current_iteration = sf.current_view.user_iters -\
-        sf.current_view.current_iter
+    total_iterations = state.current_view.user_iters
+    current_iteration = state.current_view.user_iters -\
+        state.current_view.current_iter
     context["current_iteration"] = current_iteration
     context["total_iterations"] = total_iterations
 
@@ -168,10 +215,12 @@ def method_iteration(request):
                 preference = list(zip(*last_results.values()))[index]
                 # check end condition
                 if current_iteration + 1 == total_iterations:
-                    sf.current_view.iterate(preference)
+                    state.current_view.iterate(preference)
+                    sf.save_state(request, state)
                     return redirect(reverse("method_results"))
 
-                sf.current_view.iterate(preference)
+                state.current_view.iterate(preference)
+                sf.save_state(request, state)
                 return redirect(reverse("method_iteration"))
             else:
                 context["message"] = "Form is invalid"
@@ -187,22 +236,70 @@ def method_iteration(request):
     return redirect(reverse("index"))
 
 
+def stream_url(request, state):
+    """Gives the URL streaming the next iteration of the current view, see
+    method_visual_iteration_stream. The URL holds a one-time token, issued
+    unless the state already has an unused one.
+
+    :param request: Contains GET and POST requests encoded in a dict
+    :param state: The SessionState of the session
+    :rtype: str
+
+    """
+    if getattr(state, "stream_token", None) is None:
+        state.stream_token = uuid.uuid4().hex
+        sf.save_state(request, state)
+    return "{}?{}".format(reverse("method_visual_iteration_stream"),
+                          urlencode({"token": state.stream_token}))
+
+
 def method_visual_iteration(request):
-    template_dir = "nautilus/" + sf.current_view.template_dir
+    state = sf.load_state(request)
+    if state.current_view is None:
+        # No method has been chosen in this session
+        return redirect(reverse("index"))
+
+    template_dir = "nautilus/" + state.current_view.template_dir
     template = template_dir + "/iterate.html"
     # Every method has its' own preference requirements for iterating
-    preferences = sf.current_view.preference_requirements
+    preferences = state.current_view.preference_requirements
     context = {}
 
+    # The iterations are run in the background, wait for the current one
+    if state.pending_job is not None:
+        context["title"] = "Iterating"
+        context["job_id"] = state.pending_job
+        context["status_url"] = reverse("method_iteration_status",
+                                        args=[state.pending_job])
+        return render(request, "nautilus/wait.html", context)
+
+    if state.job_error is not None:
+        context["message"] = state.job_error
+        state.job_error = None
+        sf.save_state(request, state)
+        return render(request, "nautilus/error.html", context)
+
     # Iterate for the first time
-    if sf.current_view.is_first_iteration:
+    if state.current_view.is_first_iteration:
+        if settings.NAUTILUS_STREAM_ITERATIONS:
+            # The browser streams the first iteration, starting from an
+            # empty chart
+            context["div_id"] = visualization.bars_div_id
+            context["chart_stream_url"] = stream_url(request, state)
+            return render(request, template, context)
+
         # iterate with no preferences
-        sf.current_view.iterate()
+        jobs.submit_iteration(request.session.session_key, state)
+        return redirect(reverse("method_visual_iteration"))
+
+    # Check end condition
+    if state.current_view.current_iter == 0:
+        return redirect(reverse("method_results"))
 
-    total_iterations = sf.current_view.user_iters
-    current_iteration = sf.current_view.user_iters -\
-        sf.current_view.current_iter
-    last_results = sf.current_view.last_iteration
+    total_iterations = state.current_view.user_iters
+    current_iteration = state.current_view.user_iters -\
+        state.current_view.current_iter
+    last_results = state.current_view.last_iteration
     context["current_iteration"] = current_iteration
     context["total_iterations"] = total_iterations
 
@@ -219,21 +316,244 @@ def method_visual_iteration(request):
             return render(request, template, context)
 
         preference = list(zip(*last_results.values()))[selection-1]
-        # Check end condition
-        if current_iteration + 1 == total_iterations:
-            sf.current_view.iterate(preference)
-            return redirect(reverse("method_results"))
-
-        sf.current_view.iterate(preference)
+        jobs.submit_iteration(request.session.session_key, state, preference)
         return redirect(reverse("method_visual_iteration"))
 
+    # Don't iterate, but show last iteration's results. The browser may
+    # reuse its copy if neither the results nor the rest of the page, which
+    # depends on the settings, have changed.
+    values = last_results[preferences[0]]
+    can_step_back = getattr(state.current_view, "can_step_back", False)
+    streaming = (settings.NAUTILUS_CLIENT_SIDE_CHARTS
+                 and settings.NAUTILUS_STREAM_ITERATIONS)
+
+    def page_etag():
+        # A page with a used token must not be reused
+        return quote_etag("-".join(str(part) for part in (
+            visualization.values_key(values), current_iteration,
+            total_iterations, can_step_back,
+            settings.NAUTILUS_CLIENT_SIDE_CHARTS,
+            settings.NAUTILUS_STREAM_ITERATIONS,
+            getattr(state, "stream_token", None) if streaming else None)))
+
+    if etag_matches(request, page_etag()):
+        return HttpResponseNotModified()
+
+    # The token is issued only for the pages actually sent
+    chart_stream_url = None
+    if streaming:
+        chart_stream_url = stream_url(request, state)
+    etag = page_etag()
+
+    if can_step_back:
+        context["back_url"] = reverse("method_visual_iteration_back")
+
+    # Run the next iteration of each point while the DM chooses
+    if settings.NAUTILUS_SPECULATIVE_ITERATIONS:
+        try:
+            speculation.speculate(request.session.session_key,
+                                  state.current_view, jobs.iterate)
+        except Exception:
+            # Only an optimization, the page is shown regardless
+            logger.exception("Speculating the iterations of session %s "
+                             "failed", request.session.session_key)
+
+    if settings.NAUTILUS_CLIENT_SIDE_CHARTS:
+        # The browser fetches and draws the results
+        context["div_id"] = visualization.bars_div_id
+        context["chart_data_url"] = reverse("method_visual_iteration_data")
+        if chart_stream_url is not None:
+            context["chart_stream_url"] = chart_stream_url
     else:
-        # Don't iterate, but show last iteration's results
-        html_div, div_id = bars_graph(last_results[preferences[0]])
+        html_div, div_id, _ = visualization.render_cache.bars_graph(
+            values, session_key=request.session.session_key)
         context["visualization"] = html_div
         context["div_id"] = div_id
 
-    return render(request, template, context)
+    response = render(request, template, context)
+    response["ETag"] = etag
+    return response
+
+
+def method_visual_iteration_back(request):
+    """Steps back to the previous iteration, showing its points again without
+    optimizing anything. Redirects to 'method_visual_iteration'.
+
+    :param request: Contains GET and POST requests encoded in a dict
+    :returns: A Http response redirecting to the iteration
+    :rtype: HttpResponse
+
+    """
+    state = sf.load_state(request)
+    if state.current_view is None:
+        # No method has been chosen in this session
+        return redirect(reverse("index"))
+
+    if (request.method == "POST" and state.pending_job is None
+            and getattr(state.current_view, "can_step_back", False)):
+        state.current_view.step_back()
+        sf.save_state(request, state)
+        if settings.NAUTILUS_SPECULATIVE_ITERATIONS:
+            speculation.cancel(request.session.session_key)
+        visualization.render_cache.invalidate(request.session.session_key)
+
+    return redirect(reverse("method_visual_iteration"))
+
+
+def method_iteration_status(request, job_id):
+    """Reports the status of an iteration running in the background. Polled
+    by the page shown while waiting for the iteration to finish.
+
+    :param request: Contains GET and POST requests encoded in a dict
+    :param job_id: The id of the job running the iteration
+    :returns: A Http response with the status encoded in JSON
+    :rtype: JsonResponse
+
+    """
+    state = sf.load_state(request)
+    return JsonResponse({
+        "job_id": job_id,
+        "status": jobs.job_status(state, job_id),
+        "redirect": reverse("method_visual_iteration"),
+        })
+
+
+def method_visual_iteration_data(request):
+    """Returns the results of the last iteration for the browser to draw them,
+    see visual.js.
+
+    :param request: Contains GET and POST requests encoded in a dict
+    :returns: A Http response with the chart data encoded in JSON
+    :rtype: JsonResponse
+
+    """
+    state = sf.load_state(request)
+    if (state.current_view is None or state.pending_job is not None
+            or state.current_view.last_iteration is None):
+        return JsonResponse({"message": "No results available"}, status=404)
+
+    preferences = state.current_view.preference_requirements
+    values = state.current_view.last_iteration[preferences[0]]
+
+    etag = quote_etag(visualization.values_key(values))
+    if etag_matches(request, etag):
+        return HttpResponseNotModified()
+
+    response = JsonResponse(visualization.bars_graph_data(values))
+    response["ETag"] = etag
+    return response
+
+
+def server_sent_event(event, data):
+    """Formats a server-sent event with data encoded in JSON.
+
+    :rtype: str
+
+    """
+    return "event: {}\ndata: {}\n\n".format(event, json.dumps(data))
+
+
+def method_visual_iteration_stream(request):
+    """Runs the next iteration and streams each generated point to the browser
+    as a server-sent event as soon as it is available, see visual.js. The
+    one-time token issued by the page (see stream_url) is given in the query
+    parameter 'token', and the selected point of the last iteration in
+    'selection', none is needed on the first iteration. Only one iteration
+    of a session is streamed at a time. The last event tells where to
+    continue and the URL streaming the next iteration.
+
+    :param request: Contains GET and POST requests encoded in a dict
+    :returns: A Http response streaming text/event-stream
+    :rtype: StreamingHttpResponse
+
+    """
+    session_key = request.session.session_key
+    if session_key is None:
+        return JsonResponse({"message": "Nothing to iterate"}, status=404)
+    # Not the in-process copy, the state is claimed below
+    version, state = sf.store.load(session_key)
+    if (state.current_view is None
+            or (not state.current_view.is_first_iteration
+                and state.current_view.current_iter == 0)):
+        return JsonResponse({"message": "Nothing to iterate"}, status=404)
+    if state.pending_job is not None:
+        return JsonResponse({"message": "Already iterating"}, status=409)
+    token = getattr(state, "stream_token", None)
+    if token is None or request.GET.get("token") != token:
+        return JsonResponse({"message": "Invalid or used token"}, status=403)
+
+    view = state.current_view
+    preference = (None, None)
+    if not view.is_first_iteration:
+        try:
+            selection = int(request.GET["selection"])
+            preference = list(zip(*view.last_iteration.values()))[selection-1]
+        except (KeyError, ValueError, IndexError) as e:
+            return JsonResponse({"message": str(e)}, status=400)
+
+    # Marked as pending like the jobs, so that the other streams and the
+    # iteration page wait for this one
+    stream_id = uuid.uuid4().hex
+    view_id = getattr(state, "view_id", None)
+    state.pending_job = stream_id
+    state.stream_token = None
+    if sf.store.replace(session_key, version, state) is None:
+        return JsonResponse({"message": "Already iterating"}, status=409)
+
+    def events():
+        try:
+            for point in view.iterate_stream(preference):
+                yield server_sent_event("point", point)
+        finally:
+            # Also if the browser went away, the iteration is finished anyway,
+            # unless another view has been chosen meanwhile
+            _, current = sf.store.load(session_key)
+            saved = (current.pending_job == stream_id
+                     and getattr(current, "view_id", None) == view_id)
+            if saved:
+                current.current_view = view
+                current.pending_job = None
+                current.stream_token = uuid.uuid4().hex
+                sf.store.save(session_key, current)
+                visualization.render_cache.invalidate(session_key)
+
+        redirect_url = None
+        next_url = None
+        if not saved:
+            redirect_url = reverse("method_visual_iteration")
+        elif view.current_iter == 0:
+            redirect_url = reverse("method_results")
+        else:
+            next_url = stream_url(request, current)
+        yield server_sent_event("done", {
+            "redirect": redirect_url,
+            "stream_url": next_url,
+            "current_iteration": view.user_iters - view.current_iter,
+            "total_iterations": view.user_iters,
+            })
+
+    response = StreamingHttpResponse(events(),
+                                     content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Ask proxies such as nginx not to buffer the events
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def metrics(request):
+    """Exports the timings of the hot paths in the Prometheus text format, see
+    instrumentation. Not found unless NAUTILUS_INSTRUMENTATION is enabled.
+
+    :param request: Contains GET and POST requests encoded in a dict
+    :returns: A Http response with the metrics as plain text
+    :rtype: HttpResponse
+
+    """
+    if not instrumentation.enabled:
+        raise Http404("Instrumentation is disabled")
+
+    return HttpResponse(instrumentation.prometheus_text(),
+                        content_type="text/plain; version=0.0.4")
 
 
 def method_results(request):
@@ -244,10 +564,22 @@ def method_results(request):
     :rtype: HttpResponse
 
     """
+    state = sf.load_state(request)
+    if state.current_view is None:
+        # No method has been chosen in this session
+        return redirect(reverse("index"))
+
     # Every method should have their own templates
-    template_dir = "nautilus/" + sf.current_view.template_dir
+    template_dir = "nautilus/" + state.current_view.template_dir
     template = template_dir + "/iterate.html"
-    final_results = sf.current_view.last_iteration
+    final_results = state.current_view.last_iteration
+
+    profile = getattr(state.current_view.problem, "profile", None)
+    if profile is not None:
+        logger.info("Evaluations of session %s:\n%s",
+                    request.session.session_key, profile.report(
+                        [e["expression"] for e in state.current_sympy_exprs]))
+
     context = {}
     context["title"] = "Results"
     context["results"] = final_results
@@ -265,6 +597,7 @@ def analytical_problem_input_objectives(request):
 
     """
     template = "nautilus/analytical_problem_input_objectives.html"
+    state = sf.load_state(request)
     context = {}
     context["title"] = "Objective specification"
 
@@ -274,13 +607,15 @@ def analytical_problem_input_objectives(request):
         if formset.is_valid():
             data = formset.cleaned_data
             try:
-                expressions, symbols, sympy_exprs = parse(data)
-                sf.current_sympy_exprs = sympy_exprs
-                sf.current_expressions = expressions
-                sf.current_symbols = symbols
+                expressions, symbols, sympy_exprs = expression_parser.parse(
+                    data)
+                state.current_sympy_exprs = sympy_exprs
+                state.current_expressions = expressions
+                state.current_symbols = symbols
+                sf.save_state(request, state)
                 return redirect(reverse("analytical_problem_input_variables"))
 
-            except ExpressionException as err:
+            except expression_parser.ExpressionException as err:
                 context["message"] = str(err)
                 template = "nautilus/error.html"
                 return render(request, template, context)
@@ -306,25 +641,27 @@ def analytical_problem_input_variables(request):
 
     """
     template = "nautilus/analytical_problem_input_variables.html"
+    state = sf.load_state(request)
     context = {}
     context["title"] = "Decision variable specification"
 
     if request.method == "POST":
         # handle filled form
-        sf.current_variables = []
-        forms = VariableFormsFactory(sf.current_symbols, request.POST)
+        state.current_variables = []
+        forms = VariableFormsFactory(state.current_symbols, request.POST)
         for f in forms:
             if f.is_valid():
-                sf.current_variables.append(f.cleaned_data)
+                state.current_variables.append(f.cleaned_data)
             else:
                 template = "nautilus/error.html"
                 context["message"] = "Form is invalid"
                 return render(request, template, context)
 
+        sf.save_state(request, state)
         return redirect(reverse("analytical_problem_confirm"))
     else:
         # create empty form
-        forms = VariableFormsFactory(sf.current_symbols)
+        forms = VariableFormsFactory(state.current_symbols)
         context["forms"] = forms
 
     return render(request, template, context)
@@ -340,12 +677,13 @@ def analytical_problem_confirm(request):
 
     """
     template = "nautilus/analytical_problem_confirm.html"
+    state = sf.load_state(request)
     context = {}
     context["title"] = "Confirm analytical problem"
-    l_objs, l_vars = analytical_problem_to_latex(
-        sf.current_sympy_exprs,
-        sf.current_symbols,
-        sf.current_variables)
+    l_objs, l_vars = misc.analytical_problem_to_latex(
+        state.current_sympy_exprs,
+        state.current_symbols,
+        state.current_variables)
     context["latex_objectives"] = l_objs
     context["latex_variables"] = l_vars
 
@@ -355,23 +693,92 @@ def analytical_problem_confirm(request):
 def analytical_problem_optimize(request):
     """Performs all the necessary calls for the underlying stateful_view to be
     properly set up with the problem specicied by the user. Redirects to
-    'method_initialization' when done.
+    'method_initialization' when done. With NAUTILUS_CACHE_SOLVED_PROBLEMS,
+    the problem is solved once and stored (see presolve.solve_custom), and
+    the problems submitted again are iterated over the stored solutions.
 
     :param request: Contains GET and POST requests encoded in a dict
     :returns: A Http response with an html page
     :rtype: HttpResponse
 
     """
+    state = sf.load_state(request)
     # Create the analytical problem
     problem = sf.AnalyticalProblem(
-        sf.current_expressions,
-        sf.current_symbols,
-        sf.current_variables
+        state.current_expressions,
+        state.current_symbols,
+        state.current_variables,
+        profile=settings.NAUTILUS_PROFILE_PROBLEMS,
+        parallel=settings.NAUTILUS_PARALLEL_EVALUATION,
+        fused=settings.NAUTILUS_FUSED_KERNELS,
         )
+    if settings.NAUTILUS_CACHE_SOLVED_PROBLEMS:
+        key = presolve.problem_key(state.current_expressions,
+                                   state.current_symbols,
+                                   state.current_variables)
+        problem = presolve.solve_custom(problem, key)
     # Setup the stateful view
-    sf_view = sf.available_method_views_d[sf.method](
-        sf.method,
-        sf.optimizer,
+    sf_view = sf.available_method_views_d[state.method](
+        state.method,
+        state.optimizer,
         problem)
-    sf.current_view = sf_view
+    state.replace_view(sf_view)
+    sf.save_state(request, state)
     return redirect(reverse("method_initialization"))
+
+
+def analytical_problem_import(request):
+    """Generates a page to upload a batch of analytical problems as a JSON or
+    CSV file (see imports). The problems are parsed and then presolved in the
+    background. Answers the upload with the report of the batch, including
+    the url to poll for its progress.
+
+    :param request: Contains GET and POST requests encoded in a dict
+    :returns: A Http response with an html page, or the report of the batch
+    encoded in JSON
+    :rtype: HttpResponse
+
+    """
+    template = "nautilus/analytical_problem_import.html"
+    context = {}
+    context["title"] = "Problem import"
+
+    if request.method == "POST":
+        form = ProblemImportForm(request.POST, request.FILES)
+        if not form.is_valid():
+            return JsonResponse({"error": "Form is invalid"}, status=400)
+
+        upload = form.cleaned_data["problems"]
+        try:
+            definitions = imports.read_problems(
+                upload.read().decode("utf-8"),
+                imports.file_format(upload.name))
+        except UnicodeDecodeError:
+            return JsonResponse({"error": "The file is not UTF-8"},
+                                status=400)
+        except imports.ProblemImportException as err:
+            return JsonResponse({"error": str(err)}, status=400)
+
+        batch_id = imports.submit_import(definitions)
+        report = imports.batch_status(batch_id)
+        report["status_url"] = reverse("analytical_problem_import_status",
+                                       args=[batch_id])
+        return JsonResponse(report, status=202)
+
+    context["form"] = ProblemImportForm()
+    return render(request, template, context)
+
+
+def analytical_problem_import_status(request, batch_id):
+    """Reports the progress of an imported batch of problems.
+
+    :param request: Contains GET and POST requests encoded in a dict
+    :param batch_id: The id of the batch
+    :returns: A Http response with the report encoded in JSON
+    :rtype: JsonResponse
+
+    """
+    report = imports.batch_status(batch_id)
+    if report is None:
+        return JsonResponse({"error": "Unknown batch"}, status=404)
+    return JsonResponse(report)
@@ -1,10 +1,25 @@
 """Function to create visual and interactive web elements.
 """
-import plotly
+import hashlib
 import re
+import threading
+from collections import OrderedDict
 
+import numpy as np
 
+from . import instrumentation
+
+
+# The id of the element the bar chart is drawn in by visual.js
+bars_div_id = "nautilus-bars"
+
+
+@instrumentation.timed("bars_graph")
 def bars_graph(values, mode="relative"):
+    # Imported here, plotly is not needed when the charts are drawn by the
+    # browser, see bars_graph_data.
+    import plotly
+
     solution_nums = list(range(1, len(values)+1))
     objective_values = list(map(list, zip(*values)))
 
@@ -31,3 +46,130 @@ def bars_graph(values, mode="relative"):
     # html_div = .sub(div_id, "myid", res)
 
     return html_div, div_id
+
+
+@instrumentation.timed("bars_graph_data")
+def bars_graph_data(values, mode="relative", digits=6):
+    """Forms the compact data needed by visual.js to draw the same chart as
+    bars_graph in the browser.
+
+    :param values: A list of solutions, each a list of objective values
+    :param mode: The barmode of the chart
+    :param digits: The number of significant digits kept of each value
+    :returns: The id of the div to draw the chart in, the barmode and the
+    objective values with one row per solution
+    :rtype: Dict
+
+    """
+    fmt = "{:." + str(digits) + "g}"
+    return {
+        "div_id": bars_div_id,
+        "barmode": mode,
+        "values": [[float(fmt.format(v)) for v in row] for row in values],
+    }
+
+
+def values_key(values, mode="relative", decimals=8):
+    """Hashes the values shown in a chart.
+
+    :param values: A list of solutions, each a list of objective values
+    :param mode: The barmode of the chart
+    :param decimals: The values are rounded to this many decimals
+    :returns: A hex digest identifying the chart
+    :rtype: str
+
+    """
+    rounded = np.round(np.asarray(values, dtype=float), decimals)
+    digest = hashlib.sha1(rounded.tobytes())
+    digest.update(str(rounded.shape).encode())
+    digest.update(mode.encode())
+    return digest.hexdigest()
+
+
+class RenderCache():
+    """A bounded LRU cache of the charts rendered by bars_graph, keyed by
+    values_key. The charts rendered for each session are tracked, so that they
+    can be dropped once the session has moved on to a new iteration. A chart
+    shown to several sessions is dropped once none of them shows it anymore.
+
+    """
+    def __init__(self, maxsize=256):
+        """Constr
+
+        :param maxsize: The maximum number of rendered charts kept.
+
+        """
+        self.__maxsize = maxsize
+        self.__entries = OrderedDict()  # key: (html_div, div_id)
+        self.__sessions = OrderedDict()  # session_key: set of keys
+        self.__refs = {}  # key: set of session_keys
+        self.__lock = threading.Lock()
+
+    def bars_graph(self, values, mode="relative", session_key=None):
+        """Same as bars_graph, but the rendered chart is cached.
+
+        :param values: A list of solutions, each a list of objective values
+        :param mode: The barmode of the chart
+        :param session_key: The session the chart is rendered for
+        :returns: The html div, its id and the key of the chart
+        :rtype: Tuple[str, str, str]
+
+        """
+        key = values_key(values, mode)
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                self.__entries.move_to_end(key)
+
+        if entry is None:
+            entry = bars_graph(values, mode)
+
+        with self.__lock:
+            self.__entries[key] = entry
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.__maxsize:
+                self.__refs.pop(self.__entries.popitem(last=False)[0], None)
+            if session_key is not None:
+                self.__sessions.setdefault(session_key, set()).add(key)
+                self.__sessions.move_to_end(session_key)
+                self.__refs.setdefault(key, set()).add(session_key)
+                while len(self.__sessions) > self.__maxsize:
+                    # The charts are left for the LRU to evict
+                    self.__release(*self.__sessions.popitem(last=False))
+
+        return entry[0], entry[1], key
+
+    def __release(self, session_key, keys):
+        """Removes the references of a session to its charts, returning the
+        charts not referenced by any session anymore.
+
+        """
+        unused = []
+        for key in keys:
+            sessions = self.__refs.get(key)
+            if sessions is None:
+                continue
+            sessions.discard(session_key)
+            if not sessions:
+                del self.__refs[key]
+                unused.append(key)
+        return unused
+
+    def invalidate(self, session_key):
+        """Drops the charts rendered for a session, unless they are also
+        shown to other sessions.
+
+        :param session_key: The key of the session
+
+        """
+        with self.__lock:
+            for key in self.__release(
+                    session_key, self.__sessions.pop(session_key, ())):
+                self.__entries.pop(key, None)
+
+    def __len__(self):
+        return len(self.__entries)
+
+
+# The cache shared by the views in this process
+render_cache = RenderCache()
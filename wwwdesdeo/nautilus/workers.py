@@ -0,0 +1,28 @@
+"""The set up of the worker processes of the background pools, see jobs,
+speculation and imports.
+
+"""
+import os
+
+import django
+
+
+# Whether this process is a worker process of one of the pools
+in_worker = False
+
+
+def init_worker(settings_module, niceness=0):
+    """Sets up a worker process. It is marked as such, see parallel, and
+    Django is set up, needed when the workers are spawned instead of forked.
+
+    :param settings_module: The DJANGO_SETTINGS_MODULE of the parent process
+    :param niceness: How much the priority of the worker is lowered, see
+    os.nice
+
+    """
+    global in_worker
+    in_worker = True
+    if niceness and hasattr(os, "nice"):
+        os.nice(niceness)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", settings_module)
+    django.setup()
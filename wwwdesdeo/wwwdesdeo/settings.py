@@ -48,6 +48,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'nautilus.instrumentation.InstrumentationMiddleware',
 ]
 
 ROOT_URLCONF = 'wwwdesdeo.urls'
@@ -125,3 +126,94 @@ STATIC_URL = '/static/'
 STATICFILE_DIRS = [
     os.path.join(BASE_DIR, "staticfiles"),
 ]
+
+# NAUTILUS
+# Objective expressions compiled when the application starts.
+NAUTILUS_WARM_EXPRESSIONS = []
+
+# The number of worker processes running the iterations in the background. If
+# 0, the iterations are run within the requests.
+NAUTILUS_ITERATION_WORKERS = 2
+
+# Where the presolved built-in problems are stored (see the presolve
+# management command) and whether to presolve them when the application
+# starts.
+NAUTILUS_PRESOLVED_DIR = os.path.join(BASE_DIR, "presolved")
+NAUTILUS_PRESOLVE_AT_STARTUP = False
+
+# The number of points of the Pareto front sampled per objective when a
+# problem is presolved (see presolve.presolve). One optimization is run per
+# point.
+NAUTILUS_PRESOLVE_SAMPLES = 50
+
+# Whether the custom analytical problems are solved once and stored, keyed by
+# their definition, so that the problems submitted again are not optimized
+# again, and where they are stored.
+NAUTILUS_CACHE_SOLVED_PROBLEMS = False
+NAUTILUS_SOLVED_DIR = os.path.join(BASE_DIR, "solved")
+
+# The number of worker processes presolving the imported batches of problems
+# in the background (see the analytical_problem_import view), and the size of
+# the largest batch. If 0, the problems are presolved within the request.
+# The views use the presolved problems only if NAUTILUS_CACHE_SOLVED_PROBLEMS
+# is set.
+NAUTILUS_IMPORT_WORKERS = 2
+NAUTILUS_IMPORT_MAX_PROBLEMS = 1000
+
+# Whether the session states are also checkpointed on disk, to resume the
+# sessions missing from the database (see nautilus/checkpoints.py), where,
+# how often in seconds per session at most and how many checkpoints of each
+# session are kept. Old sessions are removed with the prune_checkpoints
+# management command.
+NAUTILUS_CHECKPOINTS = False
+NAUTILUS_CHECKPOINT_DIR = os.path.join(BASE_DIR, "checkpoints")
+NAUTILUS_CHECKPOINT_INTERVAL = 30
+NAUTILUS_CHECKPOINT_RETAIN = 3
+
+# Whether the charts are drawn by the browser from JSON data instead of being
+# rendered with plotly on the server.
+NAUTILUS_CLIENT_SIDE_CHARTS = True
+
+# Whether the browser runs the iterations by streaming the generated points
+# as server-sent events (see the method_visual_iteration_stream view) instead
+# of submitting them as background jobs. Requires the client-side charts. A
+# streamed iteration occupies a server thread until it is done.
+NAUTILUS_STREAM_ITERATIONS = False
+
+# Whether to run the next iteration of each shown point in the background
+# while the decision maker chooses, so that the chosen one is ready when
+# submitted (see nautilus/speculation.py). The number of worker processes
+# running the speculations, how much their priority is lowered (see os.nice)
+# and the number of sessions speculated for at once.
+NAUTILUS_SPECULATIVE_ITERATIONS = False
+NAUTILUS_SPECULATION_WORKERS = 1
+NAUTILUS_SPECULATION_NICENESS = 10
+NAUTILUS_SPECULATION_SESSIONS = 4
+
+# Whether to time the iterations, evaluations, charts and views (see
+# nautilus/instrumentation.py and the metrics view) and how many of the
+# latest samples to keep.
+NAUTILUS_INSTRUMENTATION = False
+NAUTILUS_INSTRUMENTATION_BUFFER = 4096
+
+# Whether to profile the evaluations of the custom problems. The profile is
+# logged (logger nautilus.views) when the results are shown.
+NAUTILUS_PROFILE_PROBLEMS = False
+
+# Whether to evaluate the populations of the custom problems in parallel (see
+# nautilus/parallel.py), the smallest population evaluated so and the number
+# of worker processes shared by all the problems.
+NAUTILUS_PARALLEL_EVALUATION = False
+NAUTILUS_PARALLEL_MIN_POPULATION = 1024
+NAUTILUS_EVALUATION_WORKERS = os.cpu_count() or 1
+
+# Whether to compile the objectives of each custom problem into a single
+# kernel computing the shared subexpressions only once. With
+# NAUTILUS_PARALLEL_EVALUATION, the populations evaluated in parallel are
+# evaluated objective by objective regardless.
+NAUTILUS_FUSED_KERNELS = False
+
+# Optimizers offered in addition to the built-in ones (see
+# nautilus.models.available_optimizers_d), by name: import path like
+# 'package.module:Class'. The classes must be desdeo OptimizationMethods.
+NAUTILUS_OPTIMIZERS = {}